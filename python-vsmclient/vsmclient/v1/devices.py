@@ -136,4 +136,13 @@ class DeviceManager(base.ManagerWithFind):
         query_string = "?%s" % urllib.urlencode(qparams) if qparams else ""
         resp, body = self.api.client.get("/devices/get_smart_info%s" % (query_string))
         smart_info = body.get("smart_info")
-        return smart_info
\ No newline at end of file
+        return smart_info
+
+    def get_smart_history(self, device_id, device_path):
+        """
+        Get the samples of the key smart attributes of a device
+        """
+        qparams = {'device_id': device_id, 'device_path': device_path}
+        resp, body = self.api.client.get("/devices/get_smart_history?%s" %
+                                         urllib.urlencode(qparams))
+        return body.get("smart_history")
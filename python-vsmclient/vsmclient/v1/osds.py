@@ -149,6 +149,13 @@ class OsdManager(base.ManagerWithFind):
         url = "/osds/summary"
         return self._get(url, 'osd-summary')
 
+    def capacity_summary(self):
+        """
+        Utilization of the osds.
+        """
+        url = "/osds/capacity_summary"
+        return self._get(url, 'osd_capacity-summary')
+
     def _action(self, action, osd, info=None, **kwargs):
         """
         Perform a osd "action."
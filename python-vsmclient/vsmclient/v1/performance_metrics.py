@@ -82,5 +82,23 @@ class PerformanceMetricsManager(base.ManagerWithFind):
         resp, body = self.api.client.get("/performance_metrics/get_metrics%s" % (query_string))
         return body
 
+    def get_latencies(self, search_opts=None):
+        """
+        Get the read, write and read/write latency by timestamp.
+        """
+        if search_opts is None:
+            search_opts = {}
+
+        qparams = {}
+
+        for opt, val in search_opts.iteritems():
+            if val:
+                qparams[opt] = val
+
+        query_string = "?%s" % urllib.urlencode(qparams) if qparams else ""
+
+        resp, body = self.api.client.get("/performance_metrics/get_latencies%s" % (query_string))
+        return body
+
 
 
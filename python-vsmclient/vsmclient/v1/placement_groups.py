@@ -96,6 +96,13 @@ class PlacementGroupsManager(base.ManagerWithFind):
         url = "/placement_groups/summary"
         return self._get(url, 'placement_group-summary')
 
+    def state_summary(self):
+        """
+        Number of placement groups per state.
+        """
+        url = "/placement_groups/state_summary"
+        return self._get(url, 'pg_state-summary')
+
     def _action(self, action, placement_group, info=None, **kwargs):
         """
         Perform a placement_group "action."
@@ -366,45 +366,19 @@ def get_performance_Latency(request):
     data = json.loads(request.body)
     start_time = data["timestamp"] and int(data["timestamp"]) or int(time.time())-60
     end_time = None
-    latency_r_opts = {
-         "metrics_name": "op_r_latency",
+    latency_opts = {
          "timestamp_start": start_time,
          "timestamp_end": end_time,
-         "correct_cnt": None,
-    }
-
-    latency_w_opts = {
-         "metrics_name": "op_w_latency",
-         "timestamp_start": start_time,
-         "timestamp_end": end_time,
-         "correct_cnt": None,
     }
 
-    latency_rw_opts = {
-         "metrics_name": "op_rw_latency",
-         "timestamp_start": start_time,
-         "timestamp_end": end_time,
-         "correct_cnt": None,
-    }
+    latency_data = vsmapi.get_latencies(request,latency_opts)["metrics"]
 
-    latency_r_data = vsmapi.get_metrics(request,latency_r_opts)["metrics"]
-    latency_w_data = vsmapi.get_metrics(request,latency_w_opts)["metrics"]
-    latency_rw_data = vsmapi.get_metrics(request,latency_rw_opts)["metrics"]
-
-
-    items = {}
-    for r_metric in latency_r_data:
-        items[r_metric["timestamp"]] = {"timestamp": r_metric["timestamp"], "r_value":  r_metric["metrics_value"] and round( r_metric["metrics_value"],2) or 0, "w_value": 0, "rw_value": 0}
-    for w_metric in latency_w_data:
-        if items.has_key(w_metric["timestamp"]):
-            items[w_metric["timestamp"]]["w_value"] = w_metric["metrics_value"] and  round(w_metric["metrics_value"],2) or 0
-    for rw_metric in latency_rw_data:
-        if items.has_key(rw_metric["timestamp"]):
-            items[rw_metric["timestamp"]]["rw_value"] = rw_metric["metrics_value"] and round(rw_metric["metrics_value"],2) or 0
-
-    keys = items.keys()
-    keys.sort()
-    metric_list = [items[key] for key in keys]
+    metric_list = []
+    for metric in latency_data:
+        metric_list.append({"timestamp": metric["timestamp"],
+                            "r_value": metric["r_value"] and round(metric["r_value"],2) or 0,
+                            "w_value": metric["w_value"] and round(metric["w_value"],2) or 0,
+                            "rw_value": metric["rw_value"] and round(metric["rw_value"],2) or 0})
     ops_data_dict = {"metrics": metric_list}
     ops_data = json.dumps(ops_data_dict)
     return ops_data
@@ -78,5 +78,6 @@ setuptools.setup(
              'bin/vsm-agent',
              'bin/vsm-physical',
              'bin/vsm-rootwrap',
+             'bin/vsm-rootwrap-daemon',
              'bin/vsm-manage'],
     py_modules=[])
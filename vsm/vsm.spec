@@ -261,6 +261,7 @@ install -p -D -m 755 bin/vsm-physical %{buildroot}%{_bindir}/vsm-physical
 install -p -D -m 755 bin/vsm-conductor %{buildroot}%{_bindir}/vsm-conductor
 install -p -D -m 755 bin/vsm-scheduler %{buildroot}%{_bindir}/vsm-scheduler
 install -p -D -m 755 bin/vsm-rootwrap %{buildroot}%{_bindir}/vsm-rootwrap
+install -p -D -m 755 bin/vsm-rootwrap-daemon %{buildroot}%{_bindir}/vsm-rootwrap-daemon
 install -p -D -m 755 bin/key %{buildroot}%{_bindir}/key
 install -p -D -m 755 bin/auto_key_gen %{buildroot}%{_bindir}/auto_key_gen
 install -p -D -m 755 bin/vsm-assist %{buildroot}%{_bindir}/vsm-assist
@@ -425,6 +426,7 @@ exit 0
 
 %if 0%{?suse_version}
 %attr(-, root, root) %{_bindir}/vsm-rootwrap
+%attr(-, root, root) %{_bindir}/vsm-rootwrap-daemon
 %attr(-, root, root) %{_bindir}/vsm-physical
 %attr(-, root, root) %{_bindir}/vsm-agent
 %attr(-, root, root) %{_bindir}/vsm-api
@@ -458,6 +460,7 @@ exit 0
 %else
 %dir %{_bindir}
 %config(noreplace) %attr(-, root, vsm) %{_bindir}/vsm-rootwrap
+%config(noreplace) %attr(-, root, vsm) %{_bindir}/vsm-rootwrap-daemon
 %config(noreplace) %attr(-, root, vsm) %{_bindir}/vsm-physical
 %config(noreplace) %attr(-, root, vsm) %{_bindir}/vsm-agent
 %config(noreplace) %attr(-, root, vsm) %{_bindir}/vsm-api
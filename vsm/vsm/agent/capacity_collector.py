@@ -0,0 +1,187 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Collect the capacity of every osd from `ceph osd df`.
+
+`osd df` is answered by the monitor from the osd stats it already keeps,
+much cheaper than `pg dump osds`. The nodes are turned into columns (one
+list per field) so utilization, variance and the near-full / full flags
+are computed for every osd in one pass over the columns.
+
+A device row is only pushed when its used or total capacity moved by
+more than device_capacity_delta_percent of its size since the last push.
+
+Usage from a periodic task:
+
+    values_list = collector.refresh(device_ids)
+    push(values_list)
+    collector.commit()
+"""
+
+import math
+import time
+
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+FLAGS.import_opt('state_full_resync_interval', 'vsm.agent.delta_tracker')
+
+capacity_collector_opts = [
+    cfg.FloatOpt('device_capacity_delta_percent',
+                 default=1.0,
+                 help='A device capacity is written to the DB when its '
+                      'used or total capacity moved by more than this '
+                      'percent of its size.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(capacity_collector_opts)
+
+_FIELDS = ('name', 'kb', 'kb_used', 'kb_avail')
+
+
+def to_columns(nodes):
+    """[{'name': 'osd.0', 'kb': 1, ...}, ...] -> {'name': [...], 'kb': [...]}"""
+    columns = dict((field, []) for field in _FIELDS)
+    for node in nodes:
+        for field in _FIELDS:
+            columns[field].append(node.get(field) or 0)
+    return columns
+
+
+class CapacityCollector(object):
+    """Capacity of the osds, with the rows last pushed to the DB.
+
+    :param fetch: callable returning the parsed json of `ceph osd df`.
+    :param delta_percent: minimum move, in percent of the device size,
+                          for a device row to be pushed again.
+    """
+
+    def __init__(self, fetch, delta_percent=None, resync_interval=None):
+        self._fetch = fetch
+        if delta_percent is None:
+            delta_percent = CONF.device_capacity_delta_percent
+        self._delta = delta_percent / 100.0
+        if resync_interval is None:
+            resync_interval = FLAGS.state_full_resync_interval
+        self._resync_interval = resync_interval
+        self._pushed = {}
+        self._pending = None
+        self._last_resync = 0
+        self._summary = None
+
+    def _resync_due(self):
+        return time.time() - self._last_resync >= self._resync_interval
+
+    def _moved(self, device_id, kb, kb_used):
+        last = self._pushed.get(device_id)
+        if last is None:
+            return True
+        last_kb, last_used = last
+        threshold = max(kb, last_kb) * self._delta
+        return abs(kb - last_kb) > threshold or \
+            abs(kb_used - last_used) > threshold
+
+    def refresh(self, device_ids, near_full_ratio=None, full_ratio=None):
+        """Read `osd df` and return the device rows to push.
+
+        :param device_ids: dict osd name -> device id of the osds in DB.
+        :param near_full_ratio, full_ratio: utilization (0-1) above which
+                                            an osd is near full / full.
+        :returns: a list of dicts with id, total_capacity_kb,
+                  used_capacity_kb and avail_capacity_kb, or None if
+                  `osd df` gave nothing.
+        """
+        df = self._fetch()
+        if not df or not df.get('nodes'):
+            return None
+        columns = to_columns(df['nodes'])
+        names = columns['name']
+        kbs = columns['kb']
+        used = columns['kb_used']
+        avail = columns['kb_avail']
+
+        utilization = [u * 1.0 / k if k else 0.0 for u, k in zip(used, kbs)]
+        total_kb = sum(kbs)
+        average = sum(used) * 1.0 / total_kb if total_kb else 0.0
+        variance = [u / average if average else 0.0 for u in utilization]
+        near_full = [name for name, u in zip(names, utilization)
+                     if near_full_ratio and u >= near_full_ratio]
+        full = [name for name, u in zip(names, utilization)
+                if full_ratio and u >= full_ratio]
+
+        self._summary = {
+            'num_osds': len(names),
+            'total_kb': total_kb,
+            'used_kb': sum(used),
+            'avail_kb': sum(avail),
+            'average_utilization': round(average * 100, 2),
+            'min_var': round(min(variance), 2) if variance else 0,
+            'max_var': round(max(variance), 2) if variance else 0,
+            'stddev': round(math.sqrt(
+                sum((u - average) ** 2 for u in utilization) /
+                len(utilization)) * 100, 2),
+            'near_full': near_full,
+            'full': full,
+        }
+        if near_full:
+            LOG.warn('osds near full: %s' % ', '.join(near_full))
+
+        full_push = self._resync_due()
+        values_list = []
+        pushed = {}
+        for name, kb, kb_used, kb_avail in zip(names, kbs, used, avail):
+            device_id = device_ids.get(name)
+            if device_id is None:
+                continue
+            if full_push or self._moved(device_id, kb, kb_used):
+                values_list.append({'id': device_id,
+                                    'total_capacity_kb': kb,
+                                    'used_capacity_kb': kb_used,
+                                    'avail_capacity_kb': kb_avail})
+                pushed[device_id] = (kb, kb_used)
+        self._pending = (pushed, full_push)
+        LOG.debug('%s of %s device capacities moved.' %
+                  (len(values_list), len(names)))
+        return values_list
+
+    def commit(self):
+        """Record the rows returned by the last refresh() as pushed."""
+        if self._pending is None:
+            return
+        pushed, full_push = self._pending
+        if full_push:
+            self._pushed = pushed
+            self._last_resync = time.time()
+        else:
+            self._pushed.update(pushed)
+        self._pending = None
+
+    def reset(self):
+        """Forget the pushed rows, the next refresh() returns all of them."""
+        self._pushed = {}
+        self._pending = None
+        self._last_resync = 0
+
+    def summary(self):
+        """Cluster wide capacity figures of the last refresh()."""
+        return self._summary
@@ -0,0 +1,340 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Command backends used by the CephDriver to talk to the cluster.
+
+The default subprocess backend runs every command as
+`sudo vsm-rootwrap ceph ...`. The rados backend keeps one long-lived
+librados connection per agent and sends the read-only queries the agent
+polls for as monitor commands through it, falling back to the subprocess
+path for everything else.
+"""
+
+import errno
+import json
+import os
+import threading
+import time
+
+from eventlet import tpool
+from oslo.config import cfg
+
+from vsm import exception
+from vsm import flags
+from vsm import utils
+from vsm.openstack.common import importutils
+from vsm.openstack.common.gettextutils import _
+from vsm.openstack.common import log as logging
+
+rados = importutils.try_import('rados')
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+ceph_backend_opts = [
+    cfg.StrOpt('ceph_command_backend',
+               default='vsm.agent.ceph_backend.RadosBackend',
+               help='Backend used by the agent to run ceph commands. '
+                    'include: vsm.agent.ceph_backend.SubprocessBackend, '
+                    'vsm.agent.ceph_backend.RadosBackend'),
+    cfg.StrOpt('ceph_client_name',
+               default='client.admin',
+               help='Ceph client name used by the rados backend.'),
+    cfg.IntOpt('ceph_mon_command_timeout',
+               default=30,
+               help='Timeout (secs) of one monitor command sent through '
+                    'the rados backend.'),
+    cfg.IntOpt('ceph_rados_retry_interval',
+               default=60,
+               help='Interval (secs) to wait before reconnecting the rados '
+                    'backend after a connection failure.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(ceph_backend_opts)
+
+# Read-only commands which can be sent as monitor commands.
+# Maps the command prefix to its positional arguments as (name, type).
+_MON_COMMANDS = {
+    'status': [],
+    'health': [('detail', str)],
+    'report': [],
+    'quorum_status': [],
+    'mon_status': [],
+    'df': [('detail', str)],
+    'osd dump': [('epoch', int)],
+    'osd ls': [],
+    'osd tree': [('epoch', int)],
+    'osd df': [('output_method', str)],
+    'osd lspools': [],
+    'osd stat': [],
+    'osd pool stats': [('name', str)],
+    'osd crush dump': [],
+    'osd crush rule dump': [('name', str)],
+    'pg dump': [('dumpcontents', list)],
+    'pg stat': [],
+    'mds dump': [('epoch', int)],
+}
+
+
+def load_ceph_backend(ceph_backend=None):
+    """Load the ceph command backend.
+
+    :param ceph_backend: a backend class name to override the config opt.
+    :returns: a CephCommandBackend instance.
+    """
+    if not ceph_backend:
+        ceph_backend = CONF.ceph_command_backend
+
+    try:
+        # If just write ceph_backend.RadosBackend
+        backend = importutils.import_object_ns('vsm.agent', ceph_backend)
+    except ImportError:
+        try:
+            backend = importutils.import_object(ceph_backend)
+        except ImportError:
+            LOG.exception(_("Unable to load the ceph command backend %s, "
+                            "use the subprocess backend.") % ceph_backend)
+            backend = SubprocessBackend()
+    return utils.check_isinstance(backend, CephCommandBackend)
+
+
+def parse_mon_command(cmd):
+    """Translate a ceph CLI argv into a monitor command.
+
+    :param cmd: argv such as ['ceph', 'osd', 'dump', '-f', 'json-pretty'].
+    :returns: a (command dict, timeout) tuple, or (None, None) if the
+              command is not a known read-only query.
+    """
+    args = [str(arg) for arg in cmd]
+    if not args or args[0] != 'ceph':
+        return None, None
+
+    fmt = None
+    timeout = None
+    words = []
+    args = args[1:]
+    while args:
+        arg = args.pop(0)
+        if arg in ('-f', '--format'):
+            if not args:
+                return None, None
+            fmt = args.pop(0)
+        elif arg == '--connect-timeout':
+            if not args:
+                return None, None
+            timeout = int(args.pop(0))
+        elif arg.startswith('-'):
+            # Options like --keyring or -c need the CLI.
+            return None, None
+        else:
+            words.append(arg)
+
+    prefix = None
+    for i in range(len(words), 0, -1):
+        if ' '.join(words[:i]) in _MON_COMMANDS:
+            prefix = ' '.join(words[:i])
+            break
+    if prefix is None:
+        return None, None
+
+    params = _MON_COMMANDS[prefix]
+    values = words[len(prefix.split()):]
+    if len(values) > len(params):
+        return None, None
+
+    command = {'prefix': prefix}
+    for (name, typ), value in zip(params, values):
+        try:
+            if typ is list:
+                command[name] = [value]
+            else:
+                command[name] = typ(value)
+        except ValueError:
+            return None, None
+    if fmt:
+        # json-pretty is only a cosmetic difference for the callers.
+        command['format'] = fmt.startswith('json') and 'json' or fmt
+    return command, timeout
+
+
+class CephCommandBackend(object):
+    """Basic class for ceph command backends.
+
+    A backend behaves like utils.execute() for ceph commands: it returns
+    an (out, err) tuple and raises exception.ProcessExecutionError when
+    the command fails.
+    """
+
+    def execute(self, *cmd, **kwargs):
+        raise NotImplementedError()
+
+    def execute_json(self, *cmd, **kwargs):
+        (out, _err) = self.execute(*cmd, **kwargs)
+        if out:
+            return json.loads(out)
+        return None
+
+    def close(self):
+        pass
+
+
+class SubprocessBackend(CephCommandBackend):
+    """Run every command through sudo and vsm-rootwrap."""
+
+    def execute(self, *cmd, **kwargs):
+        kwargs.setdefault('run_as_root', True)
+        return utils.execute(*cmd, **kwargs)
+
+
+class RadosBackend(SubprocessBackend):
+    """Send read-only queries through one librados connection.
+
+    The connection is opened lazily and shared by all callers of this
+    backend. Commands which can not be translated into a monitor command,
+    or any command issued while the cluster can not be reached through
+    librados, run through the subprocess backend instead.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._retry_at = 0
+
+    def _connect(self):
+        conf = {}
+        if os.access(FLAGS.keyring_admin, os.R_OK):
+            conf['keyring'] = FLAGS.keyring_admin
+        client = rados.Rados(conffile=FLAGS.ceph_conf,
+                             name=FLAGS.ceph_client_name,
+                             conf=conf)
+        tpool.execute(client.connect,
+                      timeout=FLAGS.ceph_mon_command_timeout)
+        LOG.info('Connected to ceph cluster through librados.')
+        return client
+
+    def _get_client(self):
+        if rados is None:
+            return None
+
+        with self._lock:
+            if self._client is None and time.time() >= self._retry_at:
+                try:
+                    self._client = self._connect()
+                except Exception as e:
+                    LOG.warn('Can not connect to ceph through librados: %s, '
+                             'use the subprocess backend.' % e)
+                    self._retry_at = \
+                        time.time() + FLAGS.ceph_rados_retry_interval
+            return self._client
+
+    def _reset_client(self, client):
+        with self._lock:
+            if self._client is client:
+                self._client = None
+                self._retry_at = \
+                    time.time() + FLAGS.ceph_rados_retry_interval
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+
+    def execute(self, *cmd, **kwargs):
+        command, timeout = parse_mon_command(cmd)
+        client = command and self._get_client()
+        if not client:
+            return super(RadosBackend, self).execute(*cmd, **kwargs)
+
+        if timeout is None:
+            timeout = FLAGS.ceph_mon_command_timeout
+        cmd_str = ' '.join([str(c) for c in cmd])
+        LOG.debug('Running mon command %s' % command)
+        try:
+            ret, out, err = tpool.execute(client.mon_command,
+                                          json.dumps(command),
+                                          '',
+                                          timeout=timeout)
+        except rados.TimedOut as e:
+            # Keep the message of the ceph CLI, callers rely on it.
+            raise exception.ProcessExecutionError(
+                exit_code=1,
+                stdout='',
+                stderr='InterruptedOrTimeoutError: %s' % e,
+                cmd=cmd_str)
+        except rados.Error as e:
+            LOG.warn('Mon command %s failed: %s, reconnect later.' %
+                     (command, e))
+            self._reset_client(client)
+            return super(RadosBackend, self).execute(*cmd, **kwargs)
+
+        if ret == -errno.ETIMEDOUT:
+            raise exception.ProcessExecutionError(
+                exit_code=1,
+                stdout=out,
+                stderr='InterruptedOrTimeoutError: %s' % err,
+                cmd=cmd_str)
+        if ret != 0:
+            raise exception.ProcessExecutionError(exit_code=abs(ret),
+                                                  stdout=out,
+                                                  stderr=err,
+                                                  cmd=cmd_str)
+        return (out, err)
+
+    def close(self):
+        with self._lock:
+            client = self._client
+            self._client = None
+        if client:
+            try:
+                client.shutdown()
+            except Exception:
+                pass
+
+
+class FakeBackend(CephCommandBackend):
+    """In-process backend returning canned results.
+
+    Responses are registered by monitor command prefix, e.g.
+    backend.set_response('osd dump', {'epoch': 1, 'osds': []}).
+    Every command issued is kept in self.calls.
+    """
+
+    def __init__(self, responses=None):
+        self.calls = []
+        self._responses = dict(responses or {})
+
+    def set_response(self, prefix, value):
+        self._responses[prefix] = value
+
+    def execute(self, *cmd, **kwargs):
+        self.calls.append(list(cmd))
+        command, _timeout = parse_mon_command(cmd)
+        prefix = command and command['prefix'] or \
+            ' '.join([str(c) for c in cmd])
+        if prefix not in self._responses:
+            raise exception.ProcessExecutionError(
+                exit_code=errno.EINVAL,
+                stdout='',
+                stderr='no fake response for %s' % prefix,
+                cmd=' '.join([str(c) for c in cmd]))
+        value = self._responses[prefix]
+        if isinstance(value, Exception):
+            raise value
+        if not isinstance(value, basestring):
+            value = json.dumps(value)
+        return (value, '')
@@ -0,0 +1,149 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Shared, short-lived view of the ceph cluster maps.
+
+The periodic tasks of the agent read overlapping data (osd dump, ceph
+status, pg dump ...). ClusterSnapshot fetches each of them once per TTL
+or osdmap epoch and serves every task from the same parsed copy.
+Concurrent requests for the same map wait for the fetch in flight
+instead of issuing their own command.
+
+The returned objects are shared between callers, do not modify them.
+"""
+
+import threading
+import time
+
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+cluster_snapshot_opts = [
+    cfg.IntOpt('cluster_snapshot_ttl',
+               default=20,
+               help='Seconds a ceph map fetched by the agent is shared '
+                    'between periodic tasks.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cluster_snapshot_opts)
+
+_MISSING = object()
+
+
+class _Entry(object):
+    def __init__(self):
+        self.value = _MISSING
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+
+
+class ClusterSnapshot(object):
+    """Cache of ceph maps keyed by ceph command, e.g. 'osd dump'.
+
+    :param fetch: callable taking a ceph argv and returning the parsed
+                  json output, e.g. CephDriver._run_cmd_to_json.
+    :param ttl: seconds a fetched map stays valid.
+    """
+
+    def __init__(self, fetch, ttl=None):
+        self._fetch = fetch
+        self._ttl = ttl if ttl is not None else CONF.cluster_snapshot_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0,
+                       'misses': 0,
+                       'coalesced': 0,
+                       'invalidations': 0}
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _valid(self, entry):
+        return entry.value is not _MISSING and \
+            time.time() - entry.fetched_at < self._ttl
+
+    def get(self, key):
+        """Return the parsed output of `ceph <key>`."""
+        entry = self._entry(key)
+        if self._valid(entry):
+            self._count('hits')
+            return entry.value
+
+        with entry.lock:
+            # Another task may have fetched it while we waited.
+            if self._valid(entry):
+                self._count('coalesced')
+                return entry.value
+            self._count('misses')
+            value = self._fetch(['ceph'] + key.split())
+            self.put(key, value)
+            return value
+
+    def put(self, key, value):
+        """Store a map fetched by the caller itself."""
+        if value is None:
+            # Empty output, let the next caller try again.
+            return
+        entry = self._entry(key)
+        entry.value = value
+        entry.fetched_at = time.time()
+        if key == 'status' and value:
+            self._check_osdmap_epoch(value)
+
+    def invalidate(self, key=None):
+        """Drop one map, or every map if key is None."""
+        with self._lock:
+            keys = [key] if key else self._entries.keys()
+            for k in keys:
+                entry = self._entries.get(k)
+                if entry and entry.value is not _MISSING:
+                    entry.value = _MISSING
+                    self._stats['invalidations'] += 1
+
+    def _check_osdmap_epoch(self, status):
+        """Drop the cached osd dump when ceph status saw a newer osdmap."""
+        osdmap = status.get('osdmap') or {}
+        epoch = (osdmap.get('osdmap') or osdmap).get('epoch')
+        entry = self._entries.get('osd dump')
+        if entry is None or entry.value is _MISSING or not entry.value:
+            return
+        if epoch is not None and entry.value.get('epoch') != epoch:
+            LOG.debug('osdmap epoch moved from %s to %s, drop osd dump.' %
+                      (entry.value.get('epoch'), epoch))
+            self.invalidate('osd dump')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['maps'] = len([e for e in self._entries.values()
+                                 if e.value is not _MISSING])
+        return stats
@@ -39,7 +39,42 @@ class CrushMap():
         self._rules = crush_map['rules']
         self._types = crush_map['types']
         self._buckets = crush_map['buckets']
-
+        self._build_index()
+
+    def _build_index(self):
+        """Index the items of the map by id, name and type.
+
+        Every lookup goes through these dicts, and the osds under a bucket
+        are computed once per bucket (see _subtree_osds).
+        """
+        self._type_by_name = {}
+        for typ in self._types:
+            self._type_by_name.setdefault(typ['name'], typ)
+        self._osd_by_id = {}
+        self._osd_by_name = {}
+        for osd in self._devices:
+            self._osd_by_id.setdefault(osd['id'], osd)
+            self._osd_by_name.setdefault(osd['name'], osd)
+        self._rule_by_id = {}
+        self._rule_by_name = {}
+        for rule in self._rules:
+            self._rule_by_id.setdefault(rule['rule_id'], rule)
+            self._rule_by_name.setdefault(rule['rule_name'], rule)
+
+        self._bucket_by_id = {}
+        self._bucket_by_name = {}
+        self._buckets_by_type_id = {}
+        # child id -> [(parent bucket id, weight of the child in it)]
+        self._parents = {}
+        for bucket in self._buckets:
+            self._bucket_by_id.setdefault(bucket['id'], bucket)
+            self._bucket_by_name.setdefault(bucket['name'], bucket)
+            self._buckets_by_type_id.setdefault(bucket['type_id'], []).\
+                append(bucket)
+            for item in bucket['items']:
+                self._parents.setdefault(item['id'], []).\
+                    append((bucket['id'], item.get('weight')))
+        self._subtree_cache = {}
 
     def get_all_tunables(self):
         return self._tunables
@@ -51,45 +86,50 @@ class CrushMap():
         return self._types
 
     def get_type_by_name(self, typename):
-        return filter(lambda item: typename == item['name'], self._types)[0]
+        return self._type_by_name.get(typename)
 
     def get_all_buckets(self):
         return self._buckets
 
     def get_weight_by_osd_name(self,osd_name):
-        osds = self._devices
-        osd_id = [osd['id'] for osd in osds if osd['name'] == osd_name]
-        buckets = self._buckets
-        for bucket in buckets:
-            for item in bucket['items']:
-                if item['id'] == osd_id:
-                    return item['weight']
+        osd = self._osd_by_name.get(osd_name)
+        parents = osd and self._parents.get(osd['id'])
+        if parents:
+            return parents[0][1]
         return 'no osd:%s'%osd_name
 
-
     def get_bucket_by_id(self, id):
-        return filter(lambda item: id == item['id'], self._buckets)[0]
+        return self._bucket_by_id.get(id)
 
     def get_buckets_by_type(self, typename):
         type = self.get_type_by_name(typename)
         if type:
-            type_id = type['type_id']
-            return filter(lambda item: type_id == item['type_id'], self._buckets)
+            return list(self._buckets_by_type_id.get(type['type_id'], []))
         else:
             return []
 
     def get_buckets_by_name(self, name):
-        for bucket in self._buckets:
-            if name == bucket['name']:
-                return bucket
+        return self._bucket_by_name.get(name)
+
+    def get_parent_ids(self, id):
+        """Ids of the buckets holding the bucket or osd `id`."""
+        return [parent_id for parent_id, _weight in self._parents.get(id, [])]
 
     def get_children_by_type(self, id, type):
         children = []
         bucket = self.get_bucket_by_id(id)
+        if not bucket:
+            return children
 
+        osd_type = self._types and \
+            min(self._types, key=operator.itemgetter('type_id'))['name']
         for item in bucket['items']:
+            if item['id'] >= 0:
+                if type == osd_type and item['id'] in self._osd_by_id:
+                    children.append(self._osd_by_id[item['id']])
+                continue
             child = self.get_bucket_by_id(item['id'])
-            if type == child['type_name']:
+            if child and type == child['type_name']:
                 children.append(child)
 
         return children
@@ -98,20 +138,13 @@ class CrushMap():
         return self._rules
 
     def get_rules_by_name(self, name):
-        for rule in self._rules:
-            if name == rule['rule_name']:
-                return rule
-        return None
+        return self._rule_by_name.get(name)
 
     def get_rules_by_id(self, rule_id):
-        for rule in self._rules:
-            if rule_id == rule['rule_id']:
-                return rule
+        return self._rule_by_id.get(rule_id)
 
     def get_osd_by_id(self, id):
-        osd = filter(lambda item: id == item['id'], self._devices)
-        if osd:
-            return osd[0]
+        return self._osd_by_id.get(id)
 
     def get_all_osds_by_rule(self, name):
         rule = self.get_rules_by_name(name)
@@ -126,26 +159,32 @@ class CrushMap():
     def osd_count_by_rule_id(self,rule_id):
         rule = self.get_rules_by_id(rule_id)
         steps = rule['steps']
-        devices = []
+        count = 0
         for step in steps:
             if step['op'] == 'take':
-                bucket_id = step['item']
-                self.get_all_osds_by_bucket(bucket_id, devices)
-        return len(devices)
+                count += len(self._subtree_osds(step['item']))
+        return count
 
+    def _subtree_osds(self, id):
+        """The osds under bucket `id` (an osd id gives itself), memoized."""
+        osds = self._subtree_cache.get(id)
+        if osds is not None:
+            return osds
 
-    def get_all_osds_by_bucket(self, id, devices):
-        print id
-        if id >=0 :
-            osd = self.get_osd_by_id(id)
-            devices.append(osd)
-        else :
+        if id >= 0:
+            osds = (self.get_osd_by_id(id),)
+        else:
+            osds = []
             bucket = self.get_bucket_by_id(id)
-            if bucket :
-                items = bucket['items']
-                for item in items:
-                    self.get_all_osds_by_bucket(item['id'], devices)
+            if bucket:
+                for item in bucket['items']:
+                    osds.extend(self._subtree_osds(item['id']))
+            osds = tuple(osds)
+        self._subtree_cache[id] = osds
+        return osds
 
+    def get_all_osds_by_bucket(self, id, devices):
+        devices.extend(self._subtree_osds(id))
         return devices
 
     def get_storage_groups_by_rule(self, rule):
@@ -187,7 +226,6 @@ class CrushMap():
                     devices = []
                     storage_groups[sg_count-1] = self.get_all_osds_by_bucket(bucket['id'],devices)
 
-        print storage_groups
         return storage_groups
 
     def get_storage_groups_dict_by_rule(self, rules):
@@ -220,30 +258,22 @@ class CrushMap():
         return storage_groups
 
     def _get_location_by_osd_name_list(self,osd_name_list):
-        parent_bucket = []
-        osds = self._devices
-        buckets = self._buckets
+        parent_bucket = set()
         for osd_name in osd_name_list:
-            osd_id = [osd['id'] for osd in osds if osd['name'] == osd_name]
-            for bucket in buckets:
-                for item in bucket['items']:
-                    if item['id'] == osd_id:
-                        parent_bucket.append(bucket['id'])
-        return list(set(parent_bucket))
+            osd = self._osd_by_name.get(osd_name)
+            if osd:
+                parent_bucket.update(self.get_parent_ids(osd['id']))
+        return list(parent_bucket)
 
 
     def _get_location_by_osd_name(self,osd_name):
         parent_bucket = {}
-        osds = self._devices
-        buckets = self._buckets
-        osd_id = [osd['id'] for osd in osds if osd['name'] == osd_name]
-        osd_id = osd_id[0]
-        for bucket in buckets:
-            for item in bucket['items']:
-                if int(item['id']) == int(osd_id):
-                    parent_bucket['name'] = bucket['name']
-                    parent_bucket['type_name'] = bucket['type_name']
-                    break
+        osd_id = self._osd_by_name[osd_name]['id']
+        parent_ids = self.get_parent_ids(osd_id)
+        if parent_ids:
+            bucket = self.get_bucket_by_id(parent_ids[0])
+            parent_bucket['name'] = bucket['name']
+            parent_bucket['type_name'] = bucket['type_name']
         return parent_bucket
 
 
@@ -262,13 +292,13 @@ class CrushMap():
                 tree_data[str(node_id)] = tree_node_data
             for item in items:
                 item_id = item['id']
-                if self.get_osd_by_id(item_id):
-                    item_node = self.get_osd_by_id(item_id)
+                item_node = self.get_osd_by_id(item_id)
+                if item_node:
                     item_node['type_id'] = types[0]['type_id']
                     item_node['type_name'] = types[0]['name']
-                elif self.get_bucket_by_id(item_id):
-                    item_node = self.get_bucket_by_id(item_id)
                 else:
+                    item_node = self.get_bucket_by_id(item_id)
+                if not item_node:
                     return 'No defined error in crushmap:id=%s'%item_id
                 item_node_id = item_node['id']
                 item_node_parent_id = [node_id]
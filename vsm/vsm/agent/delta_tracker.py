@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Track the state last pushed to the DB so only changed rows are sent.
+
+Usage from a periodic task:
+
+    values_list = tracker.changes(values_list)
+    push(values_list)
+    tracker.commit()
+
+If push() raises, commit() is skipped and the next run sends the same
+rows again. Every state_full_resync_interval seconds changes() returns
+every row, so updates done to the DB behind the agent's back are
+overwritten eventually.
+"""
+
+import time
+
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+delta_tracker_opts = [
+    cfg.IntOpt('state_full_resync_interval',
+               default=3600,
+               help='Interval (secs) the agent pushes every osd, pool and '
+                    'device row to the DB, even unchanged ones.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(delta_tracker_opts)
+
+
+class DeltaTracker(object):
+    """Remember the rows pushed for one kind of entity.
+
+    :param key: name of the field identifying a row, e.g. 'osd_name'.
+    :param resync_interval: seconds between two full pushes.
+    """
+
+    def __init__(self, key, resync_interval=None):
+        self._key = key
+        if resync_interval is None:
+            resync_interval = CONF.state_full_resync_interval
+        self._resync_interval = resync_interval
+        self._state = {}
+        self._pending = None
+        self._pending_full = False
+        self._last_resync = 0
+
+    def _resync_due(self):
+        return time.time() - self._last_resync >= self._resync_interval
+
+    def changes(self, values_list):
+        """Return the rows of values_list which differ from the last push."""
+        self._pending = dict([(values[self._key], dict(values))
+                              for values in values_list])
+        self._pending_full = self._resync_due()
+        if self._pending_full:
+            return list(values_list)
+
+        changed = [values for values in values_list
+                   if self._state.get(values[self._key]) != values]
+        LOG.debug('%s of %s rows changed (key %s).' %
+                  (len(changed), len(values_list), self._key))
+        return changed
+
+    def commit(self):
+        """Record the rows given to the last changes() call as pushed."""
+        if self._pending is None:
+            return
+        self._state = self._pending
+        if self._pending_full:
+            self._last_resync = time.time()
+        self._pending = None
+        self._pending_full = False
+
+    def reset(self):
+        """Forget everything, the next changes() call returns every row."""
+        self._state = {}
+        self._pending = None
+        self._last_resync = 0
@@ -0,0 +1,233 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Inventory of the block devices of the node.
+
+Everything is read from the kernel and udev instead of running blockdev,
+mount, pvs and ls:
+
+    /proc/partitions            the block devices and partitions
+    /sys/class/block/<name>     size, rotational, read-only, holders
+    /proc/self/mountinfo        the mounted devices, by major:minor
+    /proc/swaps                 the active swap devices
+    /run/udev/data/b<maj:min>   the signature found on the device,
+                                e.g. LVM2_member for a LVM physical volume
+    /dev/disk/by-path, by-uuid  the persistent names
+
+None of these needs root. The inventory is cached and built again only
+when the partitions, mounts, swaps or /dev/disk links changed.
+"""
+
+import os
+
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Never offered to ceph: loop, ram disks, device mapper and optical drives.
+_SKIPPED_PREFIXES = ('loop', 'ram', 'zram', 'dm-', 'sr', 'fd')
+
+# Smaller devices are e.g. the 1KiB container of the extended partitions.
+_MIN_SIZE = 1024 * 1024
+
+
+def _read(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return default
+
+
+def _read_int(path, default=0):
+    try:
+        return int(_read(path, '').strip())
+    except ValueError:
+        return default
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+class DiskInventory(object):
+    """Block devices of the node, keyed by '/dev/<name>'.
+
+    Each device is a dict with name, kernel_name, devno ('major:minor'),
+    size (bytes), rotational, read_only, partition, parent, partitions,
+    holders, mount_point, swap, fs_type, lvm_pv, by_path and by_uuid.
+    """
+
+    def __init__(self, sys_root='/sys', proc_root='/proc', dev_root='/dev',
+                 udev_root='/run/udev'):
+        self._sys = os.path.join(sys_root, 'class', 'block')
+        self._proc = proc_root
+        self._dev = dev_root
+        self._udev = os.path.join(udev_root, 'data')
+        self._disks = None
+        self._signature = None
+
+    def _current_signature(self):
+        links = []
+        for kind in ('by-path', 'by-uuid'):
+            try:
+                links.append(os.stat(os.path.join(self._dev, 'disk',
+                                                  kind)).st_mtime)
+            except OSError:
+                links.append(None)
+        return (_read(os.path.join(self._proc, 'partitions')),
+                _read(os.path.join(self._proc, 'self', 'mountinfo')),
+                _read(os.path.join(self._proc, 'swaps')),
+                tuple(links))
+
+    def invalidate(self):
+        self._disks = None
+        self._signature = None
+
+    def get(self):
+        """Return the devices, built again if anything changed."""
+        signature = self._current_signature()
+        if self._disks is None or signature != self._signature:
+            self._disks = self._build(signature)
+            self._signature = signature
+        return self._disks
+
+    def _build(self, signature):
+        partitions, mountinfo, swaps = signature[:3]
+        mounts = self._parse_mountinfo(mountinfo or '')
+        swap_devs = set(line.split()[0]
+                        for line in (swaps or '').split('\n')[1:]
+                        if line.strip())
+
+        disks = {}
+        for line in (partitions or '').split('\n')[2:]:
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            kernel_name = fields[3]
+            if kernel_name.startswith(_SKIPPED_PREFIXES):
+                continue
+            devno = '%s:%s' % (fields[0], fields[1])
+            sys_dir = os.path.join(self._sys, kernel_name)
+            partition = os.path.exists(os.path.join(sys_dir, 'partition'))
+            parent = None
+            if partition:
+                parent_dir = os.path.dirname(os.path.realpath(sys_dir))
+                parent = self._dev_name(os.path.basename(parent_dir))
+            queue_dir = os.path.join(os.path.realpath(sys_dir),
+                                     partition and '../queue' or 'queue')
+            name = self._dev_name(kernel_name)
+            disks[name] = {
+                'name': name,
+                'kernel_name': kernel_name,
+                'devno': devno,
+                'size': _read_int(os.path.join(sys_dir, 'size')) * 512,
+                'rotational': bool(_read_int(os.path.join(queue_dir,
+                                                          'rotational'))),
+                'read_only': bool(_read_int(os.path.join(sys_dir, 'ro'))),
+                'partition': partition,
+                'parent': parent,
+                'partitions': [],
+                'holders': sorted(_listdir(os.path.join(sys_dir, 'holders'))),
+                'mount_point': mounts.get(devno),
+                'swap': name in swap_devs,
+                'fs_type': self._udev_property(devno, 'ID_FS_TYPE'),
+                'by_path': None,
+                'by_uuid': None,
+            }
+            disks[name]['lvm_pv'] = disks[name]['fs_type'] == 'LVM2_member'
+
+        for disk in disks.itervalues():
+            if disk['parent'] in disks:
+                disks[disk['parent']]['partitions'].append(disk['name'])
+        for kind, key in (('by-path', 'by_path'), ('by-uuid', 'by_uuid')):
+            link_dir = os.path.join(self._dev, 'disk', kind)
+            for link in sorted(_listdir(link_dir)):
+                target = self._link_target(os.path.join(link_dir, link))
+                if target in disks and not disks[target][key]:
+                    disks[target][key] = os.path.join('/dev/disk', kind, link)
+        LOG.debug('Found %s block devices.' % len(disks))
+        return disks
+
+    def _dev_name(self, kernel_name):
+        # e.g. cciss!c0d0 is /dev/cciss/c0d0
+        return '/dev/%s' % kernel_name.replace('!', '/')
+
+    def _link_target(self, path):
+        dev_root = os.path.realpath(self._dev)
+        return '/dev/%s' % os.path.relpath(os.path.realpath(path), dev_root)
+
+    def _parse_mountinfo(self, mountinfo):
+        """major:minor -> mount point of the first mount of the device."""
+        mounts = {}
+        for line in mountinfo.split('\n'):
+            fields = line.split()
+            if len(fields) < 5:
+                continue
+            mounts.setdefault(fields[2], fields[4])
+        return mounts
+
+    def _udev_property(self, devno, key):
+        data = _read(os.path.join(self._udev, 'b%s' % devno), '')
+        prefix = 'E:%s=' % key
+        for line in data.split('\n'):
+            if line.startswith(prefix):
+                return line[len(prefix):]
+        return None
+
+    def in_use(self, disk):
+        """True if the device is mounted, swap, held by device mapper, md
+        or LVM, or is a physical volume."""
+        return bool(disk['mount_point'] or disk['swap'] or disk['holders']
+                    or disk['lvm_pv'])
+
+    def available_disks(self):
+        """Names of the devices which can become an osd or a journal.
+
+        Whole disks without partitions and partitions which are big
+        enough, writable and not in use.
+        """
+        available = []
+        for name, disk in sorted(self.get().iteritems()):
+            if disk['partitions'] or disk['read_only'] or \
+                    disk['size'] < _MIN_SIZE or self.in_use(disk):
+                continue
+            available.append(name)
+        return available
+
+    def by_path(self):
+        """'/dev/<name>' -> '/dev/disk/by-path/<link>'."""
+        return dict((name, disk['by_path'])
+                    for name, disk in self.get().iteritems()
+                    if disk['by_path'])
+
+    def by_uuid(self):
+        """'/dev/<name>' -> '/dev/disk/by-uuid/<link>'."""
+        return dict((name, disk['by_uuid'])
+                    for name, disk in self.get().iteritems()
+                    if disk['by_uuid'])
+
+    def resolve(self, path):
+        """The '/dev/<name>' a /dev/disk link points to, None if unknown."""
+        name = self._link_target(path)
+        if name in self.get():
+            return name
+        return None
@@ -27,6 +27,7 @@ import os
 import time
 import json
 import platform
+from eventlet import greenpool
 from vsm import db
 from vsm import exception
 from vsm import flags
@@ -36,7 +37,10 @@ from vsm.openstack.common.gettextutils import _
 from vsm import conductor
 from vsm.conductor import rpcapi as conductor_rpcapi
 from vsm.agent import rpcapi as agent_rpc
+from vsm.agent import ceph_backend
 from vsm.agent import cephconfigparser
+from vsm.agent import disk_inventory
+from vsm.agent import rbd_inventory
 from vsm.openstack.common.rpc import common as rpc_exc
 import glob
 from crushmap_parser import CrushMap
@@ -64,6 +68,9 @@ class CephDriver(object):
         self._conductor_api = conductor.API()
         self._conductor_rpcapi = conductor_rpcapi.ConductorAPI()
         self._agent_rpcapi = agent_rpc.AgentAPI()
+        self._backend = ceph_backend.load_ceph_backend()
+        self._rbd_inventory = rbd_inventory.RbdInventory(self)
+        self._disk_inventory = disk_inventory.DiskInventory()
         try:
             cephconfigparser.CephConfigParser(FLAGS.ceph_conf)
         except:
@@ -130,8 +137,9 @@ class CephDriver(object):
         # user, the result will return false
         if ssh:
             try:
-                out, err = utils.execute('ssh', '-t', 'root@'+host,
-                                         'ls', file, run_as_root=True)
+                out, err = utils.ssh_cli_execute(host, 'ls', file,
+                                                 ssh_opts=['-t'],
+                                                 run_as_root=True)
             except:
                 out = ""
         else:
@@ -143,19 +151,19 @@ class CephDriver(object):
         if out:
             type_id = "id=%s" % id
             if ssh:
-                utils.execute('ssh', '-t', 'root@'+host,
-                              operate, 'ceph-%s' % type,
-                              type_id, run_as_root=True)
+                utils.ssh_cli_execute(host, operate, 'ceph-%s' % type,
+                                      type_id, ssh_opts=['-t'],
+                                      run_as_root=True)
             else:
                 utils.execute(operate, 'ceph-%s' % type, type_id,
                               run_as_root=True)
         else:
             if is_systemctl:
                 if ssh:
-                    utils.execute('ssh', '-t', 'root@'+host,
-                                  'systemctl', operate,
-                                  'ceph-'+type+'@'+id,
-                                  run_as_root=True)
+                    utils.ssh_cli_execute(host, 'systemctl', operate,
+                                          'ceph-'+type+'@'+id,
+                                          ssh_opts=['-t'],
+                                          run_as_root=True)
                 else:
                     utils.execute('systemctl', operate,
                                   'ceph-'+type+'@'+id,
@@ -163,9 +171,9 @@ class CephDriver(object):
             else:
                 type_id = type + "." + id
                 if ssh:
-                    utils.execute('ssh', '-t', 'root@'+host,
-                                  'service', 'ceph', operate,
-                                  type_id, run_as_root=True)
+                    utils.ssh_cli_execute(host, 'service', 'ceph', operate,
+                                          type_id, ssh_opts=['-t'],
+                                          run_as_root=True)
                 else:
                     utils.execute('service', 'ceph', operate, type_id,
                                   run_as_root=True)
@@ -810,170 +818,244 @@ class CephDriver(object):
         return True
 
     def add_osd(self, context, host_id, osd_id_in=None):
-
+        osd_ids = None
         if osd_id_in is not None:
-            osd_obj = db.osd_get(context, osd_id_in)
-            host_obj =  db.init_node_get_by_device_id(context, osd_obj.device_id)
+            osd_ids = [osd_id_in]
+        return self.add_osds(context, host_id, osd_ids=osd_ids)
+
+    def add_osds(self, context, host_id, osd_ids=None):
+        """Add the disks of a host to the cluster as new osds.
+
+        Allocating the osd ids, editing ceph.conf and the auth and crush
+        updates are done one disk at a time. Formatting, mounting and
+        `ceph-osd --mkfs` run for osd_provision_workers disks at a time.
+        The progress of every disk is kept in the operation_status of its
+        osd_state row; a disk which fails does not stop the other ones.
+
+        :param osd_ids: ids of the osd_state rows to provision, e.g. created
+                        by add_new_disks_to_cluster. Every device of the
+                        host is provisioned if None.
+        :returns: True if every disk was added.
+        """
+        devices = None
+        if osd_ids:
+            devices = {}
+            for osd_id in osd_ids:
+                osd_obj = db.osd_get(context, osd_id)
+                devices[osd_obj.device_id] = osd_id
+            host_obj = db.init_node_get_by_device_id(context,
+                                                     osd_obj.device_id)
             host_id = host_obj.id
-            LOG.info("begin to add osd %s from host %s"%(osd_obj.device_id,host_id))
+            LOG.info("begin to add osds %s from host %s" % (osd_ids, host_id))
 
         LOG.info('start to ceph osd on %s' % host_id)
         strg_list = self._conductor_api.\
             host_storage_groups_devices(context, host_id)
         LOG.info('strg_list %s' % strg_list)
+        if devices is not None:
+            strg_list = [strg for strg in strg_list
+                         if strg.get('dev_id') in devices]
 
-        #added_to_crushmap = False
         osd_cnt = len(strg_list)
-        if osd_id_in is not None:
-            osd_cnt = 1
-        count = 0
-
+        done = []
+
+        def _report(job):
+            done.append(job)
+            # An active server keeps its status, only the deployment of a
+            # new server reports how many disks are added.
+            if devices is None:
+                self._conductor_api.init_node_update(context, host_id,
+                    {"status": "add_osd %s/%s" % (len(done), osd_cnt)})
+
+        # Step 1: one disk at a time, allocate the osd id and create the
+        # osd_state row, crush buckets and ceph.conf section.
+        jobs = []
         for strg in strg_list:
-            if osd_id_in is not None and strg.get("dev_id") != osd_obj.device_id:
-                continue
             LOG.info('>> Step 1: start to ceph osd %s' % strg)
-            count = count + 1
-            if osd_id_in is  None:
-                self._conductor_api.init_node_update(context, host_id, {"status": "add_osd %s/%s"%(count,osd_cnt)})
-            # Create osd from # ceph osd create
-            stdout = utils.execute("ceph",
-                                   "osd",
-                                   "create",
-                                   run_as_root=True)[0]
-
-            osd_id = str(int(stdout))
-            LOG.info('   gen osd_id success: %s' % osd_id)
-
-            # step 1 end
-            host = strg['host']
-            zone = strg['zone']
-
-            #TODO strg['storage_group']
-            # stands for the storage_group_name fetch from DB.
-            if strg.get('storage_group',None) is None:
-                default_storage_group = db.storage_group_get_all(context)[0]
-                strg['storage_group'] = default_storage_group['name']
-                strg['storage_group_id'] = default_storage_group['id']
-            storage_group = strg['storage_group']
-            crush_dict = {"root": "vsm",
-                          "storage_group": storage_group,
-                          "zone": "_".join([zone, storage_group]),
-                          "host": "_".join([host, storage_group, zone]),}
-
-            osd_conf_dict = {"host": host,
-                             "primary_public_ip": strg['primary_public_ip'],
-                             "secondary_public_ip": strg['secondary_public_ip'],
-                             "cluster_ip": strg['cluster_ip'],
-                             "dev_name": strg['dev_name'],
-                             "dev_journal": strg['dev_journal'],
-                             "file_system": strg['file_system']}
-            osd_state = {}
-            osd_state['osd_name'] = 'osd.%s' % osd_id
-            osd_state['device_id'] = strg['dev_id']
-            osd_state['storage_group_id'] = strg['storage_group_id']
-            osd_state['service_id'] = strg['service_id']
-            osd_state['cluster_id'] = strg['cluster_id']
-            osd_state['state'] = FLAGS.osd_in_up
-            osd_state['weight'] = 1.0
-            osd_state['operation_status'] = FLAGS.vsm_status_present
-            osd_state['public_ip'] = strg['secondary_public_ip']
-            osd_state['cluster_ip'] = strg['cluster_ip']
-            osd_state['deleted'] = 0
-            osd_state['zone_id'] = strg['zone_id']
-            if osd_id_in is not None:
-                osd_state_ref = db.osd_state_update(context,osd_id_in,osd_state)
-            else:
-                osd_state_ref = self._conductor_api.osd_state_create(context, osd_state)
-            osd_state['osd_location'] = osd_state_ref['osd_location']
-            osd_state['weight'] = osd_state_ref['weight'] and float(osd_state_ref['weight']) or 1.0
-            LOG.info('>> crush_dict  %s' % crush_dict)
-            LOG.info('>> osd_conf_dict %s' % osd_conf_dict)
-            LOG.info('>> osd_state %s' % osd_state)
-            values = {}
-            #if not added_to_crushmap:
-            #    LOG.info('>> add crushmap ')
-            crushmap = self.get_crushmap_json_format()
-            types = crushmap.get_all_types()
-            types.sort(key=operator.itemgetter('type_id'))
-            if self.is_new_storage_group(crush_dict['storage_group']):
-                self._crushmap_mgmt.add_storage_group(crush_dict['storage_group'],\
-                                                  crush_dict['root'],types=types)
-                zones = db.zone_get_all_not_in_crush(context)
-                for item in zones: 
-                    zone_item = item['name'] + '_' + crush_dict['storage_group'] 
-                    self._crushmap_mgmt.add_zone(zone_item, \
-                                                crush_dict['storage_group'],types=types)
-                
-                if zone == FLAGS.default_zone:
-                    self._crushmap_mgmt.add_rule(crush_dict['storage_group'], 'host')
-                else:
-                    self._crushmap_mgmt.add_rule(crush_dict['storage_group'], 'zone')
-
-                #TODO update rule_id and status in DB
-                rule_dict = self.get_crush_rule_dump_by_name(crush_dict['storage_group']) 
-                LOG.info("rule_dict:%s" % rule_dict)
-                values['rule_id'] = rule_dict['rule_id']
-
-            self._crushmap_mgmt.add_host(crush_dict['host'],
-                                         crush_dict['zone'],types=types)
-            #    added_to_crushmap = True
-
-            #There must be at least 3 hosts in every storage group when the status is "IN"
-            zones, hosts = self._conductor_rpcapi.zones_hosts_get_by_storage_group(context, \
-                                                        crush_dict['storage_group'])
-            #LOG.info("storage group:%s" % crush_dict['storage_group'])
-            #LOG.info("zones:%s" % zones)
-            #LOG.info("hosts:%s" % hosts)
-            #no zone and zone version
-            if zones:
-                if zones[0] == FLAGS.default_zone:
-                    if host not in hosts and len(hosts) >= 2:
-                        values['status'] = FLAGS.storage_group_in 
-                else:
-                    if zone not in zones and len(zones) >= 2:
-                        values['status'] = FLAGS.storage_group_in 
-
-            if values:
-                db.storage_group_update_by_name(context, crush_dict['storage_group'], values)
-
-            # other steps
-            LOG.info('>> _add_osd start ')
-            self._add_osd(context,
-                          osd_id,
-                          crush_dict,
-                          osd_conf_dict,
-                          osd_state)
+            osd_id_in = devices and devices[strg['dev_id']]
+            job = {'strg': strg, 'osd_state_id': osd_id_in}
+            try:
+                self._allocate_osd(context, job)
+            except Exception, e:
+                self._osd_provision_failed(context, job, 'allocate', e)
+                _report(job)
+                continue
+            jobs.append(job)
+
+        # Steps 2 to 4: format, mount and initialize the disks concurrently.
+        osd_conf = self.get_ceph_config(context)['osd']
+        ceph_version = self.get_ceph_version()
+        ceph_owned = ceph_version and int(ceph_version.split(".")[0]) > 0
+
+        def _prepare(job):
+            try:
+                self._prepare_osd(context, job, osd_conf, ceph_owned)
+                return job
+            except Exception, e:
+                self._osd_provision_failed(context, job, 'prepare', e)
+                _report(job)
+
+        workers = greenpool.GreenPool(max(1, FLAGS.osd_provision_workers))
+        prepared = [job for job in workers.imap(_prepare, jobs) if job]
+
+        # Steps 5 to 7: one disk at a time, register and start the osds.
+        ok = len(prepared) == osd_cnt
+        for job in prepared:
+            try:
+                self._register_osd(context, job)
+            except Exception, e:
+                self._osd_provision_failed(context, job, 'register', e)
+                ok = False
+            _report(job)
             try:
                 self.run_add_disk_hook(context)
             except:
                 LOG.info('run add_disk error')
 
-        return True
+        LOG.info('%s of %s osds added on host %s' %
+                 (len([job for job in done if not job.get('failed')]),
+                  osd_cnt, host_id))
+        return ok
+
+    def _osd_provision_failed(self, context, job, step, e):
+        job['failed'] = True
+        LOG.exception('failed to add osd %s at step %s: %s' %
+                      (job.get('osd_id'), step, e))
+        if job.get('osd_state_id') is None:
+            return
+        try:
+            db.osd_state_update(context, job['osd_state_id'],
+                                {'state': FLAGS.osd_out_down,
+                                 'operation_status': 'Failed: %s' % step})
+        except Exception:
+            LOG.exception('can not record the failure of osd %s' %
+                          job.get('osd_id'))
+
+    def _set_osd_progress(self, context, job, step):
+        LOG.info('osd %s: %s' % (job['osd_id'], step))
+        db.osd_state_update(context, job['osd_state_id'],
+                            {'operation_status': 'Provisioning: %s' % step})
+
+    def _allocate_osd(self, context, job):
+        strg = job['strg']
+        # Create osd from # ceph osd create
+        stdout = utils.execute("ceph",
+                               "osd",
+                               "create",
+                               run_as_root=True)[0]
+
+        osd_id = str(int(stdout))
+        job['osd_id'] = osd_id
+        LOG.info('   gen osd_id success: %s' % osd_id)
+
+        # step 1 end
+        host = strg['host']
+        zone = strg['zone']
+
+        #TODO strg['storage_group']
+        # stands for the storage_group_name fetch from DB.
+        if strg.get('storage_group',None) is None:
+            default_storage_group = db.storage_group_get_all(context)[0]
+            strg['storage_group'] = default_storage_group['name']
+            strg['storage_group_id'] = default_storage_group['id']
+        storage_group = strg['storage_group']
+        crush_dict = {"root": "vsm",
+                      "storage_group": storage_group,
+                      "zone": "_".join([zone, storage_group]),
+                      "host": "_".join([host, storage_group, zone]),}
+
+        osd_conf_dict = {"host": host,
+                         "primary_public_ip": strg['primary_public_ip'],
+                         "secondary_public_ip": strg['secondary_public_ip'],
+                         "cluster_ip": strg['cluster_ip'],
+                         "dev_name": strg['dev_name'],
+                         "dev_journal": strg['dev_journal'],
+                         "file_system": strg['file_system']}
+        osd_state = {}
+        osd_state['osd_name'] = 'osd.%s' % osd_id
+        osd_state['device_id'] = strg['dev_id']
+        osd_state['storage_group_id'] = strg['storage_group_id']
+        osd_state['service_id'] = strg['service_id']
+        osd_state['cluster_id'] = strg['cluster_id']
+        osd_state['state'] = FLAGS.osd_in_up
+        osd_state['weight'] = 1.0
+        osd_state['operation_status'] = 'Provisioning: allocate'
+        osd_state['public_ip'] = strg['secondary_public_ip']
+        osd_state['cluster_ip'] = strg['cluster_ip']
+        osd_state['deleted'] = 0
+        osd_state['zone_id'] = strg['zone_id']
+        if job['osd_state_id'] is not None:
+            osd_state_ref = db.osd_state_update(context, job['osd_state_id'],
+                                                osd_state)
+        else:
+            osd_state_ref = self._conductor_api.osd_state_create(context,
+                                                                 osd_state)
+            job['osd_state_id'] = osd_state_ref['id']
+        osd_state['osd_location'] = osd_state_ref['osd_location']
+        osd_state['weight'] = osd_state_ref['weight'] and float(osd_state_ref['weight']) or 1.0
+        LOG.info('>> crush_dict  %s' % crush_dict)
+        LOG.info('>> osd_conf_dict %s' % osd_conf_dict)
+        LOG.info('>> osd_state %s' % osd_state)
+        job['crush_dict'] = crush_dict
+        job['osd_conf_dict'] = osd_conf_dict
+        job['osd_state'] = osd_state
+
+        values = {}
+        crushmap = self.get_crushmap_json_format()
+        types = crushmap.get_all_types()
+        types.sort(key=operator.itemgetter('type_id'))
+        if self.is_new_storage_group(crush_dict['storage_group']):
+            self._crushmap_mgmt.add_storage_group(crush_dict['storage_group'],\
+                                              crush_dict['root'],types=types)
+            zones = db.zone_get_all_not_in_crush(context)
+            for item in zones:
+                zone_item = item['name'] + '_' + crush_dict['storage_group']
+                self._crushmap_mgmt.add_zone(zone_item, \
+                                            crush_dict['storage_group'],types=types)
+
+            if zone == FLAGS.default_zone:
+                self._crushmap_mgmt.add_rule(crush_dict['storage_group'], 'host')
+            else:
+                self._crushmap_mgmt.add_rule(crush_dict['storage_group'], 'zone')
+
+            #TODO update rule_id and status in DB
+            rule_dict = self.get_crush_rule_dump_by_name(crush_dict['storage_group'])
+            LOG.info("rule_dict:%s" % rule_dict)
+            values['rule_id'] = rule_dict['rule_id']
+
+        self._crushmap_mgmt.add_host(crush_dict['host'],
+                                     crush_dict['zone'],types=types)
+
+        #There must be at least 3 hosts in every storage group when the status is "IN"
+        zones, hosts = self._conductor_rpcapi.zones_hosts_get_by_storage_group(context, \
+                                                    crush_dict['storage_group'])
+        #no zone and zone version
+        if zones:
+            if zones[0] == FLAGS.default_zone:
+                if host not in hosts and len(hosts) >= 2:
+                    values['status'] = FLAGS.storage_group_in
+            else:
+                if zone not in zones and len(zones) >= 2:
+                    values['status'] = FLAGS.storage_group_in
+
+        if values:
+            db.storage_group_update_by_name(context, crush_dict['storage_group'], values)
+
+        # step 3.1, ceph.conf is rewritten as a whole so never concurrently.
+        LOG.info('>>> step3.1 start')
+        self._add_ceph_osd_to_config(context, osd_conf_dict, osd_id)
 
-    def _add_osd(self,
-                 context,
-                 osd_id,
-                 crush_dict,
-                 osd_conf_dict,
-                 osd_state,
-                 weight="1.0"):
+    def _prepare_osd(self, context, job, osd_conf, ceph_owned):
+        osd_id = job['osd_id']
+        osd_conf_dict = job['osd_conf_dict']
 
         # step 2
-        LOG.info('>>> step2 start')
-        #osd_pth = '%sceph-%s' % (FLAGS.osd_data_path, osd_id)
-        #osd_keyring_pth = "%s/keyring" % osd_pth
-        #osd_pth = '/var/lib/ceph/osd/osd%s' % osd_id
-        #osd_keyring_pth = '/etc/ceph/keyring.osd.%s' % osd_id
-        osd_data_path = self.get_ceph_config(context)['osd']['osd data']
-        osd_pth = osd_data_path.replace('$id',osd_id)
+        self._set_osd_progress(context, job, 'format')
+        osd_pth = osd_conf['osd data'].replace('$id', osd_id)
         LOG.info('osd add osd_pth =%s'%osd_pth)
-        osd_keyring_pth = self.get_ceph_config(context)['osd']['keyring']
-        osd_keyring_pth = osd_keyring_pth.replace('$id',osd_id).replace('$name','osd.%s'%osd_id)
-        LOG.info('osd add keyring path=%s'%osd_keyring_pth)
         utils.ensure_tree(osd_pth)
 
         # step 3
-        LOG.info('>>> step3 start')
         # get cluster file system to format the disk
         utils.execute("umount",
                       osd_conf_dict['dev_name'],
@@ -995,8 +1077,7 @@ class CephDriver(object):
         # Need to use -o user_xattr for ext4
         fs_opt = utils.get_fs_options(file_system)[1]
 
-        ceph_version = self.get_ceph_version()
-        if int(ceph_version.split(".")[0]) > 0:
+        if ceph_owned:
             utils.execute('chown',
                           'ceph:ceph',
                           osd_conf_dict['dev_name'],
@@ -1006,6 +1087,7 @@ class CephDriver(object):
                           osd_conf_dict['dev_journal'],
                           run_as_root=True)
 
+        self._set_osd_progress(context, job, 'mount')
         utils.execute("mount",
                       "-t", file_system,
                       "-o", fs_opt,
@@ -1014,32 +1096,30 @@ class CephDriver(object):
                       run_as_root=True)
         self._clean_dirs(osd_pth)
 
-        # step 3.1
-        LOG.info('>>> step3.1 start')
-        ret = self._add_ceph_osd_to_config(context, osd_conf_dict, osd_id)
-
         # step 4 add to config file before this step
-        LOG.info('>>> step4 start')
+        self._set_osd_progress(context, job, 'mkfs')
         utils.execute("ceph-osd", "-i", osd_id, "--mkfs", "--mkkey",
                        run_as_root=True)
+        job['keyring'] = osd_conf['keyring'].replace('$id', osd_id).\
+            replace('$name', 'osd.%s' % osd_id)
+
+    def _register_osd(self, context, job, weight="1.0"):
+        osd_id = job['osd_id']
+        crush_dict = job['crush_dict']
+        osd_state = job['osd_state']
 
         # step 5
-        LOG.info('>>> step5 start')
+        self._set_osd_progress(context, job, 'auth')
+        LOG.info('osd add keyring path=%s' % job['keyring'])
         utils.execute("ceph", "auth", "del", "osd.%s" % osd_id,
                         run_as_root=True)
         utils.execute("ceph", "auth", "add", "osd.%s" % osd_id,
                       "osd", "allow *", "mon", "allow rwx",
-                      "-i", osd_keyring_pth,
+                      "-i", job['keyring'],
                       run_as_root=True)
 
         # step 6 zone host stg
-        LOG.info('>>> step6 start')
-        # utils.execute("ceph", "osd", "crush", "add", "osd.%s" % osd_id, weight,
-        #          "root=%s" % crush_dict['root'],
-        #          "storage_group=%s" % crush_dict['storage_group'],
-        #          "zone=%s" % crush_dict['zone'], "host=%s" % crush_dict['host'],
-        #          run_as_root=True)
-
+        self._set_osd_progress(context, job, 'crush')
         all_osd_in_host = db.osd_state_get_by_service_id(context,osd_state['service_id'])
         other_osd_in_host = [osd['osd_name'] for osd in all_osd_in_host if osd['device_id'] != osd_state['device_id'] and osd['state'] != 'Uninitialized']
         crushmap = self.get_crushmap_json_format()
@@ -1061,13 +1141,13 @@ class CephDriver(object):
                  osd_location_str,
                  run_as_root=True)
         # step 7 start osd service
-        LOG.info('>>> step7 start')
+        self._set_osd_progress(context, job, 'start')
         self.start_osd_daemon(context, osd_id, is_vsm_add_osd=True)
         utils.execute("ceph", "osd", "crush", "create-or-move", "osd.%s" % osd_id, weight,
            osd_location_str,
           run_as_root=True)
-        #LOG.info('osd-to-db==%s'%osd_state)
-        #self._conductor_api.osd_state_create(context, osd_state)
+        db.osd_state_update(context, job['osd_state_id'],
+                            {'operation_status': FLAGS.vsm_status_present})
         LOG.info('>>> step7 finish')
         return True
 
@@ -1178,7 +1258,8 @@ class CephDriver(object):
         try:
             # test ssh service in case the server is down
             LOG.info('>>>> removing ceph mon step 1: test server start!')
-            utils.execute('ssh', '-q', 'root@' + host, 'exit', run_as_root=True)
+            utils.ssh_cli_execute(host, 'exit', ssh_opts=['-q'],
+                                  run_as_root=True)
         except exception.ProcessExecutionError as e:
             LOG.info('>> removing ceph mon test server error!')
             code = e.exit_code
@@ -1386,23 +1467,18 @@ class CephDriver(object):
 
             out, err = utils.execute('cat', file_path, run_as_root=True)
             pid = out.strip()
-            pid_live = os.path.exists('/proc/%s' % pid)
             utils.execute('rm', '-rf', file_path, run_as_root=True)
-            try_times = 1
-            while pid_live:
-                try_times = try_times + 1
 
+            def _killed():
+                if not os.path.exists('/proc/%s' % pid):
+                    return True
                 try:
-                    if try_times % 2:
-                        utils.execute('kill', '-9', pid, run_as_root=True)
-                    else:
-                        utils.execute('kill', '-9', pid, run_as_root=True)
+                    utils.execute('kill', '-9', pid, run_as_root=True)
                 except:
                     LOG.info('Seems can not stop this OSD process.')
-                time.sleep(2)
-                pid_live = os.path.exists('/proc/%s' % pid)
-                if try_times > 100:
-                    break
+                return False
+
+            utils.wait_for(_killed, timeout=200, name='pid %s' % pid)
         return True
 
     def stop_osd_daemon(self, context, num):
@@ -1931,73 +2007,24 @@ class CephDriver(object):
         return smart_info_dict
 
     def get_available_disks(self, context):
-        all_disk_info,err = utils.execute('blockdev','--report',run_as_root=True)
-        all_disk_info = all_disk_info.split('\n')
-        all_disk_name = []
-        disk_check = []
-        if len(all_disk_info)>1:
-            for line in all_disk_info[1:-1]:
-                LOG.info('line====%s'%line)
-                line_list = line.split(' ')
-                line_list.remove('')
-                LOG.info('line_list====%s'%line_list)
-                if int(line_list[-4]) <= 1024:
-                    continue
-                if line_list[-1].find('-') != -1:
-                    continue
-                if line_list[-9] and int(line_list[-9]) == 0:
-                    disk_check.append(line_list[-1])
-                all_disk_name.append(line_list[-1])
-        for disk_check_cell in disk_check:
-            for disk in all_disk_name:
-                if disk != disk_check_cell and disk.find(disk_check_cell) == 0:
-                    all_disk_name.remove(disk_check_cell)
-                    break
-        mounted_disk_info,err = utils.execute('mount', '-l', run_as_root=True)
-        mounted_disk_info = mounted_disk_info.split('\n')
-        for mounted_disk in mounted_disk_info:
-            mounted_disk_list = mounted_disk.split(' ')
-            if mounted_disk_list[0].find('/dev/') != -1:
-                if mounted_disk_list[0] in all_disk_name:
-                    all_disk_name.remove(mounted_disk_list[0])
-        pvs_disk_info,err = utils.execute('pvs', '--rows', run_as_root=True)
-        pvs_disk_info = pvs_disk_info.split('\n')
-        for line in pvs_disk_info:
-            line_list = line.split(' ')
-            if line_list[-1].find('/dev/') != -1 and line_list[-1] in all_disk_name:
-                all_disk_name.remove(line_list[-1])
-
-        return all_disk_name
+        return self._disk_inventory.available_disks()
 
+    def get_disk_inventory(self, context):
+        return self._disk_inventory.get()
 
     def get_disks_name(self, context,disk_bypath_list):
         disk_name_dict = {}
         for bypath in disk_bypath_list:
-            out, err = utils.execute('ls',bypath,'-l',
-                         run_as_root=True)
-            if len(out.split('../../'))>1:
-                disk_name_dict[bypath] = '/dev/%s'%(out.split('../../')[1][:-1])
+            name = self._disk_inventory.resolve(bypath)
+            if name:
+                disk_name_dict[bypath] = name
         return disk_name_dict
 
     def get_disks_name_by_path_dict(self,disk_name_list):
-        disk_name_dict = {}
-        by_path_info,err = utils.execute('ls','-al','/dev/disk/by-path',run_as_root=True)
-        LOG.info('by_path_info===%s,err===%s'%(by_path_info,err))
-        for bypath in by_path_info.split('\n'):
-            bypath_list = bypath.split(' -> ../../')
-            if len(bypath_list) > 1:
-                disk_name_dict['/dev/%s'%(bypath_list[1])] = '/dev/disk/by-path/%s'%(bypath_list[0].split(' ')[-1])
-        return disk_name_dict
+        return self._disk_inventory.by_path()
 
     def get_disks_name_by_uuid_dict(self,disk_name_list):
-        disk_name_dict = {}
-        by_uuid_info,err = utils.execute('ls','-al','/dev/disk/by-uuid',run_as_root=True)
-        LOG.info('by_uuid_info===%s,err===%s'%(by_uuid_info,err))
-        for byuuid in by_uuid_info.split('\n'):
-            byuuid_list = byuuid.split(' -> ../../')
-            if len(byuuid_list) > 1:
-                disk_name_dict['/dev/%s'%(byuuid_list[1])] = '/dev/disk/by-path/%s'%(byuuid_list[0].split(' ')[-1])
-        return disk_name_dict
+        return self._disk_inventory.by_uuid()
 
     def run_add_disk_hook(self, context):
         out, err = utils.execute('add_disk',
@@ -2047,42 +2074,53 @@ class CephDriver(object):
         LOG.info("Refresh OSD number finish")
         return True
 
-    def _remove_osd(self, context, osd_id, host, host_is_running=True):
-        def _get_line(osd_id):
-            out = utils.execute('ceph',
-                                'osd',
-                                'dump',
-                                '-f',
-                                'json-pretty',
-                                run_as_root=True)[0]
-            status = json.loads(out)
-            for x in status['osds']:
-                if int(x['osd']) == int(osd_id):
-                    return x
+    def get_osdmap_epoch(self):
+        """Epoch of the osd map, from the short `ceph osd stat`."""
+        try:
+            stat = self._run_cmd_to_json(['ceph', 'osd', 'stat'])
+        except Exception:
+            return None
+        if not stat:
             return None
+        return (stat.get('osdmap') or stat).get('epoch')
+
+    def get_osd_map_entry(self, osd_id):
+        """The entry of one osd in `ceph osd dump`, None if not found."""
+        dump = self._run_cmd_to_json(['ceph', 'osd', 'dump'])
+        for osd in (dump or {}).get('osds', []):
+            if int(osd['osd']) == int(osd_id):
+                return osd
+        return None
 
-        def _wait_osd_status(osd_id, key, value):
-            status = _get_line(osd_id)
-            if not status:
-                time.sleep(10)
-                return
+    def wait_osd_state(self, osd_id, timeout=None, **expected):
+        """Wait until an osd has the expected fields in the osd map.
 
-            try_times = 0
-            while str(status[key]) != str(value):
-                try_times = try_times + 1
-                if try_times > 120:
-                    break
+        e.g. wait_osd_state(3, up=0). The cheap osd map epoch is polled
+        with a growing delay; the entry of the osd is only read again
+        when the epoch moved. An osd missing from the map ends the wait.
 
-                status = _get_line(osd_id)
-                if not status:
-                    time.sleep(10)
-                    return
+        :returns: True if the osd reached the state before timeout
+                  (osd_state_wait_timeout by default).
+        """
+        if timeout is None:
+            timeout = FLAGS.osd_state_wait_timeout
+        seen = {'epoch': None}
 
-                time.sleep(5)
-                if try_times % 10 == 0:
-                    LOG.info('Try %s: %s change key = %s to value = %s' % \
-                            (try_times, osd_id, key, value))
+        def _reached():
+            epoch = self.get_osdmap_epoch()
+            if epoch is not None and epoch == seen['epoch']:
+                return False
+            seen['epoch'] = epoch
+            osd = self.get_osd_map_entry(osd_id)
+            if osd is None:
+                return True
+            return all(str(osd.get(key)) == str(value)
+                       for key, value in expected.iteritems())
+
+        return bool(utils.wait_for(_reached, timeout=timeout,
+                                   name='osd.%s %s' % (osd_id, expected)))
 
+    def _remove_osd(self, context, osd_id, host, host_is_running=True):
         config = cephconfigparser.CephConfigParser(FLAGS.ceph_conf)
 
         # Step 1: out this osd.
@@ -2090,7 +2128,7 @@ class CephDriver(object):
         LOG.info('>>> remove ceph osd step0 out osd %s' % osd_id)
         utils.execute("ceph", "osd", "out", osd_id, run_as_root=True)
         LOG.info('>>> remove ceph osd step0 out osd cmd over')
-        _wait_osd_status(osd_id, 'in', 0)
+        self.wait_osd_state(osd_id, **{'in': 0})
 
         # Step 2: shutdown the process.
         if host_is_running:
@@ -2101,7 +2139,7 @@ class CephDriver(object):
             except:
                 utils.execute("service", "ceph", "-a", "stop", "osd.%s" % osd_id,
                               run_as_root=True)
-        _wait_osd_status(osd_id, 'up', 0)
+        self.wait_osd_state(osd_id, up=0)
 
         # Step 3: Remove it from crushmap.
         LOG.info('>>> remove ceph osd step1 osd_id %s' % osd_id)
@@ -2162,7 +2200,7 @@ class CephDriver(object):
         #start
         utils.execute('ceph', 'osd', 'unset', 'noout', run_as_root=True)
         self.ceph_osd_start(context, osd['osd_name'])
-        time.sleep(10)
+        self.wait_osd_state(osd['osd_name'].split('.')[-1], up=1)
         # utils.execute("ceph", "osd", "crush", "create-or-move", osd['osd_name'], osd['weight'],
         #   "host=%s_%s_%s" %(osd['service']['host'],osd['storage_group']['name'],osd['zone']['name']) ,
         #  run_as_root=True)
@@ -2282,7 +2320,7 @@ class CephDriver(object):
         self.start_osd_daemon(context, osd_inner_id)
         #step2
         utils.execute('ceph', 'osd', 'in', osd_name, run_as_root=True)
-        time.sleep(10)
+        self.wait_osd_state(osd_inner_id, up=1, **{'in': 1})
         # utils.execute("ceph", "osd", "crush", "create-or-move", "osd.%s" % osd_inner_id, weight,
         #   "host=%s" % crush_dict['host'],
         #  run_as_root=True)
@@ -2297,9 +2335,19 @@ class CephDriver(object):
 
     def set_pool_pg_pgp_num(self, context, pool, pg_num, pgp_num):
         self.set_pool_pg_num(context, pool, pg_num)
-        #need to wait for the last set pg_num
-        time.sleep(120)
-        self.set_pool_pgp_num(context, pool, pgp_num)
+        #need to wait for the last set pg_num, ceph refuses a new pgp_num
+        #while pgs are being created.
+        def _set_pgp_num():
+            try:
+                self.set_pool_pgp_num(context, pool, pgp_num)
+                return True
+            except exception.ProcessExecutionError, e:
+                LOG.info('set pgp_num of %s: %s' % (pool, e.stderr))
+                return False
+
+        if not utils.wait_for(_set_pgp_num, interval=2, timeout=120,
+                              name='pgs of pool %s' % pool):
+            self.set_pool_pgp_num(context, pool, pgp_num)
         
     def set_pool_pg_num(self, context, pool, pg_num):
         args= ['ceph', 'osd', 'pool', 'set', pool, 'pg_num', pg_num]
@@ -2311,9 +2359,7 @@ class CephDriver(object):
 
     def get_osds_status(self):
         args = ['ceph', 'osd', 'dump', '-f', 'json']
-        #args = ['hostname', '-I']
-        #(out, _err) = utils.execute(*args)
-        (out, _err) = utils.execute(*args, run_as_root=True)
+        (out, _err) = self._backend.execute(*args)
         if out != "":
             #LOG.info("osd_status:%s", out)
             return out
@@ -2338,7 +2384,7 @@ class CephDriver(object):
 
     def get_ceph_health_list(self):
         args = ['ceph', 'health']
-        out, _err = utils.execute(*args, run_as_root=True)
+        out, _err = self._backend.execute(*args)
         try:
             k = out.find(" ")
             status = out[:k]
@@ -2365,11 +2411,7 @@ class CephDriver(object):
         else:
             cmd = args
         LOG.debug('command is %s' % cmd)
-        (out, err) = utils.execute(*cmd, run_as_root=True)
-        json_data = None
-        if out:
-            json_data = json.loads(out)
-        return json_data
+        return self._backend.execute_json(*cmd)
 
     def get_osds_total_num(self):
         args = ['ceph', 'osd', 'ls']
@@ -2385,19 +2427,35 @@ class CephDriver(object):
         return node_list
 
     def get_osds_tree(self):
+        """Return the osd nodes of `ceph osd tree`.
+
+        Each osd located in the tree gets 'osd_location', its host as
+        'type=name', and 'osd_location_path', the 'type=name' of every
+        bucket from the root down to the host, e.g.
+        'storage_group=performance zone=zone_a host=node1'.
+        """
         return_list = list()
         node_list = self.get_crushmap_nodes()
         if node_list:
+            parents = {}
+            for node in node_list:
+                for child in node.get('children') or []:
+                    # Keep the first bucket listing it, like ceph does.
+                    parents.setdefault(child, node)
             for node in node_list:
                 name = node.get('name')
-                id = node.get('id')
                 if name and name.startswith('osd.'):
-                    #LOG.debug('node %s ' % node)
-                    for node_2 in node_list:
-                        if node_2.get('children') and id in node_2.get('children'):
-                            osd_location = '%s=%s'%(node_2.get('type'),node_2.get('name'))
-                            node['osd_location'] = osd_location
-                            break
+                    path = []
+                    seen = set()
+                    parent = parents.get(node.get('id'))
+                    while parent and parent.get('id') not in seen:
+                        seen.add(parent.get('id'))
+                        path.append('%s=%s' % (parent.get('type'),
+                                               parent.get('name')))
+                        parent = parents.get(parent.get('id'))
+                    if path:
+                        node['osd_location'] = path[0]
+                        node['osd_location_path'] = ' '.join(reversed(path))
                     return_list.append(node)
         #LOG.debug('osd list: %s' % return_list)
         return return_list
@@ -2445,29 +2503,8 @@ class CephDriver(object):
         rbd_image_dict = self._run_cmd_to_json(args, pretty=False)
         return rbd_image_dict
  
-    def get_rbd_status(self):
-        pool_list = self.get_osd_lspools()
-        if pool_list:
-            rbd_list = []
-            for pool in pool_list:
-                rbd_image_list = self.get_rbd_lsimages(pool['poolname'])
-                if rbd_image_list:
-                    for rbd_image in rbd_image_list:
-                        rbd_dict = {}
-                        image_dict = self.get_rbd_image_info(\
-                                     rbd_image['image'], \
-                                     pool['poolname'])
-                        if image_dict:
-                            rbd_dict['pool'] = pool['poolname']
-                            rbd_dict['image'] = rbd_image['image']
-                            rbd_dict['size'] = rbd_image['size']
-                            rbd_dict['format'] = rbd_image['format']
-                            rbd_dict['objects'] = image_dict['objects']
-                            rbd_dict['order'] = image_dict['order']
-                            rbd_list.append(rbd_dict)
-            return rbd_list
-        else:
-            return None
+    def get_rbd_status(self, known=None):
+        return self._rbd_inventory.collect(known)
 
     def get_mds_dump(self):
         args = ['ceph', 'mds', 'dump']
@@ -2495,6 +2532,12 @@ class CephDriver(object):
         result = self._run_cmd_to_json(args)
         return result
 
+    def get_pg_dump_brief(self):
+        """Plain output of `ceph pg dump pgs_brief`, one line per pg."""
+        args = ['ceph', 'pg', 'dump', 'pgs_brief']
+        (out, _err) = self._backend.execute(*args)
+        return out
+
     def get_pg_status(self):
         val_list = self.get_pg_dump()
         if val_list:
@@ -2557,7 +2600,7 @@ class CephDriver(object):
 
     def _mds_summary(self, sum_dict):
         if sum_dict:
-            mdsmap = sum_dict.get('mdsmap')
+            mdsmap = dict(sum_dict.get('mdsmap'))
             mds_dict = self.get_mds_dump()
             if mds_dict:
                 mdsmap['failed'] = len(mds_dict['failed'])
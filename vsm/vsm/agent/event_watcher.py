@@ -0,0 +1,223 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Follow the cluster log with `ceph -w`.
+
+The periodic tasks notice a change of the cluster after up to one
+interval. With ceph_event_watch enabled the agent also reads the cluster
+log and calls a handler as soon as an osd, monitor, mds or health event
+shows up. The pgmap lines, several per second, are ignored. The events
+are debounced: a burst (e.g. a host with 12 osds going down) calls the
+handler once with the kinds of events seen.
+
+The periodic tasks keep running and correct anything the watcher missed.
+
+Usage from a periodic task of the host holding the service lease:
+
+    watcher.touch()
+
+The watcher stops by itself when it is not touched for keepalive seconds,
+e.g. when another host took the lease over.
+"""
+
+import re
+import time
+
+from eventlet import greenthread
+from eventlet.green import subprocess
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+from vsm import utils
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+event_watcher_opts = [
+    cfg.BoolOpt('ceph_event_watch',
+                default=False,
+                help='Follow the cluster log with `ceph -w` and update the '
+                     'summaries as soon as an event shows up.'),
+    cfg.FloatOpt('ceph_event_debounce',
+                 default=2.0,
+                 help='Seconds the watcher waits for more events before '
+                      'calling its handler.'),
+    cfg.IntOpt('ceph_event_restart_max_interval',
+               default=60,
+               help='Maximum seconds between two restarts of `ceph -w`.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(event_watcher_opts)
+
+# kind -> pattern of the cluster log lines reporting it.
+_EVENTS = (
+    ('osdmap', re.compile(r'osdmap e\d+|osd\.\d+ .*(?:boot|marked|failed)')),
+    ('monmap', re.compile(r'monmap e\d+|election|quorum')),
+    ('mdsmap', re.compile(r'mdsmap e\d+|fsmap e\d+')),
+    ('health', re.compile(r'HEALTH_|\[WRN\]|\[ERR\]')),
+)
+
+_IGNORED = re.compile(r'pgmap v\d+')
+
+# Seconds `ceph -w` gets to exit on SIGTERM before it is killed.
+_TERMINATE_TIMEOUT = 5
+
+
+def classify(line):
+    """Return the kinds of events reported by a cluster log line."""
+    if not line.strip() or _IGNORED.search(line):
+        return set()
+    return set(kind for kind, pattern in _EVENTS if pattern.search(line))
+
+
+class EventWatcher(object):
+    """Run `ceph -w` and call handler with the kinds of events seen.
+
+    :param handler: callable taking a set of kinds of events ('osdmap',
+                    'monmap', 'mdsmap', 'health').
+    :param keepalive: seconds without touch() after which the watcher
+                      stops.
+    """
+
+    def __init__(self, handler, keepalive, debounce=None, cmd=None):
+        self._handler = handler
+        self._keepalive = keepalive
+        if debounce is None:
+            debounce = CONF.ceph_event_debounce
+        self._debounce = debounce
+        self._cmd = cmd or ['ceph', '-w']
+        self._thread = None
+        self._proc = None
+        self._timer = None
+        self._watchdog = None
+        self._pending = set()
+        self._touched_at = 0
+
+    def running(self):
+        return self._thread is not None
+
+    def touch(self):
+        """Start the watcher if needed and keep it running."""
+        self._touched_at = time.time()
+        if self._thread is None:
+            LOG.info('Start watching the cluster log.')
+            self._thread = greenthread.spawn(self._run)
+        if self._watchdog is None:
+            self._watchdog = greenthread.spawn_after(self._keepalive,
+                                                     self._check)
+
+    def _check(self):
+        # `ceph -w` may stay quiet for long, do not rely on its output.
+        self._watchdog = None
+        if self._expired():
+            self.stop()
+        elif self._thread is not None:
+            self._watchdog = greenthread.spawn_after(self._keepalive,
+                                                     self._check)
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        LOG.info('Stop watching the cluster log.')
+        self._kill()
+        for timer in (self._timer, self._watchdog):
+            if timer is not None and timer is not greenthread.getcurrent():
+                timer.cancel()
+        self._timer = None
+        self._watchdog = None
+        self._pending = set()
+        if thread is not greenthread.getcurrent():
+            thread.kill()
+
+    def _expired(self):
+        return time.time() - self._touched_at > self._keepalive
+
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        # SIGTERM first: sudo relays it to rootwrap and `ceph -w`, it
+        # cannot relay a SIGKILL and would leave them running as root.
+        try:
+            if proc.poll() is None:
+                proc.terminate()
+                deadline = time.time() + _TERMINATE_TIMEOUT
+                while proc.poll() is None and time.time() < deadline:
+                    greenthread.sleep(0.1)
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+        except OSError:
+            pass
+        proc.stdout.close()
+
+    def _run(self):
+        interval = 1
+        while self._thread is not None and not self._expired():
+            started = time.time()
+            try:
+                self._follow()
+            except Exception, e:
+                LOG.warn('Watching the cluster log failed: %s' % e)
+            self._kill()
+            if self._thread is None or self._expired():
+                break
+            # Reset the backoff once `ceph -w` ran for a while.
+            if time.time() - started > CONF.ceph_event_restart_max_interval:
+                interval = 1
+            LOG.debug('Restart `ceph -w` in %s seconds.' % interval)
+            greenthread.sleep(interval)
+            interval = min(interval * 2, CONF.ceph_event_restart_max_interval)
+        if self._thread is greenthread.getcurrent():
+            self.stop()
+
+    def _follow(self):
+        self._proc = subprocess.Popen(map(str, utils.root_command(*self._cmd)),
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      close_fds=True)
+        self._proc.stdin.close()
+        while True:
+            line = self._proc.stdout.readline()
+            if not line or self._expired():
+                return
+            kinds = classify(line)
+            if kinds:
+                LOG.debug('Cluster log event %s: %s' %
+                          (sorted(kinds), line.strip()))
+                self._queue(kinds)
+
+    def _queue(self, kinds):
+        self._pending.update(kinds)
+        if self._timer is None:
+            self._timer = greenthread.spawn_after(self._debounce, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        kinds, self._pending = self._pending, set()
+        if not kinds:
+            return
+        try:
+            self._handler(kinds)
+        except Exception, e:
+            LOG.warn('Handling cluster log events %s failed: %s' %
+                     (sorted(kinds), e))
@@ -37,15 +37,25 @@ from vsm.openstack.common import log as logging
 from vsm.openstack.common import timeutils
 from vsm.conductor import rpcapi as conductor_rpcapi
 from vsm.agent import driver
+from vsm.agent import capacity_collector
 from vsm.agent import cephconfigparser
+from vsm.agent import cluster_snapshot
+from vsm.agent import delta_tracker
+from vsm.agent import event_watcher
+from vsm.agent import pg_tracker
+from vsm.agent import smart_cache
 from vsm.manifest.parser import ManifestParser
 from vsm.manifest import sys_info
+from vsm.openstack.common.periodic_task import lease_holder
 from vsm.openstack.common.periodic_task import periodic_task
 from vsm.openstack.common.rpc import common as rpc_exc
 from vsm.agent import rpcapi as agent_rpc
 from vsm import context
 
+import copy
 import operator
+from eventlet import greenpool
+from eventlet import greenthread
 from crushmap_parser import CrushMap
 import glob
 CTXT = context.get_admin_context()
@@ -81,6 +91,24 @@ class AgentManager(manager.Manager):
         self._context = context.get_admin_context()
         self._driver = driver.DbDriver()
         self.ceph_driver = driver.CephDriver()
+        self._snapshot = cluster_snapshot.ClusterSnapshot(
+            self.ceph_driver._run_cmd_to_json)
+        self._osd_state_tracker = delta_tracker.DeltaTracker('osd_name')
+        self._osd_weight_tracker = delta_tracker.DeltaTracker('osd_name')
+        self._capacity_collector = capacity_collector.CapacityCollector(
+            lambda: self._snapshot.get('osd df'))
+        self._pool_tracker = delta_tracker.DeltaTracker('name')
+        self._pool_usage_tracker = delta_tracker.DeltaTracker('pool_id')
+        self._pg_tracker = pg_tracker.PgTracker(
+            self.ceph_driver.get_pg_dump_brief)
+        self._smart_cache = smart_cache.SmartCache(
+            lambda device: self.ceph_driver.get_smart_info(self._context,
+                                                           device))
+        self._event_watcher = event_watcher.EventWatcher(
+            self._handle_cluster_events,
+            keepalive=3 * _get_interval_time('ceph_status'))
+        # host -> number of checks in a row without a fresh heartbeat
+        self._node_suspects = {}
         self.crushmap_driver = driver.CreateCrushMapDriver()
         self.crushmap_manager_driver = driver.ManagerCrushMapDriver()
         self.diamond_driver= driver.DiamondDriver()
@@ -104,6 +132,42 @@ class AgentManager(manager.Manager):
     def test_service(self, context):
         return {'status': 'ok'}
 
+    def get_cluster_snapshot_stats(self, context):
+        return self._snapshot.stats()
+
+    def _reset_osd_trackers(self):
+        """Push every osd and device row on the next runs."""
+        self._osd_state_tracker.reset()
+        self._osd_weight_tracker.reset()
+        self._capacity_collector.reset()
+
+    def reset_osd_trackers(self, context):
+        self._reset_osd_trackers()
+
+    def _request_osd_resync(self, context):
+        """Have the host running the periodic tasks push every osd row.
+
+        Only the lease holder pushes the osd and device rows, its
+        trackers must forget them after the rows were rewritten here.
+        """
+        holder = lease_holder(context, FLAGS.agent_topic)
+        if holder == self.host:
+            self._reset_osd_trackers()
+        elif holder:
+            self._agent_rpcapi.reset_osd_trackers(context, holder)
+        # Nobody holds the lease: the next holder resets on taking it.
+
+    def on_lease_acquired(self, context, service_topic):
+        """Push every row again, another host may have written newer ones."""
+        if service_topic != FLAGS.agent_topic:
+            return
+        LOG.info('Took the agent lease, push the full cluster state.')
+        self._reset_osd_trackers()
+        self._pool_tracker.reset()
+        self._pool_usage_tracker.reset()
+        # The next pg dump is persisted in full, missing pgs deleted.
+        self._pg_tracker.reset()
+
     def _get_cluster_ref(self):
         controller_ip = self._node_info['controller_ip']
         # Find cluster_ref below.
@@ -373,8 +437,12 @@ class AgentManager(manager.Manager):
         finally:
             self._is_update_ssh = False
     def get_smart_info(self, context, device):
-        """When find new servers, insert new server's key."""
-        return self.ceph_driver.get_smart_info(context, device)
+        """SMART data of a disk of this node, from the SMART cache."""
+        return self._smart_cache.get(device)
+
+    def get_smart_history(self, context, device):
+        """Samples of the key SMART attributes of a disk of this node."""
+        return self._smart_cache.history(device)
 
     def _set_ssh_chanel(self):
         # Get self id from init_node table.
@@ -568,14 +636,8 @@ class AgentManager(manager.Manager):
     def update_keyring_admin_from_db(self, context):
         """Update /etc/ceph/keyring.admin file from DB."""
         LOG.info('update_keyring_admin_from_db()')
-        try_times = 1
-        info_dict = self._get_info_dict(context)
-        while not info_dict:
-            info_dict = self._get_info_dict(context)
-            try_times = try_times + 1
-            time.sleep(1)
-            if try_times > 4:
-                break
+        info_dict = utils.wait_for(lambda: self._get_info_dict(context),
+                                   timeout=4, name='keyring in DB') or {}
 
         keyring_admin = info_dict.get('keyring_admin', None)
         if keyring_admin:
@@ -615,13 +677,9 @@ class AgentManager(manager.Manager):
 
     def mkcephfs(self, context):
         self._is_init_ceph = True
-        try_times = 0
-        while self._is_update_ssh:
-            time.sleep(1)
-            try_times = try_times + 1
-            LOG.info('Wait for update ssh keys.')
-            if try_times > 60:
-                break
+        LOG.info('Wait for update ssh keys.')
+        utils.wait_for(lambda: not self._is_update_ssh, timeout=60,
+                       name='ssh keys update')
 
         status = self.ceph_driver.mkcephfs()
         LOG.info('Begin to update keyring admin into DB.')
@@ -656,7 +714,16 @@ class AgentManager(manager.Manager):
 
     def add_monitor(self, context, host_id, mon_id):
         res = self.ceph_driver.add_monitor(context, host_id, mon_id)
-        time.sleep(15)
+
+        def _in_quorum():
+            try:
+                status = self.ceph_driver.track_monitors(mon_id)
+            except Exception:
+                return False
+            return status.get('state') in ('leader', 'peon')
+
+        utils.wait_for(_in_quorum, timeout=FLAGS.mon_quorum_wait_timeout,
+                       name='mon.%s in quorum' % mon_id)
         LOG.info("update mon health begin")
         self.update_mon_health(context)
         LOG.info("update mon health end")
@@ -951,6 +1018,7 @@ class AgentManager(manager.Manager):
                                     umount_path)
         _update_osd_db()
         _update_device_db()
+        self._request_osd_resync(context)
         return True
 
     def osd_restart(self, context, osd_id):
@@ -962,6 +1030,7 @@ class AgentManager(manager.Manager):
 
     def osd_restore(self, context, osd_id):
         self.ceph_driver.osd_restore(context, osd_id)
+        self._request_osd_resync(context)
         return True
 
     def osd_refresh(self, context):
@@ -1156,11 +1225,11 @@ class AgentManager(manager.Manager):
     @periodic_task(service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_osd_dump'))
     def update_osds_status(self, context):
-        osd_json = self.ceph_driver.get_osds_status()
-        if osd_json is None:
+        osd_dict = self._snapshot.get('osd dump')
+        if not osd_dict:
             return None
-        osd_dict = json.loads(osd_json)
         osd_list = osd_dict['osds']
+        values_list = []
         for osd in osd_list:
             osd_num = osd['osd']
             osd_name = 'osd.' + (str(osd_num))
@@ -1178,11 +1247,22 @@ class AgentManager(manager.Manager):
             values = {}
             values['osd_name'] = osd_name
             values['state'] = osd_status
-            self._conductor_rpcapi.\
-                osd_state_update(context, values)
+            values_list.append(values)
+        values_list = self._osd_state_tracker.changes(values_list)
+        if values_list:
+            self._conductor_rpcapi.osd_state_update_batch(context,
+                                                          values_list)
+        self._osd_state_tracker.commit()
+
     @periodic_task(service_topic=FLAGS.agent_topic,
-                   spacing=10)
+                   spacing=FLAGS.metrics_retention_interval)
     def clean_performance_history_data(self, context):
+        """Remove the performance metrics older than the retention.
+
+        The expired days are dropped when the table is partitioned, the
+        remaining rows are deleted in batches with a pause between them
+        so the inserts of diamond are not blocked for long.
+        """
         key = 'keep_performance_data_days'
         setting = db.vsm_settings_get_by_name(CTXT, key)
         if setting:
@@ -1190,7 +1270,40 @@ class AgentManager(manager.Manager):
         else:
             days = '7'
             db.vsm_settings_update_or_create(context, {'name':key,'value':days})
-        db.clean_performance_history_data(context,days)
+        before = int(time.time()) - int(days) * 24 * 3600
+
+        if FLAGS.metrics_partition_by_day:
+            result = db.metrics_partition_rotate(
+                context, before, FLAGS.metrics_partition_days_ahead)
+            if result is None:
+                LOG.warn('metrics_partition_by_day needs mysql, the expired '
+                         'metrics are deleted by rows.')
+            elif result['dropped'] or result['added']:
+                LOG.info('Metrics partitions dropped: %s (about %s rows), '
+                         'added: %s' % (result['dropped'], result['rows'],
+                                        result['added']))
+
+        deleted = 0
+        batch_size = FLAGS.metrics_retention_batch_size
+        for batch in range(FLAGS.metrics_retention_max_batches):
+            if batch:
+                greenthread.sleep(FLAGS.metrics_retention_batch_pause)
+            count = db.metrics_delete_before(context, before, batch_size)
+            deleted += count
+            if count < batch_size:
+                break
+        else:
+            LOG.info('More expired metrics left for the next run.')
+        if deleted:
+            LOG.info('Deleted %s metrics older than %s days.' % (deleted, days))
+
+    @periodic_task(service_topic=FLAGS.agent_topic,
+                   spacing=60)
+    def rollup_performance_metrics(self, context):
+        """Downsample the new performance metrics."""
+        result = db.metric_rollup_refresh(context)
+        LOG.debug('Metric rollups (rolled up, deleted) per resolution: %s'
+                  % result)
 
     #@require_active_host
     @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
@@ -1202,7 +1315,8 @@ class AgentManager(manager.Manager):
         #LOG.debug('osd_state info : %s' % osd_states)
         if osd_states:
             #LOG.debug('Update crush weight.')
-            osd_names = [osd.osd_name for osd in osd_states]
+            osd_names = set([osd.osd_name for osd in osd_states])
+            values_list = []
             for osd in weight_list:
                 name = osd.get('name')
                 if name and name in osd_names:
@@ -1210,40 +1324,49 @@ class AgentManager(manager.Manager):
                     values['osd_name'] = name
                     values['weight'] = osd.get('crush_weight')
                     values['osd_location'] = osd.get('osd_location')
-                    #LOG.debug('update crush weight values: %s' % values)
-                    self._conductor_rpcapi.\
-                        osd_state_update_or_create(context, values, create=False)
+                    values_list.append(values)
+            values_list = self._osd_weight_tracker.changes(values_list)
+            if values_list:
+                self._conductor_rpcapi.osd_state_update_batch(context,
+                                                              values_list)
+            self._osd_weight_tracker.commit()
 
     #@require_active_host
     @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_pg_dump_osds'))
     def update_device_capacity(self, context):
-        capacity_list = self.ceph_driver.get_osd_capacity()
-        #LOG.debug('capacity list : %s' % capacity_list)
-        devices = db.device_get_all(context)
-
-        if devices:
-            #LOG.debug('Update osd capacity.')
-            #device_names = dict([(dev.get('name'), dev.get('id')) for dev in devices])
-            #LOG.debug('device id and name dict: %s' % device_names)
-            osd_states = db.osd_state_get_all(context)
-            osd_names = dict([(osd_state.get('osd_name'), osd_state.get("device_id"))
-                              for osd_state in osd_states])
-            #LOG.debug('device id and osd name dict: %s' % osd_names)
-            for osd in capacity_list:
-                osd_id = osd.get('osd', None)
-                if isinstance(osd_id, int):
-                    osd_name = 'osd.' + (str(osd_id))
-                    #LOG.debug('osd name in db %s' % osd_name)
-                    if osd_name in osd_names.keys():
-                        values = dict()
-                        values['id'] = osd_names.get(osd_name)
-                        values['total_capacity_kb'] = osd.get('kb')
-                        values['used_capacity_kb'] = osd.get('kb_used')
-                        values['avail_capacity_kb'] = osd.get('kb_avail')
-                        #LOG.debug('update device capacity values: %s' % values)
-                        self._conductor_rpcapi.\
-                            device_update_or_create(context, values, create=False)
+        osd_states = db.osd_state_get_all(context)
+        if not osd_states:
+            return
+        device_ids = dict([(osd_state.get('osd_name'),
+                            osd_state.get('device_id'))
+                           for osd_state in osd_states])
+        settings = db.vsm_settings_get_all(context)
+        settings = dict([(setting['name'], setting['value'])
+                         for setting in settings])
+
+        def _ratio(name):
+            try:
+                return float(settings[name]) / 100
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        values_list = self._capacity_collector.refresh(
+            device_ids,
+            near_full_ratio=_ratio('disk_near_full_threshold'),
+            full_ratio=_ratio('disk_full_threshold'))
+        if values_list is None:
+            return
+        if values_list:
+            self._conductor_rpcapi.device_update_batch(context, values_list)
+        self._capacity_collector.commit()
+
+        cluster_id = self._get_cluster_id(context)
+        if cluster_id:
+            val = {'summary_data':
+                   json.dumps(self._capacity_collector.summary())}
+            db.summary_update(context, cluster_id,
+                              FLAGS.summary_type_osd_capacity, val)
 
     def _compute_pg_num(self, context, osd_num, replication_num):
         """compute pg_num"""
@@ -1344,7 +1467,10 @@ class AgentManager(manager.Manager):
                    service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_osd_dump'))
     def update_pool_status(self, context):
-        ceph_list = self.ceph_driver.get_pool_status()
+        osd_dict = self._snapshot.get('osd dump')
+        if not osd_dict:
+            return None
+        ceph_list = osd_dict.get('pools')
         cluster_id = self._get_cluster_id(context)
         db_pools = self._conductor_rpcapi.list_storage_pool(context)
 
@@ -1391,6 +1517,7 @@ class AgentManager(manager.Manager):
             values = {}
             if pool.get('pg_num') > pool.get('pg_placement_num'):
                 self.ceph_driver.set_pool_pgp_num(context, pool['pool_name'], pool['pg_num'])
+                self._snapshot.invalidate('osd dump')
                 values['pg_num'] = pool['pg_num']
                 values['pgp_num'] = pool['pg_num']
             if pool.get('erasure_code_profile'):
@@ -1399,12 +1526,10 @@ class AgentManager(manager.Manager):
                 db.pool_update_by_pool_id(context, pool['pool'], values)
 
         # If both in ceph/db. Update info in db.
-        upd_pools = []
-        for p in ceph_list:
-            if p['pool_name'] in db_names:
-                upd_pools.append(p)
-
-        for pool in upd_pools:
+        upd_list = []
+        for pool in ceph_list:
+            if pool['pool_name'] not in db_names:
+                continue
             values = {
                'pool_id': pool.get('pool'),
                'name': pool.get('pool_name'),
@@ -1415,40 +1540,44 @@ class AgentManager(manager.Manager):
                'crush_ruleset': pool.get('crush_ruleset'),
                'crash_replay_interval': pool.get('crash_replay_interval')
             }
+            upd_list.append(values)
+
+        # Pools just added or deleted are always pushed.
+        if deleted_pools or add_pools:
+            self._pool_tracker.reset()
+        for values in self._pool_tracker.changes(upd_list):
             self._conductor_rpcapi.update_storage_pool_by_name(context,
-                pool.get('pool_name'), cluster_id, values)
+                values['name'], cluster_id, values)
+        self._pool_tracker.commit()
 
     #@require_active_host
     @periodic_task(run_immediately=True,
                    service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('rbd_ls_-l_{pool_name}'))
     def update_rbd_status(self, context):
-        rbd_list = self.ceph_driver.get_rbd_status()
-        rbd_image_list = []
-        for rbd in rbd_list:
-            rbd_image = rbd['image']
-            rbd_image_list.append(rbd_image)
-        # rbd_list = rbd_list[:100]
         old_rbd_list = self._conductor_rpcapi.rbd_get_all(context,
                                                           None,
                                                           None,
                                                           None,
                                                           None)
-        for old_rbd in old_rbd_list:
-            old_rbd_image = old_rbd["image"]
-            if old_rbd_image and old_rbd_image not in rbd_image_list:
-                deleted_at = timeutils.utcnow()
-                old_rbd["deleted_at"] = deleted_at
-                old_rbd["deleted"] = 1
-                db.rbd_update_or_create(context, old_rbd)
-        for rbd in rbd_list:
-            db.rbd_update_or_create(context, rbd)
+        rbd_list = self.ceph_driver.get_rbd_status(known=old_rbd_list)
+        if rbd_list is None:
+            return
+
+        # The images not found in ceph any more.
+        found = set([(rbd['pool'], rbd['image']) for rbd in rbd_list])
+        deleted_ids = [rbd['id'] for rbd in old_rbd_list
+                       if (rbd['pool'], rbd['image']) not in found]
+        result = db.rbd_update_or_create_batch(context, rbd_list)
+        db.rbd_destroy_batch(context, deleted_ids)
+        LOG.debug('update rbd status: %s, %s deleted' %
+                  (result, len(deleted_ids)))
 
     #@require_active_host
     @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_osd_pool_stats'))
     def update_pool_stats(self, context):
-        pool_stats = self.ceph_driver.get_pool_stats()
+        pool_stats = self._snapshot.get('osd pool stats')
         #TODO: need to list pools by cluster id
         pools = self._conductor_rpcapi.list_storage_pool(context)
         if pools:
@@ -1472,8 +1601,8 @@ class AgentManager(manager.Manager):
     def update_mds_status(self, context):
         mds_list = self.ceph_driver.get_mds_status()
         if mds_list:
+            db.mds_bulk_upsert(context, mds_list, delete_missing=False)
             for mds in mds_list:
-                db.mds_update_or_create(context, mds)
                 address = mds['address'].split(':')
                 if len(address)>0:
                     LOG.info('mds addresss========%s'%address[0])
@@ -1483,46 +1612,72 @@ class AgentManager(manager.Manager):
                         db.init_node_update(context,node['id'],values)
 
     #@require_active_host
-    #@periodic_task(run_immediately=True,
-    #               service_topic=FLAGS.agent_topic,
-    #               spacing=_get_interval_time('ceph_pg_dump_pgs_brief'))
+    @periodic_task(run_immediately=True,
+                   service_topic=FLAGS.agent_topic,
+                   spacing=_get_interval_time('ceph_pg_dump_pgs_brief'))
     def update_pg_status(self, context):
-        pg_list = self.ceph_driver.get_pg_status()
-        if pg_list:
-            for pg in pg_list:
-                db.pg_update_or_create(context, pg)
+        changed, removed = self._pg_tracker.refresh()
+        if changed is None:
+            return
+
+        if self._pg_tracker.full_resync():
+            # Also drops the rows of pgs the agent never saw.
+            db.pg_bulk_upsert(context, changed, delete_missing=True)
+        else:
+            if changed:
+                db.pg_bulk_upsert(context, changed, delete_missing=False)
+            if removed:
+                db.pg_destroy_by_pgids(context, removed)
+        self._pg_tracker.commit()
+
+        cluster_id = self._get_cluster_id(context)
+        if cluster_id:
+            pg_state = {'num_pgs': self._pg_tracker.num_pgs(),
+                        'pgs_by_state': self._pg_tracker.pgs_by_state(),
+                        'num_changed': len(changed),
+                        'num_removed': len(removed)}
+            val = {'summary_data': json.dumps(pg_state)}
+            db.summary_update(context, cluster_id,
+                              FLAGS.summary_type_pg_state, val)
 
     #@require_active_host
     @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_pg_dump_osds'))
     def update_pool_usage(self, context):
-        pool_usage = self.ceph_driver.get_pool_usage()
+        pool_usage = self._snapshot.get('pg dump pools')
         #TODO: need to list pools by cluster id
         pools = self._conductor_rpcapi.list_storage_pool(context)
         if pools:
             #LOG.debug('Update pool usage.')
             pool_ids = [pool.get('pool_id') for pool in pools.values()]
+            values_list = []
             for usage in pool_usage:
                 pid = usage.get('poolid')
                 if pid in pool_ids:
                     values = usage.get('stat_sum')
                     if values:
+                        values = dict(values)
                         values['pool_id'] = pid
-                        #LOG.debug('pool usage values %s ' % values)
-                        self._conductor_rpcapi.update_storage_pool(context, pid, values)
+                        values_list.append(values)
                     else:
                         LOG.info('No stat sum for pool %s.' % pid)
                 else:
                     LOG.info('pool %s does not exist in the existing pool list.' % pid)
+            for values in self._pool_usage_tracker.changes(values_list):
+                self._conductor_rpcapi.update_storage_pool(context,
+                                                           values['pool_id'],
+                                                           values)
+            self._pool_usage_tracker.commit()
 
     #@require_active_host
     @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
                    spacing=_get_interval_time('ceph_status'))
     def update_mon_health(self, context):
-        ceph_status = self.ceph_driver.get_ceph_status()
+        ceph_status = self._snapshot.get('status')
         LOG.debug(ceph_status)
         mons_address = dict([(x['name'], x['addr']) for x in ceph_status.get('monmap').get('mons')])
-        health_stat = self.ceph_driver.get_mon_health()
+        # The entries below are modified in place, work on a copy.
+        health_stat = copy.deepcopy(self._snapshot.get('health'))
         LOG.debug(health_stat)
         if health_stat:
             mon_stat = health_stat.get('timechecks').get('mons')
@@ -1553,6 +1708,7 @@ class AgentManager(manager.Manager):
                 mons = ceph_status.get("monmap").get("mons")
                 for mon in mons:
                     if not mon.get("name") in monitor_names_in_ceph:
+                        mon = dict(mon)
                         mon['skew'] = 0
                         mon['latency'] = 0
                         mon['health'] = "-"
@@ -1560,7 +1716,7 @@ class AgentManager(manager.Manager):
 
     def _sync_mon_list(self, context):
         try:
-            ceph_status = self.ceph_driver.get_ceph_status()
+            ceph_status = self._snapshot.get('status')
             monitor_names_in_ceph = [x['name'] for x in ceph_status['monmap']['mons']]
             monitor_names_in_db = [mon.name for mon in db.monitor_get_all(context)]
             LOG.debug(monitor_names_in_ceph)
@@ -1572,9 +1728,10 @@ class AgentManager(manager.Manager):
 
     def update_summary(self, context, sum_type=None):
         cluster_id = self._get_cluster_id(context)
-        sum_dict = self.ceph_driver.get_ceph_status()
-        health_list = self.ceph_driver.get_ceph_health_list()
-        sum_dict['health_list'] =  health_list
+        sum_dict = self._snapshot.get('status')
+        if sum_dict:
+            sum_dict = dict(sum_dict)
+            sum_dict['health_list'] = self.ceph_driver.get_ceph_health_list()
         sum_opts = [ opt.default for opt in flags.summary_type_opts ]
         sum_types = []
 
@@ -1598,74 +1755,79 @@ class AgentManager(manager.Manager):
 
     @periodic_task(service_topic=FLAGS.agent_topic, spacing=FLAGS.server_ping_time)
     def update_server_status(self, context):
-        """Update server status in every 5 seconds."""
+        """Mark nodes unavailable, or back up, from the agent heartbeats.
+
+        Every agent writes a heartbeat in the services table. A node whose
+        heartbeat is older than node_down_heartbeat_age for
+        node_down_confirm_count checks in a row is probed over RPC, and
+        marked unavailable if the probe fails. An unavailable node whose
+        heartbeat is younger than node_up_heartbeat_age gets back its
+        previous status once a probe succeeds.
+        """
         def _try_connect(host):
             try:
                 self._agent_rpcapi.test_service(context,
                                                 FLAGS.agent_topic,
                                                 host)
                 return True
-            except rpc_exc.Timeout, rpc_exc.RemoteError:
+            except (rpc_exc.Timeout, rpc_exc.RemoteError):
                 return False
             except:
                 return False
 
-        def _thread_func_for_unavailable(host, node_id, pre_status):
-            if _try_connect(host):
+        def _probe_down(node):
+            if not _try_connect(node['host']):
+                LOG.warn('Node %s is not reachable, mark it unavailable.' %
+                         node['host'])
                 db.init_node_update_status_by_id(context,
-                                                 node_id,
-                                                 pre_status)
-            else:
-                for i in range(10):
-                    if _try_connect(host):
-                        db.init_node_update_status_by_id(context,
-                                                         node_id,
-                                                         pre_status)
-                        break
+                                                 node['id'],
+                                                 'unavailable')
+                self._node_suspects.pop(node['host'], None)
 
-        def _thread_func_for_other(host, node_id, pre_status):
-            if not _try_connect(host):
-                error_num = 0
-                for i in range(10):
-                    if not _try_connect(host):
-                        error_num += 1
-                if error_num > 8:
-                    db.init_node_update_status_by_id(context,
-                                                     node_id,
-                                                     'unavailable')
-
-        nodes = db.init_node_get_all(context)
-        unav_list = []
-        health_list = []
-        for node in nodes:
-            if not node.get('host', None):
+        def _probe_up(node):
+            if _try_connect(node['host']):
+                LOG.info('Node %s is back.' % node['host'])
+                db.init_node_update_status_by_id(context,
+                                                 node['id'],
+                                                 node.get('pre_status'))
+
+        now = timeutils.utcnow()
+        heartbeats = {}
+        for ser in db.service_get_all_by_topic(context, FLAGS.agent_topic):
+            last_heartbeat = ser['updated_at'] or ser['created_at']
+            heartbeats[ser['host']] = \
+                abs(utils.total_seconds(now - last_heartbeat))
+
+        suspects = self._node_suspects
+        probes = []
+        hosts = set()
+        for node in db.init_node_get_all(context):
+            host = node.get('host', None)
+            if not host:
                 continue
+            hosts.add(host)
+            age = heartbeats.get(host)
 
             if node.get('status', None) == 'unavailable':
-                unav_list.append(node)
+                suspects.pop(host, None)
+                if age is not None and age <= FLAGS.node_up_heartbeat_age:
+                    probes.append((_probe_up, node))
+            elif age is not None and age <= FLAGS.node_down_heartbeat_age:
+                suspects.pop(host, None)
             else:
-                health_list.append(node)
+                suspects[host] = suspects.get(host, 0) + 1
+                if suspects[host] >= FLAGS.node_down_confirm_count:
+                    probes.append((_probe_down, node))
 
-        nav_list = []
-        for node in unav_list:
-            host = node.get('host', None)
-            node_id = node.get('id', None)
-            pre_status = node.get('pre_status', None)
-            thd = utils.MultiThread(_thread_func_for_unavailable,
-                                    host, node_id, pre_status)
-            nav_list.append(thd)
-
-        hel_list = []
-        for node in health_list:
-            host = node.get('host', None)
-            node_id = node.get('id', None)
-            pre_status = node.get('pre_status', None)
-            thd = utils.MultiThread(_thread_func_for_other,
-                                    host, node_id, pre_status)
-            hel_list.append(thd)
+        for host in suspects.keys():
+            if host not in hosts:
+                del suspects[host]
 
-        utils.start_threads(nav_list)
-        utils.start_threads(hel_list)
+        if probes:
+            pool = greenpool.GreenPool(max(1, FLAGS.node_probe_workers))
+            for probe, node in probes:
+                pool.spawn_n(probe, node)
+            pool.waitall()
 
         """
         Ignore mds migration
@@ -1684,6 +1846,19 @@ class AgentManager(manager.Manager):
             self._agent_rpcapi.add_mds(context, active_host['host'])
         """
 
+    @periodic_task(run_immediately=True,
+                   spacing=FLAGS.smart_refresh_interval)
+    def update_smart_cache(self, context):
+        """Refresh the SMART data of the disks of this node."""
+        if not self._service_id:
+            return
+        devices = db.device_get_all_by_service_id(context, self._service_id)
+        paths = []
+        for device in devices:
+            paths.append(device['path'])
+            paths.append(device['journal'])
+        self._smart_cache.refresh(paths)
+
     @periodic_task(spacing=FLAGS.update_time_interval)
     def update_node_datetime(self, context):
         """Update the update-at of each node in db with current time."""
@@ -1699,6 +1874,24 @@ class AgentManager(manager.Manager):
             except exception.ExeCmdError, e:
                 LOG.error("%s:%s" % (e.code, e.message))
 
+    @periodic_task(run_immediately=True, service_topic=FLAGS.agent_topic,
+                   spacing=_get_interval_time('ceph_status'))
+    def watch_cluster_events(self, context):
+        """Keep `ceph -w` running on the host holding the lease."""
+        if not FLAGS.ceph_event_watch:
+            return
+        if db.pool_get_all(context):
+            self._event_watcher.touch()
+
+    def _handle_cluster_events(self, kinds):
+        """Update the summaries after events of the cluster log."""
+        LOG.info('Cluster log events: %s' % ', '.join(sorted(kinds)))
+        self._snapshot.invalidate('status')
+        self._snapshot.invalidate('health')
+        self.update_ceph_status(self._context)
+        if 'monmap' in kinds or 'health' in kinds:
+            self.update_mon_health(self._context)
+
     @periodic_task(service_topic=FLAGS.agent_topic, spacing=_get_interval_time('ceph_status'))
     def update_ceph_status(self, context):
         all_pool = db.pool_get_all(context)
@@ -1712,6 +1905,7 @@ class AgentManager(manager.Manager):
             is_active = True
             try:
                 sum_dict = __get_ceph_status()
+                self._snapshot.put('status', sum_dict)
                 ceph_status = sum_dict['health']['overall_status']
                 ceph_status = {'is_ceph_active': is_active,
                                'health_list': [ceph_status, ceph_status]}
@@ -1725,8 +1919,7 @@ class AgentManager(manager.Manager):
                                'health': 'CRITICAL_ERROR'}
                 return json.dumps(ceph_status), is_active
 
-        while not self._cluster_id:
-            time.sleep(10)
+        utils.wait_for(lambda: self._cluster_id, name='cluster id')
 
         cluster_id = self._cluster_id
         sum_dict, is_active = _ceph_status()
@@ -1775,15 +1968,16 @@ class AgentManager(manager.Manager):
         devices = db.device_get_all_by_service_id(context,self._service_id)
         dev_used_by_ceph = [dev.journal for dev in devices]
         available_disk_info_list = []
-        name_by_path_dict = self.ceph_driver.get_disks_name_by_path_dict(available_disk_name)
-        name_by_uuid_dict = self.ceph_driver.get_disks_name_by_uuid_dict(available_disk_name)
+        inventory = self.ceph_driver.get_disk_inventory(context)
         for disk in available_disk_name:
-            by_path_name = name_by_path_dict.get(disk,'')
-            by_uuid_name = name_by_uuid_dict.get(disk,'')
+            by_path_name = inventory[disk]['by_path'] or ''
+            by_uuid_name = inventory[disk]['by_uuid'] or ''
             if not disk in dev_used_by_ceph and not by_path_name in dev_used_by_ceph and not by_uuid_name in dev_used_by_ceph:
                 available_disk_info_list.append({'disk_name':disk,
                                                  'by_path':by_path_name,
-                                                 'by_uuid':by_uuid_name,})
+                                                 'by_uuid':by_uuid_name,
+                                                 'size':inventory[disk]['size'],
+                                                 'rotational':inventory[disk]['rotational'],})
         LOG.info('available_disk_info_list=====%s'%available_disk_info_list)
         return available_disk_info_list
 
@@ -1796,9 +1990,14 @@ class AgentManager(manager.Manager):
                     disk['data'] = key
                 if value == disk['journal']:
                     disk['journal'] = key
+        osd_ids = []
+        for disk in body['osdinfo']:
             osd_id = self.add_disk_to_db(context,disk)
-            self.osd_add(context,osd_id)
-        return True
+            if osd_id is not None:
+                osd_ids.append(osd_id)
+        if not osd_ids:
+            return True
+        return self.ceph_driver.add_osds(context, None, osd_ids=osd_ids)
 
     def add_disk_to_db(self,context,device_info):
         """add disk into devices."""
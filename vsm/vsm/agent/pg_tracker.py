@@ -0,0 +1,151 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Track the state of every placement group of the cluster.
+
+`ceph pg dump pgs_brief` is read in plain format, one line per pg, so a
+dump of 100k+ pgs never becomes a json object tree. Each pg is kept as a
+(state, up, acting) tuple keyed by pgid, and a refresh only reports the
+pgs whose tuple changed and the pgids which disappeared. The number of
+pgs per state is maintained along the way.
+
+Usage from a periodic task:
+
+    changed, removed = tracker.refresh()
+    push(changed, removed)
+    tracker.commit()
+"""
+
+import cStringIO
+import re
+import time
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+FLAGS.import_opt('state_full_resync_interval', 'vsm.agent.delta_tracker')
+
+_PGID_RE = re.compile(r'^\d+\.[0-9a-f]+$')
+
+
+def _osd_set(field):
+    """'[0,1,2]' -> '0,1,2', the format stored in the DB."""
+    return field.strip('[]')
+
+
+def iter_pgs_brief(out):
+    """Yield (pgid, state, up, acting) for each line of a plain pgs_brief.
+
+    The lines look like
+        pg_stat  state         up     up_primary  acting  acting_primary
+        1.0      active+clean  [0,1]  0           [0,1]   0
+    the header and any other line not starting with a pgid are skipped.
+    """
+    for line in cStringIO.StringIO(out):
+        fields = line.split()
+        if len(fields) < 5 or not _PGID_RE.match(fields[0]):
+            continue
+        yield (fields[0], intern(fields[1]),
+               _osd_set(fields[2]), _osd_set(fields[4]))
+
+
+class PgTracker(object):
+    """Index of the placement groups by pgid.
+
+    :param fetch: callable returning the plain output of
+                  `ceph pg dump pgs_brief`, e.g. CephDriver.get_pg_dump_brief.
+    :param resync_interval: seconds between two refreshes reporting every
+                            pg, even unchanged ones.
+    """
+
+    def __init__(self, fetch, resync_interval=None):
+        self._fetch = fetch
+        if resync_interval is None:
+            resync_interval = FLAGS.state_full_resync_interval
+        self._resync_interval = resync_interval
+        self._index = {}
+        self._counts = {}
+        self._pending = None
+        self._last_resync = 0
+
+    def _resync_due(self):
+        return time.time() - self._last_resync >= self._resync_interval
+
+    def full_resync(self):
+        """True if the last refresh() reported every pg."""
+        return self._pending is not None and self._pending[2]
+
+    def refresh(self):
+        """Read the pg dump and compare it with the index.
+
+        :returns: a (changed, removed) tuple, changed being a list of dicts
+                  with pgid, state, up and acting and removed a list of
+                  pgids; or (None, None) if the dump could not be read.
+        """
+        out = self._fetch()
+        if not out:
+            return None, None
+
+        full = self._resync_due()
+        index = {}
+        counts = {}
+        changed = []
+        for pgid, state, up, acting in iter_pgs_brief(out):
+            pg = (state, up, acting)
+            index[pgid] = pg
+            counts[state] = counts.get(state, 0) + 1
+            if full or self._index.get(pgid) != pg:
+                changed.append({'pgid': pgid,
+                                'state': state,
+                                'up': up,
+                                'acting': acting})
+        if not index:
+            LOG.warn('No placement group found in the pg dump.')
+            return None, None
+
+        removed = [pgid for pgid in self._index if pgid not in index]
+        self._pending = (index, counts, full)
+        LOG.debug('%s of %s pgs changed, %s removed.' %
+                  (len(changed), len(index), len(removed)))
+        return changed, removed
+
+    def commit(self):
+        """Record the dump read by the last refresh() as pushed."""
+        if self._pending is None:
+            return
+        self._index, self._counts, full = self._pending
+        if full:
+            self._last_resync = time.time()
+        self._pending = None
+
+    def reset(self):
+        """Forget every pg, the next refresh() reports all of them."""
+        self._index = {}
+        self._counts = {}
+        self._pending = None
+        self._last_resync = 0
+
+    def pgs_by_state(self):
+        """Number of pgs per state, in the format of `ceph status`."""
+        return [{'state_name': state, 'count': count}
+                for state, count in sorted(self._counts.iteritems())]
+
+    def num_pgs(self):
+        return len(self._index)
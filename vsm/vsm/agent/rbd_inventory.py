@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Collect the rbd images of every pool.
+
+Images are listed in bulk with one `rbd_ls <pool>` per pool, several pools
+at a time. `rbd info` is only needed for the object order of an image,
+which never changes, so it is run once per image the collector has not
+seen yet (the orders already stored in the DB can be handed in).
+"""
+
+from eventlet import greenpool
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+rbd_inventory_opts = [
+    cfg.IntOpt('rbd_inventory_workers',
+               default=4,
+               help='Number of pools whose rbd images are listed at '
+                    'the same time.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(rbd_inventory_opts)
+
+
+def count_objects(size, order):
+    """Number of objects of an image, as reported by `rbd info`."""
+    obj_size = 1 << order
+    return (size + obj_size - 1) // obj_size
+
+
+class RbdInventory(object):
+    """List rbd images through a CephDriver.
+
+    :param driver: CephDriver providing get_osd_lspools, get_rbd_lsimages
+                   and get_rbd_image_info.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+        self._orders = {}
+
+    def _list_pool(self, pool):
+        images = self._driver.get_rbd_lsimages(pool) or []
+        rbd_list = []
+        for image in images:
+            key = (pool, image['image'])
+            order = self._orders.get(key)
+            if order is None:
+                info = self._driver.get_rbd_image_info(image['image'], pool)
+                if not info:
+                    continue
+                order = info['order']
+                self._orders[key] = order
+            rbd_list.append({'pool': pool,
+                             'image': image['image'],
+                             'size': image['size'],
+                             'format': image['format'],
+                             'objects': count_objects(image['size'], order),
+                             'order': order})
+        return rbd_list
+
+    def collect(self, known=None):
+        """Return every rbd image of the cluster.
+
+        :param known: rbd rows from the DB; their order is reused instead
+                      of running `rbd info` again.
+        :returns: a list of dicts with pool, image, size, format, objects
+                  and order, or None if there is no pool.
+        """
+        for rbd in known or []:
+            if rbd.get('order') is not None:
+                self._orders.setdefault((rbd['pool'], rbd['image']),
+                                        rbd['order'])
+
+        pool_list = self._driver.get_osd_lspools()
+        if not pool_list:
+            return None
+
+        workers = greenpool.GreenPool(max(1, CONF.rbd_inventory_workers))
+        rbd_list = []
+        names = [pool['poolname'] for pool in pool_list]
+        for images in workers.imap(self._list_pool, names):
+            rbd_list.extend(images)
+
+        # Forget the images which are gone, a new image may reuse the name.
+        seen = set([(rbd['pool'], rbd['image']) for rbd in rbd_list])
+        for key in self._orders.keys():
+            if key not in seen:
+                del self._orders[key]
+        LOG.debug('Found %s rbd images in %s pools.' %
+                  (len(rbd_list), len(names)))
+        return rbd_list
@@ -46,6 +46,12 @@ class AgentAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
         ret = self.call(ctxt, self.make_msg('test_service'), topic, timeout=30, need_try=False)
         return ret
 
+    def get_cluster_snapshot_stats(self, ctxt, host):
+        topic = rpc.queue_get_for(ctxt, self.topic, host)
+        return self.call(ctxt,
+                         self.make_msg('get_cluster_snapshot_stats'),
+                         topic)
+
     def update_pool_info(self, ctxt, body=None):
         res = self.cast(ctxt, self.make_msg('update_pool_info', body=body))
 
@@ -245,6 +251,13 @@ class AgentAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
                         self.make_msg('get_smart_info', device=device),
                         topic, version='1.0', timeout=6000)
         return res
+    def get_smart_history(self, context, host, device):
+        topic = rpc.queue_get_for(context, self.topic, host)
+        self.test_service(context, topic)
+        res = self.call(context,
+                        self.make_msg('get_smart_history', device=device),
+                        topic, version='1.0', timeout=6000)
+        return res
     def create_crushmap(self, context, server_list, host):
         topic = rpc.queue_get_for(context, self.topic, host)
         self.test_service(context, topic)
@@ -383,6 +396,10 @@ class AgentAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
         topic = rpc.queue_get_for(context, self.topic, host)
         self.cast(context, self.make_msg('update_osd_state'), topic)
 
+    def reset_osd_trackers(self, context, host):
+        topic = rpc.queue_get_for(context, self.topic, host)
+        self.cast(context, self.make_msg('reset_osd_trackers'), topic)
+
     def update_pool_state(self, context, host):
         topic = rpc.queue_get_for(context, self.topic, host)
         return self.call(context, self.make_msg('update_pool_state'), topic)
@@ -536,6 +553,7 @@ class AgentAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
                                       body=body),
                         topic,
                         version='1.0', timeout=6000)
+        return res
 
     def reconfig_diamond(self, context, body, host):
         topic = rpc.queue_get_for(context, self.topic, host)
@@ -0,0 +1,181 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache the SMART data of the disks of a node.
+
+Reading SMART data takes three `smartctl` runs per disk, too slow for an
+RPC answering the dashboard. The agent refreshes every disk of the node
+in the background, a few disks at a time, and the RPC reads the cache.
+
+Each refresh also appends the values of a few key attributes (reallocated
+sectors, temperature ...) to a bounded per-disk history, to chart their
+trend without running smartctl again.
+"""
+
+import collections
+import time
+
+from eventlet import greenpool
+from oslo.config import cfg
+
+from vsm import flags
+from vsm.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+smart_cache_opts = [
+    cfg.IntOpt('smart_refresh_interval',
+               default=300,
+               help='Interval (secs) the agent looks for disks whose '
+                    'SMART data is older than smart_cache_ttl.'),
+    cfg.IntOpt('smart_cache_ttl',
+               default=1800,
+               help='Seconds the SMART data of a disk is served from the '
+                    'cache before smartctl is run again.'),
+    cfg.IntOpt('smart_cache_workers',
+               default=4,
+               help='Number of disks whose SMART data is read at the same '
+                    'time.'),
+    cfg.IntOpt('smart_history_size',
+               default=336,
+               help='Number of samples of the key SMART attributes kept '
+                    'per disk.'),
+    cfg.ListOpt('smart_history_attributes',
+                default=['Reallocated_Sector_Ct',
+                         'Current_Pending_Sector',
+                         'Offline_Uncorrectable',
+                         'UDMA_CRC_Error_Count',
+                         'Temperature_Celsius',
+                         'Power_On_Hours'],
+                help='SMART attributes whose values are kept in the '
+                     'history.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(smart_cache_opts)
+
+_BASIC_FIELDS = ('Drive Family', 'Serial Number', 'Firmware Version',
+                 'Drive Status')
+
+
+def _to_number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class _Entry(object):
+    """SMART data of one disk, kept as tuples rather than dicts."""
+
+    __slots__ = ('fetched_at', 'basic', 'smart')
+
+    def __init__(self, info):
+        self.fetched_at = time.time()
+        basic = info.get('basic') or {}
+        self.basic = tuple(basic.get(field, '') for field in _BASIC_FIELDS)
+        self.smart = tuple(sorted((intern(str(name)), value) for name, value
+                                  in (info.get('smart') or {}).iteritems()))
+
+    def as_dict(self):
+        """The format of CephDriver.get_smart_info."""
+        return {'basic': dict(zip(_BASIC_FIELDS, self.basic)),
+                'smart': dict(self.smart)}
+
+
+class SmartCache(object):
+    """SMART data of the disks of a node, keyed by device path.
+
+    :param fetch: callable taking a device path and returning the SMART
+                  data as a dict with 'basic' and 'smart' keys, e.g.
+                  CephDriver.get_smart_info without the context.
+    """
+
+    def __init__(self, fetch, ttl=None):
+        self._fetch = fetch
+        self._ttl = ttl if ttl is not None else CONF.smart_cache_ttl
+        self._entries = {}
+        self._history = {}
+
+    def _stale(self, device):
+        entry = self._entries.get(device)
+        return entry is None or time.time() - entry.fetched_at >= self._ttl
+
+    def _load(self, device):
+        try:
+            info = self._fetch(device)
+        except Exception, e:
+            LOG.warn('Can not read SMART data of %s: %s' % (device, e))
+            return None
+        entry = _Entry(info or {})
+        self._entries[device] = entry
+        self._record(device, entry)
+        return entry
+
+    def _record(self, device, entry):
+        history = self._history.get(device)
+        if history is None:
+            history = self._history[device] = \
+                collections.deque(maxlen=max(1, CONF.smart_history_size))
+        smart = dict(entry.smart)
+        history.append((int(entry.fetched_at),
+                        tuple(_to_number(smart.get(name))
+                              for name in CONF.smart_history_attributes)))
+
+    def refresh(self, devices):
+        """Read the SMART data of the devices not read for ttl seconds.
+
+        The devices not in the list are forgotten.
+        :returns: the number of devices read.
+        """
+        devices = set(device for device in devices if device)
+        for device in self._entries.keys():
+            if device not in devices:
+                del self._entries[device]
+                self._history.pop(device, None)
+
+        stale = [device for device in devices if self._stale(device)]
+        if not stale:
+            return 0
+        workers = greenpool.GreenPool(max(1, CONF.smart_cache_workers))
+        loaded = len([entry for entry in workers.imap(self._load, stale)
+                      if entry is not None])
+        LOG.debug('Read SMART data of %s of %s disks.' %
+                  (loaded, len(devices)))
+        return loaded
+
+    def get(self, device):
+        """Return the SMART data of a device, reading it on a miss."""
+        entry = self._entries.get(device)
+        if entry is None:
+            entry = self._load(device)
+            if entry is None:
+                return {'basic': dict.fromkeys(_BASIC_FIELDS, ''),
+                        'smart': {}}
+        return entry.as_dict()
+
+    def history(self, device):
+        """Return the samples of the key attributes of a device.
+
+        :returns: a dict with the attribute names and a list of
+                  [timestamp, value, value, ...] lists, oldest first.
+        """
+        return {'attributes': list(CONF.smart_history_attributes),
+                'samples': [[at] + list(values) for at, values
+                            in self._history.get(device, [])]}
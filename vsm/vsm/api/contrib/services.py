@@ -23,6 +23,9 @@ from vsm.api import xmlutil
 from vsm import db
 from vsm import exception
 from vsm.openstack.common import log as logging
+from vsm.openstack.common import rpc
+from vsm.openstack.common.rpc import common as rpc_common
+from vsm.openstack.common.rpc import proxy as rpc_proxy
 from vsm.openstack.common import timeutils
 from vsm import utils
 
@@ -117,6 +120,35 @@ class ServiceController(object):
 
         return {'host': host, 'service': service, 'disabled': disabled}
 
+    def periodic_task_stats(self, req):
+        """Return the periodic task counters of one service.
+
+        The host and service (binary) query parameters are required.
+        """
+        context = req.environ['vsm.context']
+        authorize(context)
+
+        host = req.GET.get('host')
+        service = req.GET.get('service')
+        if not host or not service:
+            raise webob.exc.HTTPBadRequest("host and service are required")
+
+        try:
+            svc = db.service_get_by_args(context, host, service)
+        except exception.HostBinaryNotFound:
+            raise webob.exc.HTTPNotFound('Unknown service')
+
+        proxy = rpc_proxy.RpcProxy(topic=svc['topic'],
+                                   default_version='1.0')
+        topic = rpc.queue_get_for(context, svc['topic'], host)
+        try:
+            stats = proxy.call(context,
+                               proxy.make_msg('get_periodic_task_stats'),
+                               topic, timeout=30, need_try=False)
+        except rpc_common.Timeout:
+            raise webob.exc.HTTPServiceUnavailable()
+        return {'host': host, 'service': service, 'periodic_tasks': stats}
+
 class Services(extensions.ExtensionDescriptor):
     """Services support"""
 
@@ -127,7 +159,8 @@ class Services(extensions.ExtensionDescriptor):
 
     def get_resources(self):
         resources = []
-        resource = extensions.ResourceExtension('os-services',
-                                                ServiceController())
+        resource = extensions.ResourceExtension(
+            'os-services', ServiceController(),
+            collection_actions={'periodic_task_stats': 'GET'})
         resources.append(resource)
         return resources
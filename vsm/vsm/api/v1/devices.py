@@ -16,6 +16,8 @@
 # specific language governing permissions and limitations
 # under the License.
 
+from webob import exc
+
 from vsm.api.openstack import wsgi
 from vsm.api import xmlutil
 from vsm import flags
@@ -105,6 +107,18 @@ class Controller(wsgi.Controller):
                 LOG.info('get smart device info = %s:%s'%(device_path,device_data_dict))
         return {'smart_info':device_data_dict}
 
+    def get_smart_history(self, req):
+        """Get the samples of the key SMART attributes of a device."""
+        context = req.environ['vsm.context']
+        device_id = req.GET.get('device_id', None)
+        device_path = req.GET.get('device_path', None)
+        if not device_id or not device_path:
+            raise exc.HTTPBadRequest()
+        body = {'server': db.init_node_get_by_device_id(context, device_id),
+                'device_path': device_path}
+        smart_history = self.scheduler_api.get_smart_history(context, body)
+        return {'smart_history': smart_history}
+
     def get_available_disks(self,req,):
         context = req.environ['vsm.context']
         server_id = req.GET.get('server_id',None)
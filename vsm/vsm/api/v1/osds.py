@@ -264,6 +264,18 @@ class Controller(wsgi.Controller):
         vb = summary_view.ViewBuilder()
         return vb.basic(sum, 'osd')
 
+    def capacity_summary(self, req, cluster_id=None):
+        """Utilization of the osds, as computed from `ceph osd df`."""
+        context = req.environ['vsm.context']
+        stype = FLAGS.summary_type_osd_capacity
+        if cluster_id:
+            sum = db.summary_get_by_cluster_id_and_type(context, cluster_id,
+                                                        stype)
+        else:
+            sum = db.summary_get_by_type_first(context, stype)
+        vb = summary_view.ViewBuilder()
+        return vb.basic(sum, 'osd_capacity')
+
 def create_resource(ext_mgr):
     return wsgi.Resource(Controller(ext_mgr))
 
@@ -79,6 +79,8 @@ class PerformanceMetricsController(wsgi.Controller):
         search_opts.update(req.GET)
         context = req.environ['vsm.context']
         search_opts ['metrics_name'] = 'osd_%s'%search_opts['metrics_name']
+        # Answered from a rollup when the raw samples give too many points.
+        search_opts.setdefault('max_points', FLAGS.metrics_max_points)
         metrics = self.conductor_api.get_sum_performance_metrics(context, search_opts=search_opts)
         LOG.info("CEPH_LOG get performance metrics  iops or banwidth  by search opts: %s" % search_opts)
         return {"metrics": metrics}
@@ -89,16 +91,28 @@ class PerformanceMetricsController(wsgi.Controller):
         search_opts.update(req.GET)
         context = req.environ['vsm.context']
         search_opts ['metrics_name'] = 'osd_%s'%search_opts['metrics_name']
+        search_opts.setdefault('max_points', FLAGS.metrics_max_points)
         metrics = self.conductor_api.get_latency(context, search_opts=search_opts)
         LOG.info("CEPH_LOG get performance metrics  latency  by search opts: %s" % search_opts)
         return {"metrics": metrics}
 
+    def get_latencies(self, req):
+        """Read, write and read/write latency together."""
+        search_opts = {}
+        search_opts.update(req.GET)
+        context = req.environ['vsm.context']
+        search_opts.setdefault('max_points', FLAGS.metrics_max_points)
+        metrics = self.conductor_api.get_latencies(context, search_opts=search_opts)
+        LOG.info("CEPH_LOG get performance metrics  latencies  by search opts: %s" % search_opts)
+        return {"metrics": metrics}
+
     def get_cpu_usage(self, req):
         """get_cpu_usage"""
         search_opts = {}
         search_opts.update(req.GET)
         context = req.environ['vsm.context']
         search_opts ['metrics_name'] = search_opts['metrics_name']
+        search_opts.setdefault('max_points', FLAGS.metrics_max_points)
         metrics = self.conductor_api.get_cpu_usage(context, search_opts=search_opts)
         LOG.info("CEPH_LOG get performance metrics  cpu_usage  by search opts: %s" % search_opts)
         return {"metrics": metrics}
@@ -147,6 +147,18 @@ class Controller(wsgi.Controller):
         vb = summary_view.ViewBuilder()
         return vb.basic(sum, 'placement_group')
 
+    def state_summary(self, req, cluster_id=None):
+        """Number of pgs per state, as counted by the agent pg tracker."""
+        context = req.environ['vsm.context']
+        stype = FLAGS.summary_type_pg_state
+        if cluster_id:
+            sum = db.summary_get_by_cluster_id_and_type(context, cluster_id,
+                                                        stype)
+        else:
+            sum = db.summary_get_by_type_first(context, stype)
+        vb = summary_view.ViewBuilder()
+        return vb.basic(sum, 'pg_state')
+
 def create_resource(ext_mgr):
     return wsgi.Resource(Controller(ext_mgr))
 
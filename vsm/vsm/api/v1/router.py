@@ -158,6 +158,7 @@ class APIRouter(vsm.api.openstack.APIRouter):
         mapper.resource("osds", "osds",
                         controller=self.resources['osds'],
                         collection={"summary": "get",
+                                    "capacity_summary": "get",
                                     "refresh": "post",
                                     "detail": "get",
                                     "add_batch_new_disks_to_cluster":"post",
@@ -199,6 +200,7 @@ class APIRouter(vsm.api.openstack.APIRouter):
         mapper.resource("placement_groups", "placement_groups",
                         controller=self.resources['placement_groups'],
                         collection={"summary": "get",
+                                    "state_summary": "get",
                                     "detail": "get"},
                         member={'action':'POST'})
 
@@ -214,7 +216,8 @@ class APIRouter(vsm.api.openstack.APIRouter):
                         controller=self.resources['devices'],
                         collection={"detail": "get",
                                     "get_available_disks":"get",
-                                    "get_smart_info":"get",},
+                                    "get_smart_info":"get",
+                                    "get_smart_history":"get",},
                         member={'action':'POST'})
 
         self.resources['licenses'] = licenses.create_resource(ext_mgr)
@@ -238,6 +241,7 @@ class APIRouter(vsm.api.openstack.APIRouter):
                         controller=self.resources['performance_metrics'],
                         collection={"get_list": "get",
                                     "get_metrics": "get",
+                                    "get_latencies": "get",
                                     },
                         member={'action':'post'})
 
@@ -117,6 +117,39 @@ class ViewBuilder(common.ViewBuilder):
             LOG.debug('return view %s' % ret)
             return ret
 
+        elif sum_type == "osd_capacity":
+            ret = {
+                dict_root: {
+                    'num_osds': sum_data.get('num_osds', 0),
+                    'total_kb': sum_data.get('total_kb', 0),
+                    'used_kb': sum_data.get('used_kb', 0),
+                    'avail_kb': sum_data.get('avail_kb', 0),
+                    'average_utilization':
+                        sum_data.get('average_utilization', 0),
+                    'min_var': sum_data.get('min_var', 0),
+                    'max_var': sum_data.get('max_var', 0),
+                    'stddev': sum_data.get('stddev', 0),
+                    'near_full': sum_data.get('near_full', []),
+                    'full': sum_data.get('full', []),
+                    'updated_at': updated_at,
+                }
+            }
+            LOG.debug('return view %s' % ret)
+            return ret
+
+        elif sum_type == "pg_state":
+            ret = {
+                dict_root: {
+                    'num_pgs': sum_data.get('num_pgs', 0),
+                    'pgs_by_state': sum_data.get('pgs_by_state', []),
+                    'num_changed': sum_data.get('num_changed', 0),
+                    'num_removed': sum_data.get('num_removed', 0),
+                    'updated_at': updated_at,
+                }
+            }
+            LOG.debug('return view %s' % ret)
+            return ret
+
         elif sum_type == "cluster":
             ret = {
                 dict_root: {
@@ -314,6 +314,9 @@ class API(object):
     def get_latency(self, context, search_opts):
         return self.conductor_rpcapi.get_latency(context, search_opts)
 
+    def get_latencies(self, context, search_opts):
+        return self.conductor_rpcapi.get_latencies(context, search_opts)
+
     def get_cpu_usage(self, context, search_opts):
         return self.conductor_rpcapi.get_cpu_usage(context, search_opts)
 
@@ -339,6 +339,10 @@ class ConductorManager(manager.Manager):
                 return None 
         return osd_state
 
+    def osd_state_update_batch(self, context, values_list):
+        """Update osd states matched by osd_name in one transaction."""
+        db.osd_state_update_batch(context, values_list)
+
     def osd_state_count_by_init_node_id(self, context, init_node_id):
         return db.osd_state_count_by_init_node_id(context, init_node_id)
 
@@ -397,6 +401,10 @@ class ConductorManager(manager.Manager):
                                       values)
         return device
 
+    def device_update_batch(self, context, values_list):
+        """Update devices matched by id in one transaction."""
+        db.device_update_batch(context, values_list)
+
     def device_get_all_by_service_id(self, context, service_id):
         return db.device_get_all_by_service_id(context, service_id)
 
@@ -632,6 +640,9 @@ class ConductorManager(manager.Manager):
     def get_latency(self, context, search_opts):
         return db.get_latency(context, search_opts=search_opts)
 
+    def get_latencies(self, context, search_opts):
+        return db.get_latencies(context, search_opts=search_opts)
+
     def get_cpu_usage(self, context, search_opts):
         return db.get_cpu_usage(context, search_opts=search_opts)
 
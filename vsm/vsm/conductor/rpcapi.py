@@ -225,6 +225,10 @@ class ConductorAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, self.make_msg('osd_state_update_or_create', \
                          values=values, create=create), need_try=False)
 
+    def osd_state_update_batch(self, context, values_list):
+        return self.call(context, self.make_msg('osd_state_update_batch', \
+                         values_list=values_list))
+
     def osd_state_count_by_init_node_id(self, context, init_node_id):
         return self.call(context, self.\
                          make_msg('osd_state_count_by_init_node_id',\
@@ -276,6 +280,10 @@ class ConductorAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, self.make_msg('device_update_or_create', \
                          values=values, create=create))
 
+    def device_update_batch(self, context, values_list):
+        return self.call(context, self.make_msg('device_update_batch', \
+                         values_list=values_list))
+
     def device_get_all_by_service_id(self, context, service_id):
         return self.call(context, \
                          self.make_msg('device_get_all_by_service_id',\
@@ -416,6 +424,10 @@ class ConductorAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context,self.make_msg('get_latency', \
                                search_opts=search_opts))
 
+    def get_latencies(self, context, search_opts):
+        return self.call(context,self.make_msg('get_latencies', \
+                               search_opts=search_opts))
+
     def get_cpu_usage(self, context, search_opts):
         return self.call(context,self.make_msg('get_cpu_usage', \
                                search_opts=search_opts))
@@ -1017,6 +1017,10 @@ def osd_state_update(context, id, values):
 def osd_state_update_or_create(context, values):
     return IMPL.osd_state_update_or_create(context, values)
 
+def osd_state_update_batch(context, values_list):
+    """Update a list of osd states, each matched by its osd_name."""
+    return IMPL.osd_state_update_batch(context, values_list)
+
 def osd_state_count_by_init_node_id(context, init_node_id):
     return IMPL.osd_state_count_by_init_node_id(context, init_node_id)
 
@@ -1089,6 +1093,10 @@ def device_get_distinct_storage_class_by_service_id(context, service_id):
 def device_update_or_create(context, values):
     return IMPL.device_update_or_create(context, values)
 
+def device_update_batch(context, values_list):
+    """Update a list of devices, each matched by its id."""
+    return IMPL.device_update_batch(context, values_list)
+
 def device_get_by_name_and_journal_and_service_id(context, name, \
                                                 journal, service_id):
     return IMPL.device_get_by_name_and_journal_and_service_id(context, \
@@ -1193,6 +1201,16 @@ def pg_update(context, pg_id, values):
 def pg_update_or_create(context, values):
     return IMPL.pg_update_or_create(context, values)
 
+def pg_bulk_upsert(context, values_list, delete_missing=True):
+    """Create, update and, if delete_missing, soft delete placement groups
+    so the table matches values_list. Rows are matched by pgid."""
+    return IMPL.pg_bulk_upsert(context, values_list,
+                               delete_missing=delete_missing)
+
+def pg_destroy_by_pgids(context, pgids):
+    """Soft delete the placement groups whose pgid is in pgids."""
+    return IMPL.pg_destroy_by_pgids(context, pgids)
+
 #rbd
 def rbd_create(context, values):
     return IMPL.rbd_create(context, values)
@@ -1210,6 +1228,14 @@ def rbd_update(context, rbd_id, values):
 def rbd_update_or_create(context, values):
     return IMPL.rbd_update_or_create(context, values)
 
+def rbd_update_or_create_batch(context, values_list):
+    """Create or update a list of rbds, each matched by pool and image."""
+    return IMPL.rbd_update_or_create_batch(context, values_list)
+
+def rbd_destroy_batch(context, rbd_ids):
+    """Mark the rbds of the given ids as deleted."""
+    return IMPL.rbd_destroy_batch(context, rbd_ids)
+
 #region license status ops
 def license_status_create(context, values):
     return IMPL.license_status_create(context, values)
@@ -1238,6 +1264,12 @@ def mds_update(context, mds_id, values):
 def mds_update_or_create(context, values):
     return IMPL.mds_update_or_create(context, values)
 
+def mds_bulk_upsert(context, values_list, delete_missing=True):
+    """Create, update and, if delete_missing, soft delete mdses so the
+    table matches values_list. Rows are matched by name."""
+    return IMPL.mds_bulk_upsert(context, values_list,
+                                delete_missing=delete_missing)
+
 #region vsm settings db api
 def vsm_settings_update_or_create(context, values):
     return IMPL.vsm_settings_update_or_create(context, values)
@@ -1285,12 +1317,39 @@ def get_sum_performance_metrics(context, search_opts):
 def get_latency(context, search_opts):
     return IMPL.latency_performance_metrics(context, search_opts=search_opts)
 
+def get_latencies(context, search_opts):
+    """Read, write and read/write latency of the osds."""
+    return IMPL.latency_performance_metrics_all(context, search_opts=search_opts)
+
 def get_cpu_usage(context, search_opts):
     return IMPL.cpu_data_get_usage(context, search_opts=search_opts)
 
-def clean_performance_history_data(context,days):
-    return IMPL.clean_performance_history_data(context,days)
+def metrics_delete_before(context, timestamp, limit):
+    """Delete up to limit metrics older than timestamp."""
+    return IMPL.metrics_delete_before(context, timestamp, limit)
+
+def metrics_partition_rotate(context, timestamp, days_ahead):
+    """Drop the daily metrics partitions older than timestamp."""
+    return IMPL.metrics_partition_rotate(context, timestamp, days_ahead)
+
+def metric_rollup_refresh(context):
+    """Roll the new metrics up and drop the expired rollups."""
+    return IMPL.metric_rollup_refresh(context)
 
 def get_poolusage(context, poolusage_id):
     return IMPL.get_poolusage(context, poolusage_id=poolusage_id)
 #endregion
+
+#region periodic task lease
+def lease_acquire(context, name, holder, duration):
+    """Take or renew a lease for duration seconds, return its holder."""
+    return IMPL.lease_acquire(context, name, holder, duration)
+
+def lease_release(context, name, holder):
+    """Give a lease back before it expires."""
+    return IMPL.lease_release(context, name, holder)
+
+def lease_get(context, name):
+    """Return a lease with its holder and expiry, None if never taken."""
+    return IMPL.lease_get(context, name)
+#endregion
@@ -17,13 +17,16 @@
 
 """Implementation of SQLAlchemy backend."""
 
+import bisect
 import json
 import datetime
 import uuid
 import warnings
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import literal_column
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql import func
@@ -2996,6 +2999,147 @@ def osd_state_update_or_create(context, values):
         result.save(session=session)
         return result
 
+def _chunks(items, size):
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+def _bulk_update(session, model, key, values_list, chunk_size=500):
+    """Update the not deleted rows of model whose `key` column matches.
+
+    Rows getting exactly the same new values are updated together by
+    UPDATE ... WHERE key IN (...), the other rows by one executemany
+    UPDATE per set of columns. Keys not found in the table are ignored.
+    """
+    table = model.__table__
+    now = timeutils.utcnow()
+    groups = {}
+    for values in values_list:
+        key_value = values[key]
+        values = dict([(k, v) for k, v in values.iteritems()
+                       if k in table.c and k not in (key, 'id')])
+        values['updated_at'] = now
+        groups.setdefault(tuple(sorted(values.items())), []).append(key_value)
+
+    singles = {}
+    for items, keys in groups.iteritems():
+        if len(keys) > 1:
+            for chunk in _chunks(keys, chunk_size):
+                session.execute(table.update().
+                                where(and_(table.c[key].in_(chunk),
+                                           table.c.deleted == False)).
+                                values(dict(items)))
+        else:
+            columns = tuple([k for k, v in items])
+            row = dict([('b_' + k, v) for k, v in items])
+            row['b_match_key'] = keys[0]
+            singles.setdefault(columns, []).append(row)
+
+    for columns, rows in singles.iteritems():
+        stmt = table.update().\
+            where(and_(table.c[key] == bindparam('b_match_key'),
+                       table.c.deleted == False)).\
+            values(dict([(c, bindparam('b_' + c)) for c in columns]))
+        for chunk in _chunks(rows, chunk_size):
+            session.execute(stmt, chunk)
+
+def _bulk_insert(session, model, values_list, chunk_size=500):
+    """Insert rows with one executemany INSERT per chunk."""
+    table = model.__table__
+    now = timeutils.utcnow()
+    for chunk in _chunks(values_list, chunk_size):
+        rows = []
+        for values in chunk:
+            row = dict([(k, v) for k, v in values.iteritems()
+                        if k in table.c and k != 'id'])
+            row.update({'created_at': now, 'deleted': False})
+            rows.append(row)
+        session.execute(table.insert(), rows)
+
+def _bulk_soft_delete(session, model, ids, chunk_size=500):
+    table = model.__table__
+    now = timeutils.utcnow()
+    for chunk in _chunks(list(ids), chunk_size):
+        session.execute(table.update().
+                        where(table.c.id.in_(chunk)).
+                        values(deleted=True, deleted_at=now, updated_at=now))
+
+def _bulk_upsert(context, model, keys, values_list, delete_missing=False,
+                 create=True):
+    """Reconcile the not deleted rows of model with values_list.
+
+    Rows are matched on the `keys` columns. Matched rows are updated only
+    if one of the given columns changed, unmatched values are inserted
+    (if create) and, if delete_missing, rows matching no values are soft
+    deleted. Everything runs in one transaction with a bounded number of
+    statements, so the cost follows the number of changed rows.
+
+    :returns: a dict with the number of created, updated and deleted rows.
+    """
+    table = model.__table__
+    columns = set()
+    for values in values_list:
+        columns.update([k for k in values.iterkeys()
+                        if k in table.c and k != 'id'])
+    columns = sorted(columns - set(keys))
+    # Label the id, keys may contain it too.
+    selected = [table.c.id.label('row_id')] + \
+               [table.c[k] for k in keys] + [table.c[c] for c in columns]
+
+    session = get_session()
+    with session.begin():
+        existing = {}
+        query = table.select().with_only_columns(selected).\
+            where(table.c.deleted == False)
+        if delete_missing:
+            chunks = [None]
+        else:
+            # Only the rows sharing the first key with the input matter.
+            chunks = _chunks(list(set([values[keys[0]]
+                                       for values in values_list])), 500)
+        for chunk in chunks:
+            stmt = query
+            if chunk is not None:
+                stmt = query.where(table.c[keys[0]].in_(chunk))
+            for row in session.execute(stmt).fetchall():
+                row = list(row)
+                existing[tuple(row[1:len(keys) + 1])] = \
+                    (row[0], row[len(keys) + 1:])
+
+        update_list = []
+        create_list = []
+        for values in values_list:
+            key = tuple([values[k] for k in keys])
+            if key in existing:
+                id, old = existing.pop(key)
+                if [values.get(c, o) for c, o in zip(columns, old)] != old:
+                    values = dict(values)
+                    values['id'] = id
+                    update_list.append(values)
+            elif create:
+                create_list.append(values)
+
+        _bulk_update(session, model, 'id', update_list)
+        _bulk_insert(session, model, create_list)
+        deleted_ids = []
+        if delete_missing:
+            deleted_ids = [id for (id, old) in existing.itervalues()]
+            _bulk_soft_delete(session, model, deleted_ids)
+
+    return {'created': len(create_list),
+            'updated': len(update_list),
+            'deleted': len(deleted_ids)}
+
+def osd_state_update_batch(context, values_list):
+    """Update many osd states, matched by osd_name, in one transaction.
+
+    Only rows whose values changed are written. osd states need a device,
+    service, zone and storage group, so rows are never created here.
+    """
+    if not values_list:
+        return
+    return _bulk_upsert(context, models.OsdState, ['osd_name'], values_list,
+                        create=False)
+
 def osd_state_count_by_init_node_id(context, init_node_id):
     init_node_ref = init_node_get_by_id(context, init_node_id)
     result = model_query(context,
@@ -3211,6 +3355,16 @@ def device_update_or_create(context, values):
         result.save(session=session)
         return result
 
+def device_update_batch(context, values_list):
+    """Update many devices, matched by id, in one transaction.
+
+    Only rows whose values changed are written.
+    """
+    if not values_list:
+        return
+    return _bulk_upsert(context, models.Device, ['id'], values_list,
+                        create=False)
+
 def zone_update_or_create(context, values):
     session = get_session()
     with session.begin():
@@ -3547,7 +3701,8 @@ def sp_usage_destroy(context, id, session=None):
 #endregion
 
 #region summary
-summary_type = ['osd', 'pg', 'mds', 'mon', 'cluster', 'vsm', 'ceph']
+summary_type = ['osd', 'osd_capacity', 'pg', 'pg_state', 'mds', 'mon',
+                'cluster', 'vsm', 'ceph']
 
 def validate_summary_type(stype):
     if not stype or stype not in summary_type:
@@ -3784,6 +3939,26 @@ def pg_update_or_create(context, values, session=None):
         pg = pg_create(context, values)
     return pg
 
+def pg_bulk_upsert(context, values_list, delete_missing=True):
+    """Reconcile the placement group table with values_list by pgid."""
+    return _bulk_upsert(context, models.PlacementGroup, ['pgid'], values_list,
+                        delete_missing=delete_missing)
+
+def pg_destroy_by_pgids(context, pgids, chunk_size=500):
+    table = models.PlacementGroup.__table__
+    now = timeutils.utcnow()
+    deleted = 0
+    session = get_session()
+    with session.begin():
+        for chunk in _chunks(list(pgids), chunk_size):
+            result = session.execute(table.update().
+                                     where(and_(table.c.pgid.in_(chunk),
+                                                table.c.deleted == False)).
+                                     values(deleted=True, deleted_at=now,
+                                            updated_at=now))
+            deleted += result.rowcount
+    return deleted
+
 #rbd
 def rbd_create(context, values):
     rbd_ref = models.RBD()
@@ -3865,6 +4040,28 @@ def rbd_update_or_create(context, values, session=None):
         rbd = rbd_create(context, values)
     return rbd
 
+def rbd_update_or_create_batch(context, values_list):
+    """Create or update rbds, matched by pool and image, in one transaction.
+
+    Only the rows of which a column changed are written.
+    """
+    return _bulk_upsert(context, models.RBD, ['pool', 'image'], values_list)
+
+def rbd_destroy_batch(context, rbd_ids):
+    """Soft delete the rbds of the given ids."""
+    if not rbd_ids:
+        return
+    table = models.RBD.__table__
+    now = timeutils.utcnow()
+    session = get_session()
+    with session.begin():
+        for chunk in _chunks(list(rbd_ids), 500):
+            session.execute(table.update().
+                            where(table.c.id.in_(chunk)).
+                            values(deleted=True,
+                                   deleted_at=now,
+                                   updated_at=now))
+
 #region license status query
 def license_status_create(context, values, session=None):
 
@@ -3964,6 +4161,11 @@ def mds_update_or_create(context, values, session=None):
         mds = mds_create(context, values)
     return mds
 
+def mds_bulk_upsert(context, values_list, delete_missing=True):
+    """Reconcile the mds table with values_list, matched by name."""
+    return _bulk_upsert(context, models.MDS, ['name'], values_list,
+                        delete_missing=delete_missing)
+
 #region vsm settings db ops
 
 def _vsm_settings_query(context, session=None):
@@ -4133,11 +4335,46 @@ def ec_profile_get_by_name(context, name, session=None):
         filter_by(name=name).\
         first()
 
+def _metric_dimension_ids(kind, names, session=None):
+    """name -> id of the metric dimensions of a kind, unknown names left out."""
+    names = list(set(names))
+    if not names:
+        return {}
+    table = models.MetricDimension.__table__
+    session = session or get_session()
+    rows = session.execute(
+        table.select().with_only_columns([table.c.name, table.c.id]).
+        where(and_(table.c.kind == kind, table.c.name.in_(names)))).fetchall()
+    return dict((row[0], row[1]) for row in rows)
+
+def _metric_dimension_names(ids, session=None):
+    """id -> name of the metric dimensions."""
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    table = models.MetricDimension.__table__
+    session = session or get_session()
+    names = {}
+    for chunk in _chunks(ids, 500):
+        rows = session.execute(
+            table.select().with_only_columns([table.c.id, table.c.name]).
+            where(table.c.id.in_(chunk))).fetchall()
+        names.update((row[0], row[1]) for row in rows)
+    return names
+
+def _metric_id(metrics_name, session=None):
+    return _metric_dimension_ids('metric', [metrics_name],
+                                 session=session).get(metrics_name)
+
 def get_max_timestamp_by_metrics_name(context, metrics_name, session=None):
-    session = get_session()
-    sql_str = "select max(timestamp) from metrics where metric='%s'"%metrics_name
-    sql_ret = session.execute(sql_str).fetchall()
-    return sql_ret[0][0]
+    session = session or get_session()
+    metric_id = _metric_id(metrics_name, session=session)
+    if metric_id is None:
+        return None
+    table = models.CephPerformanceMetric.__table__
+    return session.execute(
+        table.select().with_only_columns([func.max(table.c.timestamp)]).
+        where(table.c.metric_id == metric_id)).scalar()
 
 def performance_metrics_query(context, search_opts, session=None):
     metrics_name = search_opts.has_key('metrics_name') and search_opts['metrics_name'] or ''
@@ -4145,17 +4382,290 @@ def performance_metrics_query(context, search_opts, session=None):
     timestamp_start = search_opts.has_key('timestamp_start') and search_opts['timestamp_start'] or None
     timestamp_end = search_opts.has_key('timestamp_end') and search_opts['timestamp_end'] or None
 
-    metrics_query = model_query(
-        context, models.CephPerformanceMetric, read_deleted='yes', session=session)
+    session = session or get_session()
+    table = models.CephPerformanceMetric.__table__
+    query = table.select().with_only_columns(
+        [table.c.id, table.c.metric_id, table.c.host_id, table.c.instance_id,
+         table.c.value, table.c.timestamp])
     if metrics_name:
-        metrics_query = metrics_query.filter(models.CephPerformanceMetric.metric==metrics_name)
+        metric_id = _metric_id(metrics_name, session=session)
+        if metric_id is None:
+            return []
+        query = query.where(table.c.metric_id == metric_id)
     if host_name:
-        metrics_query = metrics_query.filter(models.CephPerformanceMetric.hostname==host_name)
+        host_id = _metric_dimension_ids('host', [host_name],
+                                        session=session).get(host_name)
+        if host_id is None:
+            return []
+        query = query.where(table.c.host_id == host_id)
     if timestamp_start:
-        metrics_query = metrics_query.filter(models.CephPerformanceMetric.timestamp>timestamp_start)
+        query = query.where(table.c.timestamp > int(timestamp_start))
     if timestamp_end:
-        metrics_query = metrics_query.filter(models.CephPerformanceMetric.timestamp<timestamp_end)
-    return metrics_query.all()
+        query = query.where(table.c.timestamp < int(timestamp_end))
+    rows = session.execute(query).fetchall()
+
+    dimension_ids = set()
+    for row in rows:
+        dimension_ids.update(row[1:4])
+    names = _metric_dimension_names(dimension_ids, session=session)
+    return [{'id': row[0],
+             'metric': names.get(row[1]),
+             'hostname': names.get(row[2]),
+             'instance': names.get(row[3]),
+             'value': row[4],
+             'timestamp': row[5]} for row in rows]
+
+def _metric_rollup_config():
+    """[(resolution, days), ...] of FLAGS.metric_rollups, finest first."""
+    config = []
+    for item in FLAGS.metric_rollups:
+        resolution, _sep, days = item.partition(':')
+        config.append((int(resolution), int(days or 0)))
+    return sorted(config)
+
+def _metric_resolution(context, interval, timestamp_start, timestamp_end,
+                       max_points, session=None):
+    """Pick the resolution answering a time range.
+
+    The raw samples (one per interval) or a rollup: the finest one giving
+    at most max_points points whose data still reaches back to
+    timestamp_start, else the coarsest rollup.
+    """
+    config = [(r, d) for r, d in _metric_rollup_config() if r > interval]
+    if not max_points or not config or timestamp_end <= timestamp_start:
+        return interval
+    setting_ref = vsm_settings_get_by_name(context, 'keep_performance_data_days', session=session)
+    raw_days = setting_ref and int(setting_ref['value']) or FLAGS.keep_performance_data_days
+    now = time.time()
+    span = timestamp_end - timestamp_start
+    for resolution, days in [(interval, raw_days)] + config:
+        if days and timestamp_start < now - days * 24 * 3600:
+            continue
+        if span / resolution <= int(max_points):
+            return resolution
+    return config[-1][0]
+
+def _first_metric_bucket(session, resolution, source, after):
+    """Start of the first bucket with samples of source at or after `after`.
+
+    source is None for the raw metrics, else the resolution of the
+    rollups to read.
+    """
+    if source is None:
+        table = models.CephPerformanceMetric.__table__
+        where = table.c.timestamp >= after
+    else:
+        table = models.MetricRollup.__table__
+        where = and_(table.c.resolution == source, table.c.timestamp >= after)
+    first = session.execute(
+        table.select().with_only_columns([func.min(table.c.timestamp)]).
+        where(where)).scalar()
+    if first is None:
+        return None
+    return first - first % resolution
+
+def metric_rollup_refresh(context, now=None):
+    """Roll the closed buckets of every resolution up, drop expired rollups.
+
+    The finest resolution is computed from the raw metrics, each coarser
+    one from the previous rollup. A bucket is closed metric_rollup_delay
+    seconds after its end; the buckets after the last rolled one are done
+    with one INSERT ... SELECT per resolution.
+
+    :returns: a dict resolution -> (rows rolled up, rows deleted).
+    """
+    now = int(now or time.time())
+    session = get_session()
+    table = models.MetricRollup.__table__
+    result = {}
+    source = None
+    source_until = now - FLAGS.metric_rollup_delay
+    for resolution, days in _metric_rollup_config():
+        last = session.execute(
+            table.select().with_only_columns([func.max(table.c.timestamp)]).
+            where(table.c.resolution == resolution)).scalar()
+        after = last + resolution if last is not None else 0
+        start = _first_metric_bucket(session, resolution, source, after)
+        rolled = 0
+        until = after
+        if start is not None:
+            end = min(source_until - source_until % resolution,
+                      start + resolution * FLAGS.metric_rollup_max_buckets)
+            if end > start:
+                params = {'resolution': resolution, 'source': source,
+                          'start': start, 'end': end}
+                if source is None:
+                    sql_str = '''
+                        INSERT INTO metric_rollups (resolution, metric_id, host_id, instance_id, timestamp,
+                                                    count, min_value, max_value, sum_value, deleted)
+                        SELECT :resolution, metric_id, host_id, instance_id, timestamp - timestamp % :resolution AS bucket,
+                               count(*), min(value), max(value), sum(value), 0
+                        FROM metrics WHERE timestamp >= :start AND timestamp < :end
+                        GROUP BY metric_id, host_id, instance_id, bucket
+                    '''
+                else:
+                    sql_str = '''
+                        INSERT INTO metric_rollups (resolution, metric_id, host_id, instance_id, timestamp,
+                                                    count, min_value, max_value, sum_value, deleted)
+                        SELECT :resolution, metric_id, host_id, instance_id, timestamp - timestamp % :resolution AS bucket,
+                               sum(count), min(min_value), max(max_value), sum(sum_value), 0
+                        FROM metric_rollups WHERE resolution = :source AND timestamp >= :start AND timestamp < :end
+                        GROUP BY metric_id, host_id, instance_id, bucket
+                    '''
+                rolled = session.execute(sql_str, params).rowcount
+                until = end
+            else:
+                until = start
+        deleted = 0
+        if days:
+            deleted = session.execute(table.delete().where(and_(
+                table.c.resolution == resolution,
+                table.c.timestamp < now - days * 24 * 3600))).rowcount
+        result[resolution] = (rolled, deleted)
+        source = resolution
+        source_until = until
+    return result
+
+def _metric_rollup_rows(session, resolution, metric_ids, timestamp_start,
+                        timestamp_end, instance_id=None):
+    """Rollup rows of metrics ordered by series and time.
+
+    One bucket before timestamp_start is included, the rates of the first
+    bucket need it.
+    """
+    table = models.MetricRollup.__table__
+    where = [table.c.resolution == resolution,
+             table.c.metric_id.in_(metric_ids),
+             table.c.timestamp >= timestamp_start - resolution,
+             table.c.timestamp < timestamp_end]
+    if instance_id is not None:
+        where.append(table.c.instance_id == instance_id)
+    return [tuple(row) for row in session.execute(
+        table.select().
+        with_only_columns([table.c.metric_id, table.c.host_id,
+                           table.c.instance_id, table.c.timestamp,
+                           table.c.count, table.c.max_value,
+                           table.c.sum_value]).
+        where(and_(*where)).
+        order_by(table.c.metric_id, table.c.host_id, table.c.instance_id,
+                 table.c.timestamp)).fetchall()]
+
+def _metric_rollup_deltas(rows, interval, timestamp_start):
+    """Increase of the counters per bucket, scaled to one interval.
+
+    The counters only grow, the max of a bucket is its last value.
+    :returns: a dict (metric_id, timestamp) -> (sum of the increases of
+              the series, number of series).
+    """
+    deltas = {}
+    previous = None
+    for row in rows:
+        series = tuple(row[:3])
+        if previous is not None and previous[0] == series and \
+                row[3] >= timestamp_start:
+            delta = row[5] - previous[2]
+            # A negative delta is a counter reset, e.g. an osd restart.
+            if delta >= 0:
+                key = (row[0], row[3])
+                total, count = deltas.get(key, (0, 0))
+                deltas[key] = (total + delta * interval / (row[3] - previous[1]),
+                               count + 1)
+        previous = (series, row[3], row[5])
+    return deltas
+
+def _metric_rollup_end(rows, resolution, timestamp_start):
+    """Start of the part of a time range the rollup rows do not cover.
+
+    The rollups stop at the last closed bucket, metric_rollup_delay and
+    the finer rollups they are built from behind the newest samples.
+    """
+    if not rows:
+        return timestamp_start
+    return max(max(row[3] for row in rows) + resolution, timestamp_start)
+
+def _metric_bucket_deltas(deltas, resolution):
+    """Fold the output of _metric_counter_deltas into rollup buckets.
+
+    :returns: a dict (metric_id, bucket) -> (average of the increases of
+              the steps, average number of samples), the format of
+              _metric_rollup_deltas.
+    """
+    buckets = {}
+    for (metric_id, cur), (total, count, _instance_id) in deltas.iteritems():
+        key = (metric_id, cur - cur % resolution)
+        bucket_total, bucket_count, steps = buckets.get(key, (0, 0, 0))
+        buckets[key] = (bucket_total + total, bucket_count + count, steps + 1)
+    return dict((key, (total * 1.0 / steps, count * 1.0 / steps))
+                for key, (total, count, steps) in buckets.iteritems())
+
+def _metric_series_rows(session, metric_ids, timestamp_from, timestamp_to):
+    """Samples of metrics with timestamp_from <= timestamp < timestamp_to.
+
+    :returns: (metric_id, host_id, instance_id, timestamp, value) tuples
+              ordered by series and time.
+    """
+    table = models.CephPerformanceMetric.__table__
+    return [tuple(row) for row in session.execute(
+        table.select().
+        with_only_columns([table.c.metric_id, table.c.host_id,
+                           table.c.instance_id, table.c.timestamp,
+                           table.c.value]).
+        where(and_(table.c.metric_id.in_(metric_ids),
+                   table.c.timestamp >= timestamp_from,
+                   table.c.timestamp < timestamp_to)).
+        order_by(table.c.metric_id, table.c.host_id, table.c.instance_id,
+                 table.c.timestamp)).fetchall()]
+
+def _metric_counter_deltas(rows, timestamp_start, timestamp_end, interval):
+    """Increase of the counters in each step of a time range.
+
+    The steps are timestamp_start, timestamp_start + interval, ... up to
+    timestamp_end. A sample belongs to the step cur if it was taken in
+    (cur - interval, cur]; its increase is measured from the highest value
+    of its series in (cur - 3 * interval, cur - interval], the sample is
+    left out if there is none.
+
+    :param rows: the output of _metric_series_rows, from
+                 timestamp_start - 3 * interval + 1 to timestamp_end.
+    :returns: a dict (metric_id, cur) -> (sum of the increases, number of
+              samples, instance_id of the first sample).
+    """
+    deltas = {}
+    index = 0
+    while index < len(rows):
+        series = rows[index][:3]
+        end = index
+        while end < len(rows) and rows[end][:3] == series:
+            end += 1
+        times = [row[3] for row in rows[index:end]]
+        values = [row[4] for row in rows[index:end]]
+        for i in xrange(len(times)):
+            # The first step cur >= timestamp.
+            cur = timestamp_start - (timestamp_start - times[i]) // interval * interval
+            if cur < timestamp_start or cur >= timestamp_end:
+                continue
+            lo = bisect.bisect_right(times, cur - 3 * interval, 0, i)
+            hi = bisect.bisect_right(times, cur - interval, lo, i)
+            if lo == hi:
+                continue
+            delta = values[i] - max(values[lo:hi])
+            key = (series[0], cur)
+            if key in deltas:
+                total, count, instance_id = deltas[key]
+                deltas[key] = (total + delta, count + 1, instance_id)
+            else:
+                deltas[key] = (delta, 1, series[2])
+        index = end
+    return deltas
+
+def _sum_metrics_value(metrics_name, total, count, interval, correct_cnt):
+    if correct_cnt:
+        metrics_value = total/count*correct_cnt
+    else:
+        metrics_value = total/interval
+    if metrics_name in ['osd_op_in_bytes','osd_op_out_bytes']:
+        metrics_value = metrics_value and metrics_value*1.0/1024/1024/interval or 0
+    return metrics_value
 
 def sum_performance_metrics(context, search_opts, session=None):#for iops bandwidth
     metrics_name =  search_opts['metrics_name']
@@ -4175,84 +4685,151 @@ def sum_performance_metrics(context, search_opts, session=None):#for iops bandwi
         timestamp_end = get_max_timestamp_by_metrics_name(context, metrics_name) or timestamp_start
     if timestamp_start > timestamp_end : timestamp_start = timestamp_end - diamond_collect_interval
     ret_list = []
+    if timestamp_start is None or timestamp_end is None:
+        return ret_list
     timestamp_cur = timestamp_start
     session = get_session()
-    while timestamp_cur<timestamp_end:
-        sql_str = '''
-            SELECT   sum(metrics_join.value_real) AS sum_1, count(metrics_join.value_real) AS count_1,metrics_join.instance_real AS metrics_instance
-            FROM
-            (select m.value-m_pre.value_pre as value_real ,m.instance as instance_real
-              from (select instance,hostname,value from metrics WHERE metrics.metric = '%(metrics_name)s' AND metrics.timestamp >= %(time_1)s AND metrics.timestamp < %(time_2)s) as m
-              left join (select instance,hostname,max(value) as value_pre from metrics WHERE metrics.metric = '%(metrics_name)s' AND metrics.timestamp >= %(time_1)s-2*%(interval)d  AND metrics.timestamp < %(time_2)s-%(interval)d  group by instance,hostname ) as m_pre
-              on  m.instance=m_pre.instance and m.hostname=m_pre.hostname
-            ) as metrics_join
-        '''%{'metrics_name':metrics_name,'time_1':timestamp_cur-(diamond_collect_interval-1),'time_2':timestamp_cur+1,'interval':diamond_collect_interval}
-        sql_ret_set = session.execute(sql_str).fetchall()
-        for cell in sql_ret_set:
-            if cell is None or cell[0] is None:
-                continue
-            if correct_cnt:
-                metrics_value = cell[0]/cell[1]*correct_cnt
-            else:
-                metrics_value = cell[0]/diamond_collect_interval
-            if metrics_name in ['osd_op_in_bytes','osd_op_out_bytes']:
-                metrics_value = metrics_value and metrics_value*1.0/1024/1024/diamond_collect_interval or 0
-            sql_ret_dict = {'instance': cell[2], 'timestamp': str(timestamp_cur), 'metrics_value': metrics_value, 'metrics': metrics_name,}
-            ret_list.append(sql_ret_dict)
-        timestamp_cur = timestamp_cur + diamond_collect_interval
+    metric_id = _metric_id(metrics_name, session=session)
+    if metric_id is None:
+        return ret_list
+    resolution = _metric_resolution(context, diamond_collect_interval, timestamp_start, timestamp_end,
+                                    search_opts.get('max_points'), session=session)
+    if resolution > diamond_collect_interval:
+        rows = _metric_rollup_rows(session, resolution, [metric_id], timestamp_start, timestamp_end)
+        deltas = _metric_rollup_deltas(rows, diamond_collect_interval, timestamp_start)
+        # The samples after the last rollup bucket, in buckets too.
+        tail_start = _metric_rollup_end(rows, resolution, timestamp_start)
+        rows = _metric_series_rows(session, [metric_id],
+                                   tail_start - 3 * diamond_collect_interval + 1, timestamp_end)
+        deltas.update(_metric_bucket_deltas(
+            _metric_counter_deltas(rows, tail_start, timestamp_end, diamond_collect_interval), resolution))
+        for (_metric, timestamp), (total, count) in sorted(deltas.iteritems()):
+            metrics_value = _sum_metrics_value(metrics_name, total, count, diamond_collect_interval, correct_cnt)
+            ret_list.append({'instance': '', 'timestamp': str(timestamp), 'metrics_value': metrics_value, 'metrics': metrics_name,})
+        return ret_list
+    # One scan of the samples (metrics_metric_timestamp_index), the
+    # counter deltas of every step are computed from it.
+    rows = _metric_series_rows(session, [metric_id],
+                               timestamp_start - 3 * diamond_collect_interval + 1, timestamp_end)
+    deltas = _metric_counter_deltas(rows, timestamp_start, timestamp_end, diamond_collect_interval)
+    instance_names = _metric_dimension_names([delta[2] for delta in deltas.itervalues()], session=session)
+    for (_metric, timestamp_cur), (total, count, instance_id) in sorted(deltas.iteritems()):
+        metrics_value = _sum_metrics_value(metrics_name, total, count, diamond_collect_interval, correct_cnt)
+        sql_ret_dict = {'instance': instance_names.get(instance_id), 'timestamp': str(timestamp_cur), 'metrics_value': metrics_value, 'metrics': metrics_name,}
+        ret_list.append(sql_ret_dict)
 
     return ret_list
 
-def latency_performance_metrics(context, search_opts, session=None):#for latency
-    metrics_name = search_opts['metrics_name']
-    latency_type = metrics_name.split('_')[2]
+def _latency_performance_metrics(context, metrics_names, search_opts):
+    """Latency of several latency metrics, e.g. osd_op_r_latency.
+
+    The _sum and _avgcount counters of all of them are read in one scan
+    (or from one rollup) and the latency of each step is the increase of
+    the sum over the increase of the count.
+
+    :returns: a dict metrics_name -> list of (timestamp, latency in ms).
+    """
     timestamp_start = search_opts.has_key('timestamp_start') and int(search_opts['timestamp_start']) or None
     timestamp_end = search_opts.has_key('timestamp_end') and int(search_opts['timestamp_end']) or None
-    setting_ref = vsm_settings_get_by_name(context, 'ceph_diamond_collect_interval', session=session)
+    setting_ref = vsm_settings_get_by_name(context, 'ceph_diamond_collect_interval')
     if setting_ref:
         diamond_collect_interval = int(setting_ref['value'])
     else:
         diamond_collect_interval = 15
-        vsm_settings_update_or_create(context, {'name':'ceph_diamond_collect_interval','value':diamond_collect_interval}, session=session)
+        vsm_settings_update_or_create(context, {'name':'ceph_diamond_collect_interval','value':diamond_collect_interval})
     if timestamp_start is None and timestamp_end:
         timestamp_start = timestamp_end - diamond_collect_interval
     elif timestamp_start  and  timestamp_end is None:
         timestamp_start = timestamp_start + diamond_collect_interval
-        timestamp_end = get_max_timestamp_by_metrics_name(context, '%s_sum'%metrics_name) or timestamp_start
+        timestamp_end = max([get_max_timestamp_by_metrics_name(context, '%s_sum'%name) for name in metrics_names]) or timestamp_start
     if timestamp_start > timestamp_end : timestamp_start = timestamp_end - diamond_collect_interval
-    ret_list = []
-    timestamp_cur = timestamp_start
+    result = dict((name, []) for name in metrics_names)
+    if timestamp_start is None or timestamp_end is None:
+        return result
     session = get_session()
-    while timestamp_cur < timestamp_end:
-        sql_str = '''
-                 select case when avgcount_a<>0 then sum_a*1000/avgcount_a else 0 end as latency_value from \
-                 (select sum(la_sum_cur-la_sum_pre) as sum_a from
-                    (
-                     (select instance,hostname,value as la_sum_cur from metrics where metric ='%(metric_name)s_sum' and timestamp>=%(start_time)d and timestamp<%(end_time)d )  as d
-                     left join
-                     (select instance,hostname,max(value) as la_sum_pre from metrics where metric ='%(metric_name)s_sum' and timestamp>=%(start_time)d-2*%(interval)d  and timestamp<%(end_time)d-%(interval)d  group by instance,hostname ) as d_pre
-                     on d.instance=d_pre.instance and d.hostname=d_pre.hostname
-                     )
-                  ) as a \
-                 inner join
-                 (select sum(la_avgcount_cur-la_avgcount_pre) as avgcount_a from
-                    (
-                     (select instance,hostname,value as la_avgcount_cur from metrics where metric ='%(metric_name)s_avgcount' and timestamp>=%(start_time)d and timestamp<%(end_time)d )  as e
-                     left join
-                     (select instance,hostname,max(value) as la_avgcount_pre from metrics where metric ='%(metric_name)s_avgcount' and timestamp>=%(start_time)d-2*%(interval)d and timestamp<%(end_time)d-%(interval)d  group by instance,hostname ) as e_pre
-                     on e.instance=e_pre.instance and e.hostname=e_pre.hostname
-                     )
-                 ) as b \
-            '''%{'latency_type':latency_type,'metric_name':metrics_name,'start_time':timestamp_cur-(diamond_collect_interval-1),'end_time':timestamp_cur+1,'interval':diamond_collect_interval}
-        sql_ret = session.execute(sql_str).fetchall()
-        #LOG.info('latency--sql-str===%s'%sql_str)
-        for cell in sql_ret:
-            if cell is None or cell[0] is None:
-                continue
-            metrics_value = cell[0] or 0
-            ret_list.append({'instance':'', 'timestamp':str(timestamp_cur), 'metrics_value':metrics_value,'metrics':metrics_name,})
-        timestamp_cur = timestamp_cur + diamond_collect_interval
-    return ret_list
+    metric_ids = _metric_dimension_ids('metric', ['%s_%s' % (name, counter) for name in metrics_names
+                                                  for counter in ('sum', 'avgcount')], session=session)
+    counters = {}
+    for name in metrics_names:
+        sum_id = metric_ids.get('%s_sum' % name)
+        avgcount_id = metric_ids.get('%s_avgcount' % name)
+        if sum_id is not None and avgcount_id is not None:
+            counters[name] = (sum_id, avgcount_id)
+    if not counters:
+        return result
+    ids = [metric_id for pair in counters.itervalues() for metric_id in pair]
+    resolution = _metric_resolution(context, diamond_collect_interval, timestamp_start, timestamp_end,
+                                    search_opts.get('max_points'), session=session)
+    if resolution > diamond_collect_interval:
+        rows = _metric_rollup_rows(session, resolution, ids, timestamp_start, timestamp_end)
+        deltas = _metric_rollup_deltas(rows, diamond_collect_interval, timestamp_start)
+        # The samples after the last rollup bucket, in buckets too.
+        tail_start = _metric_rollup_end(rows, resolution, timestamp_start)
+        rows = _metric_series_rows(session, ids, tail_start - 3 * diamond_collect_interval + 1, timestamp_end)
+        deltas.update(_metric_bucket_deltas(
+            _metric_counter_deltas(rows, tail_start, timestamp_end, diamond_collect_interval), resolution))
+        for name, (sum_id, avgcount_id) in counters.iteritems():
+            for timestamp in sorted(set(key[1] for key in deltas if key[0] in (sum_id, avgcount_id))):
+                sum_a = deltas.get((sum_id, timestamp), (0, 0))[0]
+                avgcount_a = deltas.get((avgcount_id, timestamp), (0, 0))[0]
+                result[name].append((timestamp, avgcount_a and sum_a*1000/avgcount_a or 0))
+        return result
+
+    rows = _metric_series_rows(session, ids, timestamp_start - 3 * diamond_collect_interval + 1, timestamp_end)
+    deltas = _metric_counter_deltas(rows, timestamp_start, timestamp_end, diamond_collect_interval)
+    for name, (sum_id, avgcount_id) in counters.iteritems():
+        for timestamp_cur in xrange(timestamp_start, timestamp_end, diamond_collect_interval):
+            sum_a = deltas.get((sum_id, timestamp_cur))
+            avgcount_a = deltas.get((avgcount_id, timestamp_cur))
+            if avgcount_a and avgcount_a[0]:
+                if sum_a is None:
+                    continue
+                metrics_value = sum_a[0]*1000/avgcount_a[0]
+            else:
+                metrics_value = 0
+            result[name].append((timestamp_cur, metrics_value))
+    return result
+
+def latency_performance_metrics(context, search_opts, session=None):#for latency
+    metrics_name = search_opts['metrics_name']
+    latency = _latency_performance_metrics(context, [metrics_name], search_opts)
+    return [{'instance':'', 'timestamp':str(timestamp), 'metrics_value':metrics_value,'metrics':metrics_name,}
+            for timestamp, metrics_value in latency[metrics_name]]
+
+def latency_performance_metrics_all(context, search_opts, session=None):
+    """Read, write and read/write latency of the osds, in one read.
+
+    :returns: a list of dicts with timestamp, r_value, w_value and
+              rw_value, ordered by timestamp.
+    """
+    names = [('r_value', 'osd_op_r_latency'),
+             ('w_value', 'osd_op_w_latency'),
+             ('rw_value', 'osd_op_rw_latency')]
+    latency = _latency_performance_metrics(context, [name for _key, name in names], search_opts)
+    items = {}
+    for key, name in names:
+        for timestamp, metrics_value in latency[name]:
+            item = items.setdefault(timestamp, {'timestamp': str(timestamp),
+                                                'r_value': 0,
+                                                'w_value': 0,
+                                                'rw_value': 0})
+            item[key] = metrics_value
+    return [items[timestamp] for timestamp in sorted(items)]
+
+def _cpu_usage_samples(session, metric_ids, instance_id, timestamp_start, timestamp_end=None):
+    """(timestamp, host_id, user + system) of the cpu samples."""
+    table = models.CephPerformanceMetric.__table__
+    where = [table.c.metric_id.in_(metric_ids),
+             table.c.instance_id == instance_id,
+             table.c.timestamp >= timestamp_start]
+    if timestamp_end is not None:
+        where.append(table.c.timestamp < timestamp_end)
+    return session.execute(
+        table.select().
+        with_only_columns([table.c.timestamp, table.c.host_id,
+                           func.sum(table.c.value)]).
+        where(and_(*where)).
+        group_by(table.c.timestamp, table.c.host_id)).fetchall()
 
 def cpu_data_get_usage(context, search_opts, session=None):#for cpu_usage
     metrics_name = search_opts['metrics_name']
@@ -4271,24 +4848,206 @@ def cpu_data_get_usage(context, search_opts, session=None):#for cpu_usage
     ret_list = []
     session = get_session()
     if timestamp_start :
-        sql_str = '''select timestamp, hostname, sum(value) as metric_value from metrics where instance='cpu_total' and metric in ('user','system') and timestamp>=%(start_time)s  group by timestamp,hostname
-            '''%{'start_time':timestamp_start}
-        sql_ret = session.execute(sql_str).fetchall()
+        metric_ids = _metric_dimension_ids('metric', ['user', 'system'], session=session).values()
+        instance_id = _metric_dimension_ids('instance', ['cpu_total'], session=session).get('cpu_total')
+        if not metric_ids or instance_id is None:
+            return ret_list
+        resolution = _metric_resolution(context, diamond_collect_interval, timestamp_start, timestamp_end or int(time.time()),
+                                        search_opts.get('max_points'), session=session)
+        if resolution > diamond_collect_interval:
+            rows = _metric_rollup_rows(session, resolution, metric_ids, timestamp_start,
+                                       timestamp_end or int(time.time()), instance_id=instance_id)
+            usage = {}
+            for row in rows:
+                if row[3] >= timestamp_start:
+                    # user + system, each averaged over the bucket
+                    key = (row[3], row[1])
+                    usage[key] = usage.get(key, 0) + row[6]/row[4]
+            # The samples after the last rollup bucket, averaged per bucket.
+            tail = {}
+            for timestamp, host_id, value in _cpu_usage_samples(
+                    session, metric_ids, instance_id, _metric_rollup_end(rows, resolution, timestamp_start),
+                    timestamp_end):
+                values = tail.setdefault((timestamp - timestamp % resolution, host_id), [])
+                values.append(value or 0)
+            for key, values in tail.iteritems():
+                usage[key] = sum(values) / len(values)
+            host_names = _metric_dimension_names([key[1] for key in usage], session=session)
+            for (timestamp, host_id), metrics_value in sorted(usage.iteritems()):
+                ret_list.append({'host':host_names.get(host_id), 'timestamp':timestamp, 'metrics_value':metrics_value,'metrics':metrics_name,})
+            return ret_list
+        sql_ret = _cpu_usage_samples(session, metric_ids, instance_id, timestamp_start)
+        host_names = _metric_dimension_names([cell[1] for cell in sql_ret], session=session)
         for cell in sql_ret:
             metrics_value = cell[2] or 0
             timestamp = cell[0]/diamond_collect_interval*diamond_collect_interval
-            ret_list.append({'host':cell[1], 'timestamp':timestamp, 'metrics_value':metrics_value,'metrics':metrics_name,})
+            ret_list.append({'host':host_names.get(cell[1]), 'timestamp':timestamp, 'metrics_value':metrics_value,'metrics':metrics_name,})
     return ret_list
 
-def clean_performance_history_data(context,days):
+def metrics_delete_before(context, timestamp, limit):
+    """Delete up to limit metrics older than timestamp, oldest first.
+
+    The rows are picked on the timestamp index and deleted by id, so one
+    statement never locks more than limit rows.
+
+    :returns: the number of rows deleted.
+    """
     session = get_session()
-    timestamp = time.time() - int(days) * 24 * 3600
-    sql_str = 'delete from metrics where timestamp<%s'%timestamp
-    session.execute(sql_str)
+    table = models.CephPerformanceMetric.__table__
+    ids = [row[0] for row in session.execute(
+        table.select().with_only_columns([table.c.id]).
+        where(table.c.timestamp < timestamp).
+        order_by(table.c.timestamp).limit(limit))]
+    if not ids:
+        return 0
+    return session.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+
+_DAY = 24 * 3600
+
+def _metrics_partitions(session):
+    """[(name, less than, rows)] of the partitions of metrics, by position.
+
+    less than is None for the MAXVALUE partition, the list is empty when
+    the table is not partitioned or the DB is not mysql.
+    """
+    if session.bind.dialect.name != 'mysql':
+        return []
+    sql_str = '''
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'metrics' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    '''
+    partitions = []
+    for name, description, rows in session.execute(sql_str):
+        less_than = None if description == 'MAXVALUE' else int(description)
+        partitions.append((name, less_than, rows or 0))
+    return partitions
+
+def _metrics_day_partitions(first_day, last_day):
+    days = range(first_day, last_day + _DAY, _DAY)
+    return ['PARTITION p%s VALUES LESS THAN (%d)' %
+            (time.strftime('%Y%m%d', time.gmtime(day)), day + _DAY)
+            for day in days] + ['PARTITION pmax VALUES LESS THAN MAXVALUE']
+
+def metrics_partition_rotate(context, timestamp, days_ahead, now=None):
+    """Drop the daily partitions of metrics older than timestamp.
+
+    The table is partitioned by day (UTC) on its first call, the primary
+    key becomes (id, timestamp) as mysql wants the partitioning column in
+    it. Partitions are created days_ahead days in advance by splitting
+    the MAXVALUE one, which is empty and cheap to split.
+
+    :returns: a dict with the names of the dropped and added partitions
+              and an estimate of the rows dropped, None if the DB is not
+              mysql.
+    """
+    session = get_session()
+    if session.bind.dialect.name != 'mysql':
+        return None
+    now = int(now or time.time())
+    today = now - now % _DAY
+    last_day = today + days_ahead * _DAY
+    result = {'dropped': [], 'rows': 0, 'added': []}
+    partitions = _metrics_partitions(session)
+    if not partitions:
+        LOG.info('Partition the metrics table by day.')
+        session.execute('ALTER TABLE metrics DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp) '
+                        'PARTITION BY RANGE (timestamp) (%s)' %
+                        ', '.join(_metrics_day_partitions(today, last_day)))
+        result['added'] = [name for name, _less_than, _rows in _metrics_partitions(session)]
+        return result
+
+    expired = [(name, rows) for name, less_than, rows in partitions
+               if less_than is not None and less_than <= timestamp]
+    if expired:
+        session.execute('ALTER TABLE metrics DROP PARTITION %s' %
+                        ', '.join(name for name, _rows in expired))
+        result['dropped'] = [name for name, _rows in expired]
+        result['rows'] = sum(rows for _name, rows in expired)
+
+    bounds = [less_than for _name, less_than, _rows in partitions if less_than is not None]
+    first_day = max(bounds) if bounds else today
+    if first_day <= last_day:
+        added = _metrics_day_partitions(first_day, last_day)
+        session.execute('ALTER TABLE metrics REORGANIZE PARTITION pmax INTO (%s)' %
+                        ', '.join(added))
+        result['added'] = [partition.split()[1] for partition in added[:-1]]
+    return result
 
 def get_poolusage(context, poolusage_id):
     result = model_query(
         context, models.StoragePoolUsage).\
         filter_by(id=poolusage_id).\
         first()
-    return result
\ No newline at end of file
+    return result
+#region periodic task lease
+
+def _lease_get(session, name):
+    table = models.PeriodicTaskLease.__table__
+    row = session.execute(table.select().
+                          where(and_(table.c.name == name,
+                                     table.c.deleted == False))).first()
+    if row:
+        return {'name': row['name'],
+                'holder': row['holder'],
+                'expires_at': row['expires_at']}
+
+def lease_acquire(context, name, holder, duration):
+    """Take or renew the lease `name` for `holder`.
+
+    The lease is given if nobody holds it, if it expired or if holder
+    already has it. One UPDATE in the common case, and the row is created
+    on first use.
+
+    :returns: the lease after the call as a dict with name, holder and
+              expires_at; holder tells whether it was granted.
+    """
+    table = models.PeriodicTaskLease.__table__
+    now = timeutils.utcnow()
+    expires_at = now + datetime.timedelta(seconds=duration)
+    session = get_session()
+    with session.begin():
+        result = session.execute(table.update().
+                                 where(and_(table.c.name == name,
+                                            table.c.deleted == False,
+                                            or_(table.c.holder == holder,
+                                                table.c.expires_at < now))).
+                                 values(holder=holder,
+                                        expires_at=expires_at,
+                                        updated_at=now))
+        if result.rowcount:
+            return {'name': name, 'holder': holder, 'expires_at': expires_at}
+        lease = _lease_get(session, name)
+    if lease:
+        return lease
+
+    try:
+        session.execute(table.insert().values(name=name,
+                                              holder=holder,
+                                              expires_at=expires_at,
+                                              created_at=now,
+                                              deleted=False))
+    except IntegrityError:
+        # Another host created it first.
+        return _lease_get(get_session(), name)
+    return {'name': name, 'holder': holder, 'expires_at': expires_at}
+
+def lease_release(context, name, holder):
+    """Expire the lease `name` now if holder has it."""
+    table = models.PeriodicTaskLease.__table__
+    now = timeutils.utcnow()
+    session = get_session()
+    with session.begin():
+        result = session.execute(table.update().
+                                 where(and_(table.c.name == name,
+                                            table.c.holder == holder,
+                                            table.c.deleted == False)).
+                                 values(expires_at=now, updated_at=now))
+    return result.rowcount > 0
+
+def lease_get(context, name):
+    """The lease `name` as a dict with name, holder and expires_at."""
+    return _lease_get(get_session(), name)
+
+#endregion
@@ -0,0 +1,134 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Store the metrics with a numeric value and interned dimensions.
+
+The metric, host and instance names move to metric_dimensions, a metrics
+row keeps their ids, a double value and the timestamp. The rows are copied
+with one INSERT ... SELECT into a new table which then replaces metrics.
+"""
+
+from sqlalchemy import Boolean, Column, DateTime, Float
+from sqlalchemy import Integer, MetaData, String, Table
+from sqlalchemy import Index, UniqueConstraint
+
+_KINDS = (('metric', 'metric'), ('host', 'hostname'), ('instance', 'instance'))
+
+
+def _timestamps():
+    return [Column('created_at', DateTime(timezone=False)),
+            Column('updated_at', DateTime(timezone=False)),
+            Column('deleted_at', DateTime(timezone=False)),
+            Column('deleted', Boolean(create_constraint=True, name=None))]
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    dimensions = Table(
+        'metric_dimensions', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('kind', String(length=16), nullable=False),
+        Column('name', String(length=255), nullable=False),
+        UniqueConstraint('kind', 'name',
+                         name='metric_dimensions_kind_name_uniq'),
+        *_timestamps()
+    )
+
+    typed_metrics = Table(
+        'metrics_typed', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('metric_id', Integer, nullable=False),
+        Column('host_id', Integer, nullable=False),
+        Column('instance_id', Integer, nullable=False),
+        Column('value', Float(precision=53), nullable=False),
+        Column('timestamp', Integer, nullable=False),
+        *_timestamps()
+    )
+
+    try:
+        dimensions.create()
+        typed_metrics.create()
+    except Exception:
+        meta.drop_all(tables=[dimensions, typed_metrics])
+        raise
+
+    for kind, column in _KINDS:
+        migrate_engine.execute(
+            "INSERT INTO metric_dimensions (kind, name, deleted) "
+            "SELECT DISTINCT '%(kind)s', %(column)s, 0 FROM metrics"
+            % {'kind': kind, 'column': column})
+    # value + 0 turns the string into a number on mysql and sqlite.
+    migrate_engine.execute(
+        "INSERT INTO metrics_typed "
+        "(metric_id, host_id, instance_id, value, timestamp, deleted) "
+        "SELECT dm.id, dh.id, di.id, m.value + 0, m.timestamp, 0 "
+        "FROM metrics m "
+        "JOIN metric_dimensions dm ON dm.kind = 'metric' "
+        "AND dm.name = m.metric "
+        "JOIN metric_dimensions dh ON dh.kind = 'host' "
+        "AND dh.name = m.hostname "
+        "JOIN metric_dimensions di ON di.kind = 'instance' "
+        "AND di.name = m.instance")
+
+    Table('metrics', meta, autoload=True).drop()
+    typed_metrics.rename('metrics')
+    metrics = Table('metrics', MetaData(bind=migrate_engine), autoload=True)
+    Index('metrics_timestamp_index',
+          metrics.c.timestamp).create(bind=migrate_engine)
+    Index('metrics_metric_timestamp_index',
+          metrics.c.metric_id, metrics.c.timestamp).create(bind=migrate_engine)
+    Index('metrics_series_timestamp_index',
+          metrics.c.metric_id, metrics.c.host_id, metrics.c.instance_id,
+          metrics.c.timestamp).create(bind=migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    string_metrics = Table(
+        'metrics_string', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('metric', String(length=255), nullable=False),
+        Column('value', String(length=255), nullable=False),
+        Column('hostname', String(length=255), nullable=False),
+        Column('instance', String(length=255), nullable=False),
+        Column('timestamp', Integer, nullable=False),
+        *_timestamps()
+    )
+    string_metrics.create()
+
+    migrate_engine.execute(
+        "INSERT INTO metrics_string "
+        "(metric, value, hostname, instance, timestamp, deleted) "
+        "SELECT dm.name, m.value, dh.name, di.name, m.timestamp, 0 "
+        "FROM metrics m "
+        "JOIN metric_dimensions dm ON dm.id = m.metric_id "
+        "JOIN metric_dimensions dh ON dh.id = m.host_id "
+        "JOIN metric_dimensions di ON di.id = m.instance_id")
+
+    Table('metrics', meta, autoload=True).drop()
+    Table('metric_dimensions', meta, autoload=True).drop()
+    string_metrics.rename('metrics')
+    metrics = Table('metrics', MetaData(bind=migrate_engine), autoload=True)
+    Index('metrics_timestamp_index',
+          metrics.c.timestamp).create(bind=migrate_engine)
@@ -0,0 +1,68 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, Float
+from sqlalchemy import Integer, MetaData, Table
+from sqlalchemy import Index, UniqueConstraint
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    rollups = Table(
+        'metric_rollups', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('resolution', Integer, nullable=False),
+        Column('metric_id', Integer, nullable=False),
+        Column('host_id', Integer, nullable=False),
+        Column('instance_id', Integer, nullable=False),
+        Column('timestamp', Integer, nullable=False),
+        Column('count', Integer, nullable=False),
+        Column('min_value', Float(precision=53), nullable=False),
+        Column('max_value', Float(precision=53), nullable=False),
+        Column('sum_value', Float(precision=53), nullable=False),
+        Column('created_at', DateTime(timezone=False)),
+        Column('updated_at', DateTime(timezone=False)),
+        Column('deleted_at', DateTime(timezone=False)),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        UniqueConstraint('resolution', 'metric_id', 'host_id', 'instance_id',
+                         'timestamp', name='metric_rollups_series_uniq'),
+    )
+
+    try:
+        rollups.create()
+    except Exception:
+        meta.drop_all(tables=[rollups])
+        raise
+
+    Index('metric_rollups_metric_timestamp_index',
+          rollups.c.resolution, rollups.c.metric_id,
+          rollups.c.timestamp).create(bind=migrate_engine)
+    Index('metric_rollups_timestamp_index',
+          rollups.c.resolution,
+          rollups.c.timestamp).create(bind=migrate_engine)
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    rollups = Table('metric_rollups',
+                    meta,
+                    autoload=True)
+    rollups.drop()
@@ -22,6 +22,7 @@ from sqlalchemy import Column, Integer
 from sqlalchemy import BigInteger, String
 from sqlalchemy import Text
 from sqlalchemy import Float
+from sqlalchemy import Index, UniqueConstraint
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import ForeignKey, DateTime, Boolean
@@ -794,18 +795,61 @@ class ErasureCodeProfile(BASE, VsmBase):
     plugin_kv_pair = Column(Text, nullable=False)
     
 
+class MetricDimension(BASE, VsmBase):
+    """ interned metric, host and instance names of the metrics
+    """
+    __tablename__ = 'metric_dimensions'
+    __table_args__ = (UniqueConstraint('kind', 'name',
+                                       name='metric_dimensions_kind_name_uniq'),
+                      {'mysql_engine': 'InnoDB'})
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    kind = Column(String(length=16), nullable=False)
+    name = Column(String(length=255), nullable=False)
+
 class CephPerformanceMetric(BASE, VsmBase):
     """ ceph performance metric and value from diamond
     """
     __tablename__ = 'metrics'
+    __table_args__ = (Index('metrics_timestamp_index', 'timestamp'),
+                      Index('metrics_metric_timestamp_index',
+                            'metric_id', 'timestamp'),
+                      Index('metrics_series_timestamp_index',
+                            'metric_id', 'host_id', 'instance_id',
+                            'timestamp'),
+                      {'mysql_engine': 'InnoDB'})
 
     id = Column(Integer, primary_key=True, nullable=False)
-    metric = Column(String(length=255), nullable=False)
-    hostname = Column(String(length=255), nullable=False)
-    instance = Column(String(length=255), nullable=False)
-    value = Column(String(length=255), nullable=False)
+    metric_id = Column(Integer, nullable=False)
+    host_id = Column(Integer, nullable=False)
+    instance_id = Column(Integer, nullable=False)
+    value = Column(Float(precision=53), nullable=False)
     timestamp = Column(Integer, nullable=False)
 
+class MetricRollup(BASE, VsmBase):
+    """ metrics downsampled to one row per series and resolution bucket
+    """
+    __tablename__ = 'metric_rollups'
+    __table_args__ = (UniqueConstraint('resolution', 'metric_id', 'host_id',
+                                       'instance_id', 'timestamp',
+                                       name='metric_rollups_series_uniq'),
+                      Index('metric_rollups_metric_timestamp_index',
+                            'resolution', 'metric_id', 'timestamp'),
+                      Index('metric_rollups_timestamp_index',
+                            'resolution', 'timestamp'),
+                      {'mysql_engine': 'InnoDB'})
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    resolution = Column(Integer, nullable=False)
+    metric_id = Column(Integer, nullable=False)
+    host_id = Column(Integer, nullable=False)
+    instance_id = Column(Integer, nullable=False)
+    timestamp = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+    min_value = Column(Float(precision=53), nullable=False)
+    max_value = Column(Float(precision=53), nullable=False)
+    sum_value = Column(Float(precision=53), nullable=False)
+
 class Config(BASE, VsmBase):
     """ configurable items for vsm, ceph, os, etc.
     """
@@ -819,3 +863,13 @@ class Config(BASE, VsmBase):
     section = Column('section', String(length=255), nullable=False)
     description = Column('description', String(length=255), nullable=True)
     alterable = Column('alterable', Boolean(create_constraint=True, name=None))
+
+class PeriodicTaskLease(BASE, VsmBase):
+    """ lease electing the host which runs the periodic tasks of a topic
+    """
+    __tablename__ = 'periodic_task_leases'
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    name = Column(String(length=255), nullable=False, unique=True)
+    holder = Column(String(length=255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -2,6 +2,9 @@
 
 """
 Insert the collected values into a mysql table
+
+The metric, host and instance names are interned in the dimension table,
+a row of the metrics table only holds their ids, the value and the time.
 """
 
 from Handler import Handler
@@ -29,10 +32,11 @@ class VSMMySQLHandler(Handler):
         self.database = self.config['database']
         self.table = self.config['table']
         self.col_time = self.config['col_time']
-        self.col_metric = self.config['col_metric']
         self.col_value = self.config['col_value']
-        self.col_hostname = self.config['col_hostname']
-        self.col_instance = self.config['col_instance']
+        self.dimension_table = self.config.get('dimension_table',
+                                               'metric_dimensions')
+        # (kind, name) -> id of the interned names
+        self.dimensions = {}
 
         # Connect
         self._connect()
@@ -72,6 +76,35 @@ class VSMMySQLHandler(Handler):
         # Just send the data
         self._send(str(metric))
 
+    def _dimension_id(self, cursor, kind, name):
+        """
+        Return the id of a metric, host or instance name, interning it
+        """
+        key = (kind, name)
+        if key not in self.dimensions:
+            cursor.execute("INSERT IGNORE INTO %s (kind, name, deleted) "
+                           "VALUES(%%s, %%s, 0)" % self.dimension_table,
+                           (kind, name))
+            cursor.execute("SELECT id FROM %s WHERE kind = %%s AND name = %%s"
+                           % self.dimension_table, (kind, name))
+            self.dimensions[key] = cursor.fetchone()[0]
+        return self.dimensions[key]
+
+    def _insert(self, metric, hostname, instance, timestamp, value):
+        """
+        Insert one value
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO %s (metric_id, host_id, instance_id, "
+                       "%s, %s, deleted) VALUES(%%s, %%s, %%s, %%s, %%s, 0)"
+                       % (self.table, self.col_time, self.col_value),
+                       (self._dimension_id(cursor, 'metric', metric),
+                        self._dimension_id(cursor, 'host', hostname),
+                        self._dimension_id(cursor, 'instance', instance),
+                        timestamp, float(value)))
+        cursor.close()
+        self.conn.commit()
+
     def _send(self, data):
         """
         Insert the data
@@ -80,14 +113,7 @@ class VSMMySQLHandler(Handler):
         data_name = data[0].split('.')
         if data_name[2] == 'cpu' and data_name[4] in ['system', 'user'] and data_name[3] == 'total' :
             try:
-                cursor = self.conn.cursor()
-                cursor.execute("INSERT INTO %s (%s, %s, %s, %s, %s) VALUES(%%s, %%s, %%s ,%%s, %%s)"
-                               % (self.table, self.col_metric, self.col_hostname, self.col_instance,
-                                  self.col_time, self.col_value),
-                               (data_name[4], data_name[1], '_'.join(data_name[2:4]), data[2], data[1]))
-
-                cursor.close()
-                self.conn.commit()
+                self._insert(data_name[4], data_name[1], '_'.join(data_name[2:4]), data[2], data[1])
             except BaseException, e:
                 self.log.error("VSMMySQLHandler: Failed sending data. %s.", e)
                 self._connect()
@@ -95,14 +121,7 @@ class VSMMySQLHandler(Handler):
             metric_name = '_'.join(data_name[6:])
             if metric_name in ['osd_op_r','osd_op_w','osd_op_rw','osd_op_in_bytes','osd_op_out_bytes','osd_op_rw_latency_avgcount','osd_op_r_latency_avgcount','osd_op_w_latency_avgcount','osd_op_rw_latency_sum','osd_op_r_latency_sum','osd_op_w_latency_sum']:
                 try:
-                    cursor = self.conn.cursor()
-                    cursor.execute("INSERT INTO %s (%s, %s, %s, %s, %s) VALUES(%%s, %%s, %%s ,%%s, %%s)"
-                                   % (self.table, self.col_metric, self.col_hostname, self.col_instance,
-                                      self.col_time, self.col_value),
-                                   ('_'.join(data_name[6:]), data_name[1], '_'.join(data_name[4:6]), data[2], data[1]))
-
-                    cursor.close()
-                    self.conn.commit()
+                    self._insert('_'.join(data_name[6:]), data_name[1], '_'.join(data_name[4:6]), data[2], data[1])
                 except BaseException, e:
                     # Log Error
                     self.log.error("VSMMySQLHandler: Failed sending data. %s.", e)
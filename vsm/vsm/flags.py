@@ -259,6 +259,22 @@ global_opts = [
     cfg.StrOpt('ssh_config',
                default='/etc/ssh/ssh_config',
                help='ssh config file path in ~/.ssh'),
+    cfg.IntOpt('ssh_pool_max_per_host',
+               default=4,
+               help='Maximum number of ssh sessions, and of concurrent '
+                    'remote commands, per host.'),
+    cfg.IntOpt('ssh_pool_idle_timeout',
+               default=300,
+               help='Seconds an unused ssh session is kept open.'),
+    cfg.IntOpt('ssh_keepalive_interval',
+               default=30,
+               help='Interval (secs) of the keepalive packets sent on the '
+                    'pooled ssh sessions.'),
+    cfg.StrOpt('ssh_control_path',
+               default='$state_path/ssh/%r@%h:%p',
+               help='ControlPath of the master connections shared by the '
+                    'ssh commands run through rootwrap. Its directory is '
+                    'created if missing and only its owner may enter it.'),
     cfg.StrOpt('etc_hosts',
                default='/etc/hosts',
                help='host name list'),
@@ -277,6 +293,10 @@ global_opts = [
     cfg.StrOpt('osd_data_path',
                default='/var/lib/ceph/osd/',
                help='OSD data path to store information.'),
+    cfg.IntOpt('osd_provision_workers',
+               default=4,
+               help='Number of disks of a server formatted and mounted at '
+                    'the same time when osds are added.'),
     cfg.StrOpt('agent_manager',
                default='vsm.agent.manager.AgentManager',
                help='full class name for the Manager for Conductor'),
@@ -326,6 +346,12 @@ global_opts = [
                default=None,
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run the commands as root through one long-lived '
+                     'vsm-rootwrap-daemon per service instead of starting '
+                     'sudo and vsm-rootwrap for every command. Needs '
+                     'rootwrap_config.'),
     cfg.BoolOpt('monkey_patch',
                 default=False,
                 help='Whether to log monkey patching'),
@@ -338,6 +364,22 @@ global_opts = [
     cfg.IntOpt('server_ping_time',
                default=5,
                help='The interval of time to ping other servers.'),
+    cfg.IntOpt('node_down_heartbeat_age',
+               default=60,
+               help='Seconds without heartbeat from the agent of a node '
+                    'after which the node is suspected to be down.'),
+    cfg.IntOpt('node_up_heartbeat_age',
+               default=20,
+               help='An unavailable node is probed again once the last '
+                    'heartbeat of its agent is younger than this. Keep it '
+                    'below node_down_heartbeat_age.'),
+    cfg.IntOpt('node_down_confirm_count',
+               default=3,
+               help='Number of checks in a row a node must be suspected '
+                    'before it is probed and marked unavailable.'),
+    cfg.IntOpt('node_probe_workers',
+               default=8,
+               help='Number of nodes probed over RPC at the same time.'),
     cfg.IntOpt('ping_count',
                default=5,
                help='The hop that ping will walk.'),
@@ -411,6 +453,14 @@ osd_opts = [
     cfg.StrOpt('osd_out_down_autoout',
               default='Out-Down-Autoout',
               help='osd out down autoout status'),
+    cfg.IntOpt('osd_state_wait_timeout',
+               default=600,
+               help='Seconds to wait for an osd to reach a state, e.g. down '
+                    'after it is stopped.'),
+    cfg.IntOpt('mon_quorum_wait_timeout',
+               default=180,
+               help='Seconds to wait for the monitors to form a quorum '
+                    'after one is added or removed.'),
 ]
 
 FLAGS.register_opts(osd_opts)
@@ -448,6 +498,12 @@ summary_type_opts = [
     cfg.StrOpt('summary_type_pg',
               default='pg',
               help='summary type pg'),
+    cfg.StrOpt('summary_type_pg_state',
+              default='pg_state',
+              help='summary type pg state'),
+    cfg.StrOpt('summary_type_osd_capacity',
+              default='osd_capacity',
+              help='summary type osd capacity'),
     cfg.StrOpt('summary_type_mon',
               default='mon',
               help='summary type mon'),
@@ -517,3 +573,52 @@ vsm_settings_opts = [
 ]
 
 FLAGS.register_opts(vsm_settings_opts)
+
+metric_opts = [
+    cfg.ListOpt('metric_rollups',
+                default=['60:7', '300:30', '3600:365'],
+                help='Resolutions (secs) the performance metrics are '
+                     'downsampled to, each with the number of days its '
+                     'rollups are kept, as <resolution>:<days>.'),
+    cfg.IntOpt('metric_rollup_delay',
+               default=120,
+               help='Seconds to wait for late samples before a rollup '
+                    'bucket is closed.'),
+    cfg.IntOpt('metric_rollup_max_buckets',
+               default=1440,
+               help='Maximum number of buckets of one resolution rolled up '
+                    'per run, to spread the backfill of a large history.'),
+    cfg.IntOpt('metrics_max_points',
+               default=720,
+               help='Default point budget of a performance chart; the '
+                    'finest resolution giving at most this many points is '
+                    'used.'),
+    cfg.IntOpt('metrics_retention_interval',
+               default=300,
+               help='Seconds between two runs of the removal of the '
+                    'performance metrics older than '
+                    'keep_performance_data_days.'),
+    cfg.IntOpt('metrics_retention_batch_size',
+               default=5000,
+               help='Maximum number of expired metrics deleted by one '
+                    'statement.'),
+    cfg.IntOpt('metrics_retention_max_batches',
+               default=200,
+               help='Maximum number of delete statements per run, the rest '
+                    'is left to the next run.'),
+    cfg.FloatOpt('metrics_retention_batch_pause',
+                 default=0.2,
+                 help='Seconds to wait between two delete statements so '
+                      'the inserts and the queries get the table.'),
+    cfg.BoolOpt('metrics_partition_by_day',
+                default=False,
+                help='On mysql, partition the metrics table by day and drop '
+                     'the expired days instead of deleting their rows. The '
+                     'table is rebuilt once when this is first enabled.'),
+    cfg.IntOpt('metrics_partition_days_ahead',
+               default=3,
+               help='Number of daily metrics partitions created in '
+                    'advance.'),
+]
+
+FLAGS.register_opts(metric_opts)
@@ -31,15 +31,15 @@
 
 import datetime
 import time
-import random
 
+import eventlet
+from eventlet import greenpool
 from oslo.config import cfg
 from vsm import flags
 from vsm.openstack.common.gettextutils import _
 from vsm.openstack.common import log as logging
 from vsm.openstack.common import timeutils
 from vsm import db
-from vsm import utils
 
 FLAGS = flags.FLAGS
 
@@ -48,6 +48,20 @@ periodic_opts = [
                 default=True,
                 help=('Some periodic tasks can be run in a separate process. '
                       'Should we run them here?')),
+    cfg.IntOpt('periodic_task_lease_duration',
+               default=180,
+               help='Seconds the host elected to run the periodic tasks of '
+                    'a topic keeps the lease without renewing it, should '
+                    'be longer than periodic_interval.'),
+    cfg.IntOpt('periodic_task_workers',
+               default=8,
+               help='Number of periodic tasks of a service which can run '
+                    'at the same time.'),
+    cfg.IntOpt('periodic_task_timeout',
+               default=300,
+               help='Seconds a periodic task may run before it is '
+                    'interrupted, unless the task sets its own timeout. '
+                    '0 means no timeout.'),
 ]
 
 CONF = cfg.CONF
@@ -60,6 +74,18 @@ DEFAULT_INTERVAL = 60.0
 class InvalidPeriodicTaskArg(Exception):
     message = _("Unexpected argument for periodic task creation: %(arg)s.")
 
+def _lease_name(service_topic):
+    return 'periodic_task:%s' % service_topic
+
+
+def lease_holder(context, service_topic):
+    """Host running the service_topic tasks, None if nobody does now."""
+    lease = db.lease_get(context, _lease_name(service_topic))
+    if lease and lease['expires_at'] > timeutils.utcnow():
+        return lease['holder']
+    return None
+
+
 def periodic_task(*args, **kwargs):
     """Decorator to indicate that a method is a periodic task.
 
@@ -77,6 +103,9 @@ def periodic_task(*args, **kwargs):
            run_immediately is omitted or set to 'False', the first time the
            task runs will be approximately N seconds after the task scheduler
            starts.
+
+        The optional timeout argument gives the seconds the task may run,
+        instead of periodic_task_timeout.
     """
     def decorator(f):
         # Test for old style invocation
@@ -95,6 +124,7 @@ def periodic_task(*args, **kwargs):
         f._periodic_spacing = kwargs.pop('spacing', 0)
         f._periodic_immediate = kwargs.pop('run_immediately', False)
         f._service_topic = kwargs.pop('service_topic', None)
+        f._periodic_timeout = kwargs.pop('timeout', None)
         if f._periodic_immediate:
             f._periodic_last_run = None
         else:
@@ -147,6 +177,11 @@ class _PeriodicTasksMeta(type):
         except AttributeError:
             cls._service_topic = {}
 
+        try:
+            cls._periodic_timeout = cls._periodic_timeout.copy()
+        except AttributeError:
+            cls._periodic_timeout = {}
+
         for value in cls.__dict__.values():
             if getattr(value, '_periodic_task', False):
                 task = value
@@ -166,12 +201,20 @@ class _PeriodicTasksMeta(type):
                 cls._periodic_spacing[name] = task._periodic_spacing
                 cls._periodic_last_run[name] = task._periodic_last_run
                 cls._service_topic[name] = task._service_topic
+                cls._periodic_timeout[name] = task._periodic_timeout
 
 class PeriodicTasks(object):
     __metaclass__ = _PeriodicTasksMeta
 
     def run_periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
+        """Tasks to be run at a periodic interval.
+
+        Due tasks are started on a pool of periodic_task_workers green
+        threads and this returns without waiting for them. A task still
+        running since an earlier call is skipped and counted as an
+        overrun. With raise_on_error the tasks run one after another in
+        the caller.
+        """
         idle_for = DEFAULT_INTERVAL
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
@@ -186,43 +229,163 @@ class PeriodicTasks(object):
                     continue 
 
             # If a periodic task is _nearly_ due, then we'll run it early
+            lateness = 0
             if spacing is not None and last_run is not None:
                 due = last_run + datetime.timedelta(seconds=spacing)
                 if not timeutils.is_soon(due, 0.2):
                     idle_for = min(idle_for, timeutils.delta_seconds(now, due))
                     continue
+                lateness = max(0, timeutils.delta_seconds(due, now))
 
             if spacing is not None:
                 idle_for = min(idle_for, spacing)
 
+            running = self._periodic_running()
+            if task_name in running:
+                # Keep last_run, it starts on the next call after it ends.
+                self._periodic_task_stats(task_name)['overruns'] += 1
+                LOG.warn(_("%s is still running, skip this run.") %
+                         full_task_name)
+                continue
+
             self._periodic_last_run[task_name] = timeutils.utcnow()
 
-            try:
-                task(self, context)
-            except Exception as e:
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
-                if raise_on_error:
-                    raise
+            if raise_on_error:
+                self._run_periodic_task(context, task_name, task, lateness,
+                                        raise_on_error=True)
+            else:
+                running[task_name] = self._periodic_pool().spawn(
+                    self._run_periodic_task, context, task_name, task,
+                    lateness)
             time.sleep(0)
 
         return idle_for
 
+    def _periodic_pool(self):
+        if self.__dict__.get('_periodic_workers') is None:
+            self._periodic_workers = \
+                greenpool.GreenPool(max(1, CONF.periodic_task_workers))
+        return self._periodic_workers
+
+    def _periodic_running(self):
+        return self.__dict__.setdefault('_periodic_threads', {})
+
+    def _periodic_task_stats(self, task_name):
+        all_stats = self.__dict__.setdefault('_periodic_stats', {})
+        stats = all_stats.get(task_name)
+        if stats is None:
+            stats = all_stats[task_name] = {'runs': 0,
+                                            'failures': 0,
+                                            'timeouts': 0,
+                                            'overruns': 0,
+                                            'last_duration': None,
+                                            'max_duration': 0,
+                                            'total_duration': 0,
+                                            'last_lateness': None,
+                                            'max_lateness': 0,
+                                            'last_run_at': None}
+        return stats
+
+    def _run_periodic_task(self, context, task_name, task, lateness,
+                           raise_on_error=False):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        timeout = self._periodic_timeout.get(task_name)
+        if timeout is None:
+            timeout = CONF.periodic_task_timeout
+        stats = self._periodic_task_stats(task_name)
+        stats['last_run_at'] = timeutils.utcnow()
+        stats['last_lateness'] = lateness
+        stats['max_lateness'] = max(stats['max_lateness'], lateness)
+        start = time.time()
+        try:
+            with eventlet.Timeout(timeout or None):
+                task(self, context)
+        except eventlet.Timeout:
+            stats['timeouts'] += 1
+            LOG.error(_("%(full_task_name)s did not finish in "
+                        "%(timeout)s seconds, interrupted.") % locals())
+            if raise_on_error:
+                raise
+        except Exception as e:
+            stats['failures'] += 1
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+            if raise_on_error:
+                raise
+        finally:
+            duration = time.time() - start
+            stats['runs'] += 1
+            stats['last_duration'] = duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            stats['total_duration'] += duration
+            self._periodic_running().pop(task_name, None)
+
+    def get_periodic_task_stats(self, context):
+        """Duration, lateness and overrun counters of the periodic tasks."""
+        running = self._periodic_running()
+        result = {}
+        for task_name, _task in self._periodic_tasks:
+            stats = dict(self._periodic_task_stats(task_name))
+            stats['running'] = task_name in running
+            stats['avg_duration'] = stats['runs'] and \
+                stats['total_duration'] / stats['runs'] or 0
+            if stats['last_run_at']:
+                stats['last_run_at'] = timeutils.isotime(stats['last_run_at'])
+            result[task_name] = stats
+        return result
+
+    def on_lease_acquired(self, context, service_topic):
+        """Called when this host starts running the service_topic tasks.
+
+        Another host may have run them meanwhile, state kept from an
+        earlier turn is stale.
+        """
+        pass
+
     def _running_on_this_host(self, context, service_topic):
-        running_on_this_host = False
-        host_list = []
-        sers = db.service_get_all_by_topic(context, service_topic)
-        for ser in sers:
-            init_node = db.init_node_get_by_host(context, ser['host'])
-            if utils.service_is_up(ser) and init_node and init_node['status'] == "Active":
-                host_list.append(ser['host'])
-
-        host_list.sort()
-        if len(host_list) == 0:
+        """Whether this host holds the lease of the service_topic tasks.
+
+        Only the holder of the lease runs them. The holder renews it once
+        half of it is used and a host without it asks again when it
+        expires, the answer is cached in between.
+        """
+        leases = self.__dict__.setdefault('_periodic_leases', {})
+        now = timeutils.utcnow()
+        cached = leases.get(service_topic)
+        if cached and now < cached[1]:
+            return cached[0]
+
+        host = FLAGS.host
+        name = _lease_name(service_topic)
+        duration = CONF.periodic_task_lease_duration
+        init_node = db.init_node_get_by_host(context, host)
+        if not init_node or init_node['status'] != "Active":
+            if cached and cached[0]:
+                db.lease_release(context, name, host)
+            leases[service_topic] = \
+                (False, now + datetime.timedelta(seconds=duration / 4))
             return False
 
-        select_host = random.randint(0, len(host_list)-1)
-        if host_list[select_host] == FLAGS.host:
-            running_on_this_host = True
+        try:
+            lease = db.lease_acquire(context, name, host, duration)
+        except Exception:
+            LOG.exception(_("Can not get the lease %s.") % name)
+            leases.pop(service_topic, None)
+            return False
 
-        return running_on_this_host
+        is_holder = lease['holder'] == host
+        if is_holder:
+            renew_at = lease['expires_at'] - \
+                datetime.timedelta(seconds=duration / 2)
+            if not (cached and cached[0]):
+                LOG.info(_("Run the periodic tasks of %s on this host.") %
+                         service_topic)
+                try:
+                    self.on_lease_acquired(context, service_topic)
+                except Exception:
+                    LOG.exception(_("Error during %s.on_lease_acquired") %
+                                  self.__class__.__name__)
+        else:
+            renew_at = lease['expires_at']
+        leases[service_topic] = (is_holder, renew_at)
+        return is_holder
@@ -0,0 +1,146 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Client of the rootwrap daemon.
+
+The daemon is started on the first command and again if it died. Idle
+connections are kept in a pool, several commands may run at the same
+time over separate connections.
+"""
+
+from eventlet.green import select
+from eventlet.green import socket
+from eventlet.green import subprocess
+from eventlet import semaphore
+
+from vsm.openstack.common.rootwrap import daemon
+
+
+class DaemonError(Exception):
+    pass
+
+
+class Client(object):
+    """Run commands through a rootwrap daemon.
+
+    :param daemon_cmd: command starting the daemon, e.g.
+                       ['sudo', 'vsm-rootwrap-daemon', '/etc/vsm/rootwrap.conf']
+    """
+
+    def __init__(self, daemon_cmd, max_idle=8):
+        self._daemon_cmd = list(daemon_cmd)
+        self._max_idle = max_idle
+        self._lock = semaphore.Semaphore()
+        self._proc = None
+        self._sock_path = None
+        self._key = None
+        self._idle = []
+
+    def _alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self):
+        with self._lock:
+            if self._alive():
+                return
+            self._idle = []
+            proc = subprocess.Popen(self._daemon_cmd,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    close_fds=True)
+            sock_path = proc.stdout.readline().strip()
+            key = proc.stdout.readline().strip()
+            if not sock_path or not key:
+                proc.wait()
+                raise DaemonError('%s exited with %s' %
+                                  (' '.join(self._daemon_cmd),
+                                   proc.returncode))
+            self._proc = proc
+            self._sock_path = sock_path
+            self._key = key.decode('hex')
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._sock_path)
+            challenge = daemon.recv_message(sock)['challenge']
+            daemon.send_message(sock, {'response': daemon.sign(
+                self._key, str(challenge))})
+            if not daemon.recv_message(sock).get('authenticated'):
+                raise DaemonError('The rootwrap daemon rejected the key')
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _get_connection(self):
+        if not self._alive():
+            self._start()
+        while self._idle:
+            sock = self._idle.pop()
+            # An idle connection has nothing to read unless the daemon
+            # closed it.
+            if not select.select([sock], [], [], 0)[0]:
+                return sock, True
+            sock.close()
+        return self._connect(), False
+
+    def _release(self, sock):
+        if len(self._idle) < self._max_idle:
+            self._idle.append(sock)
+        else:
+            sock.close()
+
+    def execute(self, cmd, stdin=None):
+        """Run cmd as root.
+
+        :returns: a (returncode, stdout, stderr) tuple.
+        """
+        request = {'cmd': [str(arg) for arg in cmd],
+                   'stdin': stdin.decode('latin-1')
+                   if stdin is not None else None}
+        while True:
+            sock, reused = self._get_connection()
+            try:
+                daemon.send_message(sock, request)
+            except socket.error:
+                sock.close()
+                # The request did not make it, a pooled connection is
+                # stale if the daemon died and the next one restarts it.
+                if not reused:
+                    raise
+                continue
+            try:
+                result = daemon.recv_message(sock)
+            except Exception:
+                # The command may have run, never send it again.
+                sock.close()
+                raise
+            self._release(sock)
+            return (result['returncode'],
+                    result['stdout'].encode('latin-1'),
+                    result['stderr'].encode('latin-1'))
+
+    def stop(self):
+        for sock in self._idle:
+            sock.close()
+        self._idle = []
+        if self._alive():
+            self._proc.stdin.close()
+            self._proc.wait()
+        self._proc = None
@@ -0,0 +1,243 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Rootwrap in daemon mode.
+
+`sudo vsm-rootwrap <config> <cmd>` starts a new python interpreter and
+reads the filters again for every command. The daemon is started once,
+through sudo, by the service running the commands. It reads the config
+and the filters once, listens on a unix socket in a new directory only
+the calling user can enter and writes the socket path and a random key
+on its stdout. Each client proves it knows the key by answering a
+challenge with a HMAC, then sends commands; each one is checked against
+the filters in memory and run like vsm-rootwrap would.
+
+The daemon exits when its stdin is closed, i.e. when the service which
+started it is gone.
+
+Messages are json objects prefixed by their length (4 bytes, network
+order). Outputs are sent as latin-1 so any byte makes it through.
+"""
+
+import ConfigParser
+import hashlib
+import hmac
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+from vsm.openstack.common.rootwrap import wrapper
+
+_HEADER = struct.Struct('!I')
+_MAX_MESSAGE = 64 * 1024 * 1024
+_KEY_BYTES = 32
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ProtocolError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def send_message(sock, message):
+    data = json.dumps(message)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if size > _MAX_MESSAGE:
+        raise ProtocolError('Message too big: %s bytes' % size)
+    return json.loads(_recv_exactly(sock, size))
+
+
+def sign(key, challenge):
+    return hmac.new(key, challenge, hashlib.sha256).hexdigest()
+
+
+def _compare(a, b):
+    # Constant time, hmac.compare_digest is missing before python 2.7.7.
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _subprocess_setup():
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+class RootwrapDaemon(object):
+    """Run the commands allowed by the filters of a rootwrap config."""
+
+    def __init__(self, config_path, owner_uid=None, owner_gid=None):
+        rawconfig = ConfigParser.RawConfigParser()
+        rawconfig.read(config_path)
+        self.config = wrapper.RootwrapConfig(rawconfig)
+        self.filters = wrapper.load_filters(self.config.filters_path)
+        self.key = os.urandom(_KEY_BYTES)
+        self.owner_uid = owner_uid
+        self.owner_gid = owner_gid
+        self.sock_dir = None
+        self.sock_path = None
+        self._server = None
+
+    def listen(self):
+        self.sock_dir = tempfile.mkdtemp(prefix='vsm-rootwrap-')
+        self.sock_path = os.path.join(self.sock_dir, 'rootwrap.sock')
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.sock_path)
+        self._server.listen(128)
+        if self.owner_uid is not None:
+            # mkdtemp made the directory 0700, give it to the caller only.
+            os.chown(self.sock_dir, self.owner_uid, self.owner_gid)
+            os.chown(self.sock_path, self.owner_uid, self.owner_gid)
+        return self.sock_path
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self.sock_dir:
+            shutil.rmtree(self.sock_dir, ignore_errors=True)
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _addr = self._server.accept()
+            except socket.error:
+                if self._server is None:
+                    return
+                raise
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _authenticate(self, conn):
+        challenge = os.urandom(_KEY_BYTES).encode('hex')
+        send_message(conn, {'challenge': challenge})
+        answer = recv_message(conn).get('response') or ''
+        ok = _compare(str(answer), sign(self.key, challenge))
+        send_message(conn, {'authenticated': ok})
+        return ok
+
+    def _serve(self, conn):
+        try:
+            if not self._authenticate(conn):
+                logging.error('Rejected a client with a wrong key')
+                return
+            while True:
+                try:
+                    request = recv_message(conn)
+                except ProtocolError:
+                    return
+                send_message(conn, self.run(request.get('cmd') or [],
+                                            request.get('stdin')))
+        except Exception, e:
+            logging.error('Rootwrap daemon connection failed: %s' % e)
+        finally:
+            conn.close()
+
+    def run(self, userargs, stdin=None):
+        """Run a command, returns a dict with returncode, stdout, stderr."""
+        userargs = [str(arg) for arg in userargs]
+        if not userargs:
+            return {'returncode': 99, 'stdout': '',
+                    'stderr': 'No command given'}
+        try:
+            match = wrapper.match_filter(self.filters, userargs,
+                                         exec_dirs=self.config.exec_dirs)
+        except wrapper.FilterMatchNotExecutable, e:
+            return {'returncode': 96, 'stdout': '',
+                    'stderr': 'Executable not found: %s' %
+                              e.match.exec_path}
+        except wrapper.NoFilterMatched:
+            logging.error('Unauthorized command: %s' % ' '.join(userargs))
+            return {'returncode': 99, 'stdout': '',
+                    'stderr': 'Unauthorized command: %s' %
+                              ' '.join(userargs)}
+
+        command = match.get_command(userargs, exec_dirs=self.config.exec_dirs)
+        if self.config.use_syslog:
+            logging.info('(%s > %s) Executing %s (filter match = %s)' % (
+                os.getenv('SUDO_USER'), os.getenv('USER'),
+                ' '.join(command), match.name))
+        try:
+            proc = subprocess.Popen(command,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    close_fds=True,
+                                    preexec_fn=_subprocess_setup,
+                                    env=match.get_environment(userargs))
+            stdin = stdin.encode('latin-1') if stdin is not None else None
+            out, err = proc.communicate(stdin)
+        except OSError, e:
+            return {'returncode': 126, 'stdout': '', 'stderr': str(e)}
+        return {'returncode': proc.returncode,
+                'stdout': out.decode('latin-1'),
+                'stderr': err.decode('latin-1')}
+
+
+def main(argv=None):
+    """Entry point of vsm-rootwrap-daemon <config>."""
+    argv = argv if argv is not None else sys.argv
+    if len(argv) < 2:
+        sys.stderr.write('Usage: %s <rootwrap config>\n' % argv[0])
+        sys.exit(1)
+
+    uid = os.getenv('SUDO_UID')
+    gid = os.getenv('SUDO_GID')
+    daemon = RootwrapDaemon(argv[1],
+                            owner_uid=int(uid) if uid else None,
+                            owner_gid=int(gid) if gid else -1)
+    if daemon.config.use_syslog:
+        wrapper.setup_syslog(argv[0], daemon.config.syslog_log_facility,
+                             daemon.config.syslog_log_level)
+    daemon.listen()
+    try:
+        sys.stdout.write('%s\n%s\n' % (daemon.sock_path,
+                                       daemon.key.encode('hex')))
+        sys.stdout.flush()
+
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.daemon = True
+        thread.start()
+        # Returns once the service which started us closed our stdin.
+        sys.stdin.read()
+    finally:
+        daemon.close()
@@ -120,6 +120,9 @@ class API(object):
     def get_smart_info(self, context, body=None):
         return self.scheduler_rpcapi.get_smart_info(context, body)
 
+    def get_smart_history(self, context, body=None):
+        return self.scheduler_rpcapi.get_smart_history(context, body)
+
     def start_server(self, context, body=None):
         return self.scheduler_rpcapi.start_server(context, body)
 
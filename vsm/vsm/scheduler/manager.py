@@ -29,6 +29,7 @@ from oslo.config import cfg
 import datetime
 import time
 import socket
+from eventlet import greenpool
 from vsm import db
 from vsm import exception
 from vsm import flags
@@ -446,7 +447,7 @@ class SchedulerManager(manager.Manager):
                 self._start_remove(context, ser['id'])
                 self._agent_rpcapi.remove_monitor(context,
                         ser['id'], mon_host)
-                time.sleep(60)
+                self._wait_monitor_removed(context, mon_host, ser)
                 self._agent_rpcapi.update_mon_state(context, active_monitor['host'])
                 is_unavail = True if ser['status'] == 'unavailable' else False
                 self._remove_success(context,
@@ -751,13 +752,12 @@ class SchedulerManager(manager.Manager):
         utils.sftp_copy(serverIp, user, key_file, local_path, remote_path)
         LOG.info("sftp deployrc file remote serverIp=%s" % serverIp)
 
-        ssh = utils.get_sshConn(serverIp, user, key_file)
+        ssh = utils.SSHClient(serverIp, user, key_file)
         cmd = "cd /opt; rm /etc/yum.repos.d/* -rf; " \
               "mv /opt/controller.repo /etc/yum.repos.d/; " \
               "tar -xvf controller.tar.gz; " \
               "chmod 777 winhongcephstroageinstall.sh; "
-        stdout, stderr = utils.ssh_execute(ssh, cmd)
-        ssh.close()
+        stdout, stderr = ssh.execute(cmd)
         LOG.info("ssh_execute cmd=%s" % cmd)
         print "stdout=%s" % stdout
         print "stderr=%s" % stderr
@@ -780,10 +780,8 @@ class SchedulerManager(manager.Manager):
         print "token=%s" % token
         print "status=%s" % status
 
-        ssh = utils.get_sshConn(serverIp, user, key_file)
         cmd = "/opt/winhongcephstroageinstall.sh %s %s > /var/log/winhongcephstroageinstall.log" % (controller_ip, token)
-        stdout, stderr = utils.ssh_execute(ssh, cmd)
-        ssh.close()
+        stdout, stderr = ssh.execute(cmd)
         LOG.info("ssh_execute cmd=%s" % cmd)
         print "stdout=%s" % stdout
         print "stderr=%s" % stderr
@@ -1195,6 +1193,26 @@ class SchedulerManager(manager.Manager):
         res = self._agent_rpcapi.add_new_zone(context, values['zone']['name'], host)
         return True
 
+    def _wait_monitor_removed(self, context, mon_host, server):
+        """Wait until the monitor of server left the monmap of mon_host
+        and the remaining monitors are all in quorum."""
+        addr = '%s:' % server['secondary_public_ip'].split(',')[0]
+
+        def _removed():
+            try:
+                jsout = self._agent_rpcapi.track_monitors(context, mon_host)
+            except Exception:
+                LOG.exception('can not get mon_status from %s' % mon_host)
+                return False
+            mons = jsout['monmap']['mons']
+            if [mon for mon in mons if mon['addr'].startswith(addr)]:
+                return False
+            return len(jsout['quorum']) == len(mons)
+
+        return utils.wait_for(_removed,
+                              timeout=FLAGS.mon_quorum_wait_timeout,
+                              name='removal of monitor %s' % server['host'])
+
     def _track_monitors(self, context, server_list):
         """Checking if all the monitors are in the quorum."""
         def _track_single_monitor(context, server):
@@ -1211,13 +1229,14 @@ class SchedulerManager(manager.Manager):
                 _update('Checking monitor')
                 jsout = self._agent_rpcapi.track_monitors(context,
                                                           server['host'])
-                try_times = 0
-                while try_times < 60 and \
-                      len(jsout['quorum']) < len(server_list):
-                    jsout = self._agent_rpcapi.track_monitors(context,
-                                                              server['host'])
-                    time.sleep(3)
-                    try_times = try_times + 1
+                if len(jsout['quorum']) < len(server_list):
+                    def _all_in_quorum():
+                        jsout = self._agent_rpcapi.track_monitors(
+                            context, server['host'])
+                        return len(jsout['quorum']) >= len(server_list)
+                    utils.wait_for(_all_in_quorum,
+                                   timeout=FLAGS.mon_quorum_wait_timeout,
+                                   name='quorum of %s' % server['host'])
 
                 _update('Success: checking monitor')
             except:
@@ -1737,8 +1756,7 @@ class SchedulerManager(manager.Manager):
         try:
             _update('Set crushmap')
             # Wait until it's created over.
-            while create_crushmap.is_alive():
-                time.sleep(1)
+            create_crushmap.join()
 
             def __set_crushmap(context, host):
                 self._agent_rpcapi.set_crushmap(context,
@@ -1752,8 +1770,7 @@ class SchedulerManager(manager.Manager):
             _update('ERROR: set crushmap')
 
         self._update_init_node(context, server_list)
-        while set_crushmap.is_alive():
-            time.sleep(1)
+        set_crushmap.join()
         self._agent_rpcapi.update_all_status(context,
             host=monitor_node['host'])
         self._agent_rpcapi.update_zones_from_crushmap_to_db(context,None,
@@ -1957,6 +1974,12 @@ class SchedulerManager(manager.Manager):
             res = self._agent_rpcapi.get_smart_info(context, host, device)
             return res
 
+    def get_smart_history(self, context, body):
+        ser = body['server']
+        if ser['status'] in ('Active', 'available'):
+            return self._agent_rpcapi.get_smart_history(context, ser['host'],
+                                                        body['device_path'])
+
     @utils.single_lock
     def monitor_restart(self, context, monitor_id):
         LOG.info('scheduler manager:monitor_restart')
@@ -2000,12 +2023,14 @@ class SchedulerManager(manager.Manager):
             server = db.init_node_get_by_id(context,id=server_id)
         elif server_name is not None:
             server = db.init_node_get_by_host(context,host=server_name)
-        self._agent_rpcapi.add_new_disks_to_cluster(context, body, server['host'])
+        res = self._agent_rpcapi.add_new_disks_to_cluster(context, body,
+                                                          server['host'])
         new_osd_count = int(server["data_drives_number"]) + len(body['osdinfo'])
         values = {"data_drives_number": new_osd_count}
         self._conductor_rpcapi.init_node_update(context,
                                         server["id"],
                                         values)
+        return res
 
     def add_batch_new_disks_to_cluster(self, context, body):
         """
@@ -2025,10 +2050,19 @@ class SchedulerManager(manager.Manager):
         :return:
         """
         disks = body.get('disks',[])
-        try:
-            for disk_in_same_server in disks:
-                self.add_new_disks_to_cluster(context, disk_in_same_server)
-        except:
+
+        # Each agent provisions the disks of its server, the servers are
+        # handled at the same time.
+        def _add_disks(disk_in_same_server):
+            try:
+                return self.add_new_disks_to_cluster(context,
+                                                     disk_in_same_server)
+            except Exception:
+                LOG.exception('failed to add disks %s' % disk_in_same_server)
+                return False
+
+        pool = greenpool.GreenPool(max(1, len(disks)))
+        if False in list(pool.imap(_add_disks, disks)):
             return {"message":"data error"}
         return {"message": "success"}
 
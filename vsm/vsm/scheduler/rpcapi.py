@@ -59,6 +59,9 @@ class SchedulerAPI(vsm.openstack.common.rpc.proxy.RpcProxy):
     def get_smart_info(self, ctxt, body=None):
         return self.call(ctxt, self.make_msg('get_smart_info', body=body))
 
+    def get_smart_history(self, ctxt, body=None):
+        return self.call(ctxt, self.make_msg('get_smart_history', body=body))
+
     def list_storage_pool(self, ctxt):
         ret = self.call(ctxt, self.make_msg('list_storage_pool'))
         return ret
@@ -19,3 +19,12 @@
 :mod:`vsm` -- Cloud IaaS Platform
 ===================================
 """
+
+from vsm import flags
+from vsm.db.sqlalchemy import models
+from vsm.db.sqlalchemy import session
+
+# The agent reads its task intervals from vsm_settings when it is
+# imported, give the tests an empty in-memory DB.
+flags.FLAGS.set_override('sql_connection', 'sqlite://')
+models.VsmSettings.__table__.create(session.get_engine())
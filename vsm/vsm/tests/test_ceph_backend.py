@@ -0,0 +1,184 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests of the ceph command backends.
+"""
+
+import json
+import unittest
+
+from vsm.agent import ceph_backend
+from vsm import exception
+
+
+class ParseMonCommandTestCase(unittest.TestCase):
+
+    def _parse(self, cmdline):
+        return ceph_backend.parse_mon_command(cmdline.split())
+
+    def test_read_only_queries(self):
+        self.assertEqual(({'prefix': 'status', 'format': 'json'}, None),
+                         self._parse('ceph status -f json-pretty'))
+        self.assertEqual(({'prefix': 'osd dump', 'format': 'json'}, None),
+                         self._parse('ceph osd dump --format json'))
+        self.assertEqual(({'prefix': 'health'}, None),
+                         self._parse('ceph health'))
+        self.assertEqual(({'prefix': 'health', 'detail': 'detail'}, None),
+                         self._parse('ceph health detail'))
+        self.assertEqual(({'prefix': 'osd pool stats', 'format': 'json'},
+                          None),
+                         self._parse('ceph osd pool stats -f json'))
+
+    def test_typed_arguments(self):
+        self.assertEqual(({'prefix': 'osd tree', 'epoch': 12}, None),
+                         self._parse('ceph osd tree 12'))
+        self.assertEqual(({'prefix': 'pg dump',
+                           'dumpcontents': ['pgs_brief'],
+                           'format': 'json'}, None),
+                         self._parse('ceph pg dump pgs_brief -f json'))
+
+    def test_connect_timeout(self):
+        self.assertEqual(({'prefix': 'status'}, 10),
+                         self._parse('ceph --connect-timeout 10 status'))
+
+    def test_longest_prefix(self):
+        # `osd pool stats` and not `osd` with two arguments.
+        command, _timeout = self._parse('ceph osd pool stats rbd')
+        self.assertEqual({'prefix': 'osd pool stats', 'name': 'rbd'},
+                         command)
+
+    def test_falls_back_for_writes(self):
+        for cmdline in ('ceph osd pool create rbd 64 64',
+                        'ceph osd out 1',
+                        'ceph osd crush reweight osd.1 0.5',
+                        'ceph auth get-or-create client.vsm',
+                        'ceph osd pool set rbd size 3'):
+            self.assertEqual((None, None), self._parse(cmdline), cmdline)
+
+    def test_falls_back_for_cli_options(self):
+        for cmdline in ('ceph -c /etc/ceph/ceph.conf status',
+                        'ceph --keyring /etc/ceph/keyring health',
+                        'ceph -w',
+                        'ceph status -f',
+                        'ceph --connect-timeout'):
+            self.assertEqual((None, None), self._parse(cmdline), cmdline)
+
+    def test_falls_back_for_bad_arguments(self):
+        # Not an epoch, too many arguments.
+        self.assertEqual((None, None), self._parse('ceph osd dump abc'))
+        self.assertEqual((None, None), self._parse('ceph osd ls 1'))
+        self.assertEqual((None, None), self._parse('ceph osd tree 1 2'))
+
+    def test_falls_back_for_other_commands(self):
+        self.assertEqual((None, None), self._parse('rbd ls'))
+        self.assertEqual((None, None), self._parse('ceph'))
+        self.assertEqual((None, None), ceph_backend.parse_mon_command([]))
+
+
+class FakeClient(object):
+    """A rados client answering every monitor command."""
+
+    def __init__(self, out):
+        self.out = out
+        self.commands = []
+
+    def mon_command(self, command, inbuf, timeout=None):
+        self.commands.append(json.loads(command))
+        return 0, self.out, ''
+
+
+class RadosBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = ceph_backend.RadosBackend()
+        self.client = FakeClient('{"epoch": 7}')
+        self.backend._get_client = lambda: self.client
+        self.subprocess_calls = []
+        self._execute = ceph_backend.SubprocessBackend.execute
+
+        def execute(backend, *cmd, **kwargs):
+            self.subprocess_calls.append((list(cmd), kwargs))
+            return ('subprocess', '')
+        ceph_backend.SubprocessBackend.execute = execute
+
+    def tearDown(self):
+        ceph_backend.SubprocessBackend.execute = self._execute
+
+    def test_query_through_librados(self):
+        self.assertEqual({'epoch': 7},
+                         self.backend.execute_json('ceph', 'osd', 'dump',
+                                                   '-f', 'json'))
+        self.assertEqual([{'prefix': 'osd dump', 'format': 'json'}],
+                         self.client.commands)
+        self.assertEqual([], self.subprocess_calls)
+
+    def test_write_through_subprocess(self):
+        out, _err = self.backend.execute('ceph', 'osd', 'out', '1')
+        self.assertEqual('subprocess', out)
+        self.assertEqual([(['ceph', 'osd', 'out', '1'], {})],
+                         self.subprocess_calls)
+        self.assertEqual([], self.client.commands)
+
+    def test_no_connection(self):
+        self.backend._get_client = lambda: None
+        out, _err = self.backend.execute('ceph', 'status')
+        self.assertEqual('subprocess', out)
+        self.assertEqual(1, len(self.subprocess_calls))
+
+    def test_mon_command_error(self):
+        self.client.mon_command = lambda command, inbuf, timeout=None: \
+            (-2, '', 'error ENOENT')
+        self.assertRaises(exception.ProcessExecutionError,
+                          self.backend.execute, 'ceph', 'osd', 'ls')
+
+
+class FakeBackendTestCase(unittest.TestCase):
+
+    def test_load(self):
+        backend = ceph_backend.load_ceph_backend(
+            'vsm.agent.ceph_backend.FakeBackend')
+        self.assertTrue(isinstance(backend, ceph_backend.FakeBackend))
+
+    def test_responses_by_prefix(self):
+        backend = ceph_backend.FakeBackend({'osd ls': [0, 1]})
+        backend.set_response('health', 'HEALTH_OK\n')
+        self.assertEqual([0, 1], backend.execute_json('ceph', 'osd', 'ls',
+                                                      '-f', 'json-pretty'))
+        self.assertEqual(('HEALTH_OK\n', ''),
+                         backend.execute('ceph', 'health'))
+        self.assertEqual([['ceph', 'osd', 'ls', '-f', 'json-pretty'],
+                          ['ceph', 'health']], backend.calls)
+
+    def test_write_commands_by_argv(self):
+        backend = ceph_backend.FakeBackend({'ceph osd out 1': ''})
+        self.assertEqual(('', ''), backend.execute('ceph', 'osd', 'out', 1))
+
+    def test_missing_response(self):
+        backend = ceph_backend.FakeBackend()
+        self.assertRaises(exception.ProcessExecutionError,
+                          backend.execute, 'ceph', 'status')
+
+    def test_exception_response(self):
+        error = exception.ProcessExecutionError(exit_code=1, stderr='down')
+        backend = ceph_backend.FakeBackend({'status': error})
+        self.assertRaises(exception.ProcessExecutionError,
+                          backend.execute, 'ceph', 'status')
+
+
+if __name__ == '__main__':
+    unittest.main()
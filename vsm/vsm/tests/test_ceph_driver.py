@@ -0,0 +1,105 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests of the CephDriver queries, run against the fake ceph backend.
+"""
+
+import json
+import unittest
+
+from vsm.agent import ceph_backend
+from vsm.agent import driver
+from vsm import exception
+
+OSD_DUMP = {
+    'epoch': 42,
+    'osds': [{'osd': 0, 'up': 1, 'in': 1},
+             {'osd': 1, 'up': 0, 'in': 1}],
+}
+
+
+class CephDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # The constructor connects to the conductor, only the backend is
+        # needed here.
+        self.driver = driver.CephDriver.__new__(driver.CephDriver)
+        self.backend = ceph_backend.load_ceph_backend(
+            'vsm.agent.ceph_backend.FakeBackend')
+        self.driver._backend = self.backend
+
+    def test_run_cmd_to_json(self):
+        self.backend.set_response('osd dump', OSD_DUMP)
+        self.assertEqual(OSD_DUMP,
+                         self.driver._run_cmd_to_json(['ceph', 'osd',
+                                                       'dump']))
+        self.assertEqual([['ceph', 'osd', 'dump', '-f', 'json-pretty']],
+                         self.backend.calls)
+
+    def test_run_cmd_to_json_not_pretty(self):
+        self.backend.set_response('osd ls', [0, 1])
+        self.assertEqual([0, 1], self.driver._run_cmd_to_json(
+            ['ceph', 'osd', 'ls', '-f', 'json'], pretty=False))
+        self.assertEqual([['ceph', 'osd', 'ls', '-f', 'json']],
+                         self.backend.calls)
+
+    def test_run_cmd_to_json_empty(self):
+        self.backend.set_response('osd dump', '')
+        self.assertEqual(None,
+                         self.driver._run_cmd_to_json(['ceph', 'osd',
+                                                       'dump']))
+
+    def test_run_cmd_to_json_error(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          self.driver._run_cmd_to_json,
+                          ['ceph', 'osd', 'dump'])
+
+    def test_get_osds_status(self):
+        self.backend.set_response('osd dump', OSD_DUMP)
+        self.assertEqual(OSD_DUMP,
+                         json.loads(self.driver.get_osds_status()))
+        self.assertEqual([['ceph', 'osd', 'dump', '-f', 'json']],
+                         self.backend.calls)
+
+    def test_get_osds_status_empty(self):
+        self.backend.set_response('osd dump', '')
+        self.assertEqual(None, self.driver.get_osds_status())
+
+    def test_get_ceph_health_list(self):
+        self.backend.set_response(
+            'health', 'HEALTH_WARN 8 pgs degraded; 1/3 in osds are down\n')
+        self.assertEqual(['HEALTH_WARN', '8 pgs degraded',
+                          '1/3 in osds are down'],
+                         self.driver.get_ceph_health_list())
+        self.assertEqual([['ceph', 'health']], self.backend.calls)
+
+    def test_get_ceph_health_list_ok(self):
+        self.backend.set_response('health', 'HEALTH_OK\n')
+        self.assertEqual(['HEALTH_OK', ''],
+                         self.driver.get_ceph_health_list())
+
+    def test_get_ceph_health_list_error(self):
+        self.backend.set_response(
+            'health', exception.ProcessExecutionError(exit_code=1,
+                                                      stderr='timed out'))
+        self.assertRaises(exception.ProcessExecutionError,
+                          self.driver.get_ceph_health_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
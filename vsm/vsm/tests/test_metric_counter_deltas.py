@@ -0,0 +1,166 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 Intel
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare _metric_counter_deltas with the per step query it replaced.
+"""
+
+import random
+import unittest
+
+import sqlalchemy
+
+from vsm.db.sqlalchemy import api
+
+INTERVAL = 15
+BASE = 1400000000
+
+# The query sum_performance_metrics ran for every step before the single
+# scan, kept here as the reference.
+STEP_SQL = '''
+    SELECT   sum(metrics_join.value_real) AS sum_1, count(metrics_join.value_real) AS count_1,metrics_join.instance_real AS metrics_instance
+    FROM
+    (select m.value-m_pre.value_pre as value_real ,m.instance_id as instance_real
+      from (select instance_id,host_id,value from metrics WHERE metrics.metric_id = :metric_id AND metrics.timestamp >= :time_1 AND metrics.timestamp < :time_2) as m
+      left join (select instance_id,host_id,max(value) as value_pre from metrics WHERE metrics.metric_id = :metric_id AND metrics.timestamp >= :time_1-2*:interval  AND metrics.timestamp < :time_2-:interval  group by instance_id,host_id ) as m_pre
+      on  m.instance_id=m_pre.instance_id and m.host_id=m_pre.host_id
+    ) as metrics_join
+'''
+
+
+def make_samples(seed, steps=120, jitter=0, missing=0.0, reset_at=None):
+    """Counter samples of 2 hosts x 2 instances of metric 1.
+
+    :param jitter: max seconds a sample is taken early or late.
+    :param missing: ratio of samples dropped.
+    :param reset_at: step at which the counters of host 1 restart from 0.
+    """
+    rnd = random.Random(seed)
+    samples = []
+    for host_id in (1, 2):
+        for instance_id in (10, 11):
+            value = 0
+            for step in range(steps):
+                value += rnd.randint(0, 500)
+                if reset_at is not None and host_id == 1 and step == reset_at:
+                    value = rnd.randint(0, 50)
+                if rnd.random() < missing:
+                    continue
+                timestamp = BASE + step * INTERVAL + \
+                    rnd.randint(-jitter, jitter)
+                samples.append((1, host_id, instance_id, timestamp, value))
+    return samples
+
+
+class MetricCounterDeltasTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        self.engine.execute('CREATE TABLE metrics (metric_id INTEGER, '
+                            'host_id INTEGER, instance_id INTEGER, '
+                            'timestamp INTEGER, value FLOAT)')
+
+    def _load(self, samples):
+        self.engine.execute('INSERT INTO metrics VALUES (?, ?, ?, ?, ?)',
+                            samples)
+
+    def _series_rows(self, timestamp_from, timestamp_to):
+        # What _metric_series_rows returns.
+        return [tuple(row) for row in self.engine.execute(
+            'SELECT metric_id, host_id, instance_id, timestamp, value '
+            'FROM metrics WHERE timestamp >= ? AND timestamp < ? '
+            'ORDER BY metric_id, host_id, instance_id, timestamp',
+            timestamp_from, timestamp_to)]
+
+    def _step_queries(self, timestamp_start, timestamp_end):
+        expected = {}
+        cur = timestamp_start
+        while cur < timestamp_end:
+            for total, count, _instance in self.engine.execute(
+                    sqlalchemy.text(STEP_SQL),
+                    metric_id=1, time_1=cur - (INTERVAL - 1),
+                    time_2=cur + 1, interval=INTERVAL).fetchall():
+                if total is not None:
+                    expected[(1, cur)] = (total, count)
+            cur += INTERVAL
+        return expected
+
+    def _single_scan(self, timestamp_start, timestamp_end):
+        rows = self._series_rows(timestamp_start - 3 * INTERVAL + 1,
+                                 timestamp_end)
+        deltas = api._metric_counter_deltas(rows, timestamp_start,
+                                            timestamp_end, INTERVAL)
+        return dict((key, (total, count))
+                    for key, (total, count, _instance) in deltas.iteritems())
+
+    def _assert_same(self, samples, timestamp_start, timestamp_end):
+        self._load(samples)
+        expected = self._step_queries(timestamp_start, timestamp_end)
+        self.assertTrue(expected)
+        self.assertEqual(expected,
+                         self._single_scan(timestamp_start, timestamp_end))
+
+    def test_regular_samples(self):
+        self._assert_same(make_samples(1),
+                          BASE + 10 * INTERVAL, BASE + 100 * INTERVAL)
+
+    def test_jitter(self):
+        self._assert_same(make_samples(2, jitter=5),
+                          BASE + 10 * INTERVAL + 7, BASE + 100 * INTERVAL)
+
+    def test_missing_samples(self):
+        self._assert_same(make_samples(3, jitter=3, missing=0.3),
+                          BASE + 10 * INTERVAL, BASE + 100 * INTERVAL)
+
+    def test_counter_reset(self):
+        samples = make_samples(4, jitter=2, reset_at=50)
+        self._assert_same(samples, BASE + 10 * INTERVAL,
+                          BASE + 100 * INTERVAL)
+        # The step of the reset has a negative increase, like before.
+        deltas = self._single_scan(BASE + 49 * INTERVAL,
+                                   BASE + 52 * INTERVAL)
+        self.assertTrue(min(total for total, _count
+                            in deltas.itervalues()) < 0)
+
+    def test_range_past_the_samples(self):
+        # Starts before the first sample and ends after the last one.
+        self._assert_same(make_samples(5, jitter=4, missing=0.1),
+                          BASE - 20 * INTERVAL, BASE + 150 * INTERVAL)
+
+    def test_range_without_samples(self):
+        self._load(make_samples(6))
+        start = BASE + 200 * INTERVAL
+        self.assertEqual({}, self._step_queries(start, start + 10 * INTERVAL))
+        self.assertEqual({}, self._single_scan(start, start + 10 * INTERVAL))
+
+    def test_empty_range(self):
+        self._load(make_samples(7))
+        self.assertEqual({}, self._single_scan(BASE + 50 * INTERVAL,
+                                               BASE + 50 * INTERVAL))
+
+    def test_instance_of_first_series(self):
+        self._load(make_samples(8))
+        rows = self._series_rows(BASE, BASE + 20 * INTERVAL)
+        deltas = api._metric_counter_deltas(rows, BASE + 5 * INTERVAL,
+                                            BASE + 20 * INTERVAL, INTERVAL)
+        self.assertEqual(set([10]),
+                         set(instance for _total, _count, instance
+                             in deltas.itervalues()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -58,12 +58,14 @@ from eventlet import event
 from eventlet.green import subprocess
 from eventlet import greenthread
 from eventlet import pools
+from eventlet import semaphore
 
 from vsm import exception
 from vsm import flags
 from vsm.openstack.common import excutils
 from vsm.openstack.common import importutils
 from vsm.openstack.common import log as logging
+from vsm.openstack.common.rootwrap import client as rootwrap_client
 from vsm.openstack.common import timeutils
 from vsm.openstack.common.gettextutils import _
 from vsm import ipcalc
@@ -218,6 +220,25 @@ def lcoal_execute(*cmd, **kwargs):
             greenthread.sleep(0)
 
 
+_ROOTWRAP_DAEMON = None
+
+
+def rootwrap_daemon():
+    """The client of the rootwrap daemon of this process."""
+    global _ROOTWRAP_DAEMON
+    if _ROOTWRAP_DAEMON is None:
+        _ROOTWRAP_DAEMON = rootwrap_client.Client(
+            ['sudo', 'vsm-rootwrap-daemon', FLAGS.rootwrap_config])
+    return _ROOTWRAP_DAEMON
+
+
+def root_command(*cmd):
+    """Prefix cmd with the root wrapper used by execute(run_as_root=True)."""
+    if FLAGS.rootwrap_config is not None:
+        return ['sudo', 'vsm-rootwrap', FLAGS.rootwrap_config] + list(cmd)
+    return shlex.split(FLAGS.root_helper) + list(cmd)
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -270,11 +291,12 @@ def execute(*cmd, **kwargs):
                              'You should use the rootwrap_config option '
                              'instead.'))
 
-        if (FLAGS.rootwrap_config is not None):
-            cmd = ['sudo', 'vsm-rootwrap',
-                   FLAGS.rootwrap_config] + list(cmd)
-        else:
-            cmd = shlex.split(FLAGS.root_helper) + list(cmd)
+        use_daemon = FLAGS.use_rootwrap_daemon and \
+            FLAGS.rootwrap_config is not None and not shell
+        if not use_daemon:
+            cmd = root_command(*cmd)
+    else:
+        use_daemon = False
     cmd = map(str, cmd) # pylint: disable=W0141
 
     while attempts > 0:
@@ -286,21 +308,26 @@ def execute(*cmd, **kwargs):
             if cmd_str.find('erasure-code-profile') != -1:
                 cmd = shlex.split(cmd_str)
 
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=True,
-                                   preexec_fn=_subprocess_setup,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_daemon:
+                _returncode, stdout, stderr = \
+                    rootwrap_daemon().execute(cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=True,
+                                       preexec_fn=_subprocess_setup,
+                                       shell=shell)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             if _returncode:
                 LOG.debug(_('Result was %s') % _returncode)
                 if not ignore_exit_code and _returncode not in check_exit_code:
@@ -457,23 +484,176 @@ class SSHPool(pools.Pool):
         """
         Return an item from the pool, when one is available.  This may
         cause the calling greenthread to block. Check if a connection is active
-        before returning it. For dead connections create and return a new
-        connection.
+        before returning it. For dead or idle connections create and return a
+        new connection.
         """
-        if self.free_items:
+        self.evict_idle()
+        while self.free_items:
             conn = self.free_items.popleft()
+            transport = conn and conn.get_transport()
+            if transport and transport.is_active():
+                return conn
+            self.current_size -= 1
             if conn:
-                if conn.get_transport().is_active():
-                    return conn
-                else:
-                    conn.close()
-            return self.create()
+                conn.close()
         if self.current_size < self.max_size:
             created = self.create()
             self.current_size += 1
             return created
         return self.channel.get()
 
+    def put(self, item):
+        item.last_used = time.time()
+        super(SSHPool, self).put(item)
+
+    def evict_idle(self, idle_timeout=None):
+        """Close the free connections unused for idle_timeout seconds."""
+        if idle_timeout is None:
+            idle_timeout = FLAGS.ssh_pool_idle_timeout
+        now = time.time()
+        for conn in list(self.free_items):
+            if now - getattr(conn, 'last_used', now) > idle_timeout:
+                self.free_items.remove(conn)
+                self.current_size -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+_SSH_POOLS = {}
+_SSH_POOLS_LOCK = threading.Lock()
+
+def get_ssh_pool(ip, login, privatekey=None, password=None, port=22):
+    """Return the ssh pool of the process for this host and login.
+
+    Sessions are created on demand, up to ssh_pool_max_per_host, kept
+    alive and reused by every caller; get() blocks when all of them are
+    busy. Use it as:
+
+        with utils.get_ssh_pool(ip, 'root', key_file).item() as ssh:
+            utils.ssh_execute(ssh, cmd)
+    """
+    key = (ip, port, login, privatekey, password)
+    with _SSH_POOLS_LOCK:
+        pool = _SSH_POOLS.get(key)
+        if pool is None:
+            pool = SSHPool(ip=ip,
+                           port=port,
+                           login=login,
+                           password=password,
+                           privatekey=privatekey,
+                           conn_timeout=FLAGS.ssh_keepalive_interval,
+                           min_size=0,
+                           max_size=max(1, FLAGS.ssh_pool_max_per_host))
+            _SSH_POOLS[key] = pool
+        pools = _SSH_POOLS.values()
+    for other in pools:
+        if other is not pool:
+            other.evict_idle()
+    return pool
+
+_SSH_HOST_SEMAPHORES = {}
+# (user, host, run_as_root) -> [lock, time of the last use of the master]
+_SSH_MASTERS = {}
+_SSH_CONTROL_DIRS = set()
+
+def _ssh_control_dir(run_as_root):
+    """Create the directory of the ssh control sockets, mode 0700.
+
+    A socket anyone could create first in its place would get the remote
+    commands and answer them, so the directory belongs to the user
+    running ssh only.
+    """
+    path = os.path.dirname(FLAGS.ssh_control_path)
+    if (path, run_as_root) in _SSH_CONTROL_DIRS:
+        return
+    execute('mkdir', '-p', '-m', '0700', path, run_as_root=run_as_root)
+    # mkdir does not change an existing directory.
+    if run_as_root:
+        execute('chown', 'root:root', path, run_as_root=True)
+    execute('chmod', '0700', path, run_as_root=run_as_root)
+    _SSH_CONTROL_DIRS.add((path, run_as_root))
+
+def _ssh_master(user, host, run_as_root):
+    """Open the master connection to host unless it is known to be up.
+
+    The master is started on its own with `ssh -MNf` and its output sent
+    to /dev/null: a master forked by a command through ControlPersist
+    keeps the stderr pipe of that command, and execute() would wait for
+    the master to exit before returning.
+    """
+    with _SSH_POOLS_LOCK:
+        master = _SSH_MASTERS.get((user, host, run_as_root))
+        if master is None:
+            master = [semaphore.Semaphore(), None]
+            _SSH_MASTERS[(user, host, run_as_root)] = master
+    with master[0]:
+        _ssh_control_dir(run_as_root)
+        now = time.time()
+        # The master exits ssh_pool_idle_timeout secs after its last use.
+        if master[1] is not None and \
+                now - master[1] < FLAGS.ssh_pool_idle_timeout - \
+                FLAGS.ssh_keepalive_interval:
+            master[1] = now
+            return
+        target = '%s@%s' % (user, host)
+        control_path = 'ControlPath=%s' % FLAGS.ssh_control_path
+        _out, err = execute('ssh', '-O', 'check', '-o', control_path, target,
+                            check_exit_code=[0, 255], run_as_root=run_as_root)
+        if 'Master running' not in (err or ''):
+            cmd = ['ssh', '-M', '-N', '-f',
+                   '-o', control_path,
+                   '-o', 'ControlPersist=%d' % FLAGS.ssh_pool_idle_timeout,
+                   '-o', 'ServerAliveInterval=%d' % FLAGS.ssh_keepalive_interval,
+                   target]
+            # Not through the rootwrap daemon either, it reads the outputs
+            # of a command until EOF too.
+            if run_as_root:
+                cmd = root_command(*cmd)
+            with open(os.devnull, 'r+') as devnull:
+                returncode = subprocess.Popen(map(str, cmd),
+                                              stdin=devnull,
+                                              stdout=devnull,
+                                              stderr=devnull,
+                                              close_fds=True).wait()
+            if returncode:
+                LOG.warn('Failed to open the ssh master connection to %s, '
+                         'the commands connect on their own.' % target)
+                master[1] = None
+                return
+        master[1] = now
+
+def ssh_cli_execute(host, *cmd, **kwargs):
+    """Run cmd on host with the ssh CLI, as `ssh root@host cmd`.
+
+    The commands sent to a host share one master connection, kept open
+    ssh_pool_idle_timeout seconds after the last use, and at most
+    ssh_pool_max_per_host of them run at the same time.
+
+    :param user: remote user, root by default.
+    :param ssh_opts: extra options passed to ssh, e.g. ['-t'].
+    Other kwargs are passed to execute().
+    """
+    user = kwargs.pop('user', 'root')
+    ssh_opts = kwargs.pop('ssh_opts', [])
+    with _SSH_POOLS_LOCK:
+        sem = _SSH_HOST_SEMAPHORES.get(host)
+        if sem is None:
+            sem = semaphore.Semaphore(max(1, FLAGS.ssh_pool_max_per_host))
+            _SSH_HOST_SEMAPHORES[host] = sem
+    _ssh_master(user, host, kwargs.get('run_as_root', False))
+    # ControlMaster=no: a command never becomes a master itself, it uses
+    # the master if there is one and connects on its own otherwise.
+    ssh_cmd = ['ssh',
+               '-o', 'ControlMaster=no',
+               '-o', 'ControlPath=%s' % FLAGS.ssh_control_path,
+               '-o', 'ServerAliveInterval=%d' % FLAGS.ssh_keepalive_interval]
+    ssh_cmd.extend(ssh_opts)
+    ssh_cmd.append('%s@%s' % (user, host))
+    ssh_cmd.extend(cmd)
+    with sem:
+        return execute(*ssh_cmd, **kwargs)
+
 class SSHClient():
     """
     ssh client methods for ssh key pair authentication
@@ -485,17 +665,18 @@ class SSHClient():
         self.pfile = key_file
         self.timeout = timeout
 
+    def _get_pool(self):
+        return get_ssh_pool(self.host, self.login, privatekey=self.pfile)
+
     def _get_conn(self):
-        ssh = SSHPool(ip=self.host,
-                      port=22,
-                      login=self.login,
-                      conn_timeout=self.timeout,
-                      privatekey=self.pfile)
-        if ssh:
-            try:
-                return ssh.get()
-            except paramiko.SSHException:
-                return None
+        """Return a pooled connection, give it back with _put_conn()."""
+        try:
+            return self._get_pool().get()
+        except paramiko.SSHException:
+            return None
+
+    def _put_conn(self, conn):
+        self._get_pool().put(conn)
 
     @staticmethod
     def make_remote_dirs(sftp, remote):
@@ -527,10 +708,17 @@ class SSHClient():
         Check ssh connection to hosts.
         """
         for x in range(retries):
-            if self._get_conn():
+            conn = self._get_conn()
+            if conn:
+                self._put_conn(conn)
                 return True
         return False
 
+    def execute(self, cmd, check_exit_code=True):
+        """Run cmd on the host over a pooled session."""
+        with self._get_pool().item() as conn:
+            return ssh_execute(conn, cmd, check_exit_code=check_exit_code)
+
     def ssh_copy(self, local_path, remote_path):
         if not local_path or not remote_path:
             return False
@@ -541,10 +729,13 @@ class SSHClient():
 
         client = self._get_conn()
         if client:
-            sftp = client.open_sftp()
-            SSHClient.make_remote_dirs(sftp, remote_path)
-            sftp.put(local_path, remote_path)
-            sftp.close()
+            try:
+                sftp = client.open_sftp()
+                SSHClient.make_remote_dirs(sftp, remote_path)
+                sftp.put(local_path, remote_path)
+                sftp.close()
+            finally:
+                self._put_conn(client)
             return True
 
         return False
@@ -559,16 +750,19 @@ class SSHClient():
 
         client = self._get_conn()
         if client:
-            sftp = client.open_sftp()
-            SSHClient.make_remote_dirs(sftp, remote_path)
-            files = os.listdir(local_path)
-            #files = sftp.listdir(remote_path)
-            for f in files :
-                local_file_path = os.path.join(local_path,f)
-                if os.path.isfile(local_file_path) :
-                    LOG.info('Start put file=%s' % local_file_path)
-                    sftp.put(local_file_path,os.path.join(remote_path,f))
-            sftp.close()
+            try:
+                sftp = client.open_sftp()
+                SSHClient.make_remote_dirs(sftp, remote_path)
+                files = os.listdir(local_path)
+                #files = sftp.listdir(remote_path)
+                for f in files :
+                    local_file_path = os.path.join(local_path,f)
+                    if os.path.isfile(local_file_path) :
+                        LOG.info('Start put file=%s' % local_file_path)
+                        sftp.put(local_file_path,os.path.join(remote_path,f))
+                sftp.close()
+            finally:
+                self._put_conn(client)
             return True
 
         return False
@@ -582,23 +776,21 @@ def get_sshConn(serverIp, user, key_file):
     return ssh
 
 def sftp_copy(serverIp, user, key_file, local_path, remote_path):
-    scp = paramiko.Transport(serverIp, 22)
-    pkfile = os.path.expanduser(key_file)
-    privatekey = paramiko.RSAKey.from_private_key_file(pkfile)
-    scp.connect(username=user,password=None, pkey=privatekey)
-    sftp=paramiko.SFTPClient.from_transport(scp)
-    if os.path.isfile(local_path) :
-        LOG.info('Start put file=%s' % local_path)
-        sftp.put(local_path, remote_path)
-    else :
-        files = os.listdir(local_path)
-        #files = sftp.listdir(remote_path)
-        for f in files :
-            local_file_path = os.path.join(local_path,f)
-            if os.path.isfile(local_file_path) :
-                LOG.info('Start put file=%s' % local_file_path)
-                sftp.put(local_file_path,os.path.join(remote_path,f))
-    sftp.close()
+    pool = get_ssh_pool(serverIp, user, privatekey=key_file)
+    with pool.item() as ssh:
+        sftp = ssh.open_sftp()
+        if os.path.isfile(local_path) :
+            LOG.info('Start put file=%s' % local_path)
+            sftp.put(local_path, remote_path)
+        else :
+            files = os.listdir(local_path)
+            #files = sftp.listdir(remote_path)
+            for f in files :
+                local_file_path = os.path.join(local_path,f)
+                if os.path.isfile(local_file_path) :
+                    LOG.info('Start put file=%s' % local_file_path)
+                    sftp.put(local_file_path,os.path.join(remote_path,f))
+        sftp.close()
 
 def vsmdir():
     import vsm
@@ -865,6 +1057,38 @@ class LoopingCall(object):
     def wait(self):
         return self.done.wait()
 
+def wait_for(check, timeout=None, interval=0.5, max_interval=10,
+             backoff=2, name=None):
+    """Call check() until it returns a true value.
+
+    The delay between two calls starts at interval and grows by backoff
+    up to max_interval. Waiting stops once timeout seconds are elapsed,
+    timeout None waits forever.
+
+    :returns: the last value returned by check(), false on timeout.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+    tries = 0
+    while True:
+        tries += 1
+        ret = check()
+        if ret:
+            return ret
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            LOG.warn(_('Gave up waiting for %(name)s after %(tries)s tries '
+                       'in %(timeout)ss') %
+                     {'name': name or check, 'tries': tries,
+                      'timeout': timeout})
+            return ret
+        delay = interval
+        if deadline is not None:
+            delay = min(delay, deadline - now)
+        time.sleep(delay)
+        interval = min(interval * backoff, max_interval)
+
 class ProtectedExpatParser(expatreader.ExpatParser):
     """An expat parser which disables DTD's and entities by default."""
 